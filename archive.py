@@ -0,0 +1,160 @@
+"""On-disk archive for expired and inactive rooms.
+
+Each archived room gets a directory of gzip-compressed, append-only segment
+files holding one encoded message per line, in sequence order. Archiving a
+room again (after it was restored and used) only writes the messages past
+the last archived sequence number into new segments; existing segments are
+never rewritten. A single ``index.json`` maps room names to their state,
+metadata and segment list and is replaced atomically on every change.
+"""
+import gzip
+import hashlib
+import os
+import shutil
+import threading
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from serialization import RawJSON, dumps_bytes, loads
+
+ARCHIVED = 'archived'
+RESTORED = 'restored'
+
+
+class RoomArchive:
+
+    def __init__(self, root: str, segment_size: int = 1000):
+        self.root = root
+        self.segment_size = max(segment_size, 1)
+        self._index_path = os.path.join(root, 'index.json')
+        self._index: Dict[str, dict] | None = None
+        self._codes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, dict]:
+        if self._index is None:
+            try:
+                with open(self._index_path, 'rb') as handle:
+                    self._index = loads(handle.read())
+            except FileNotFoundError:
+                self._index = {}
+            self._codes = {
+                entry['meta']['code']: room
+                for room, entry in self._index.items()
+                if entry['state'] == ARCHIVED and entry['meta'].get('code')
+            }
+        return self._index
+
+    def _save(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        temp_path = self._index_path + '.tmp'
+        # json.dump streams through the pure-Python encoder; encoding in one
+        # call keeps rewriting a large index cheap
+        with open(temp_path, 'wb') as handle:
+            handle.write(dumps_bytes(self._index))
+        os.replace(temp_path, self._index_path)
+
+    def _room_dir(self, room: str) -> str:
+        return os.path.join(self.root, hashlib.sha1(room.encode('utf-8')).hexdigest()[:16])
+
+    def is_archived(self, room: str) -> bool:
+        with self._lock:
+            entry = self._load().get(room)
+            return bool(entry) and entry['state'] == ARCHIVED
+
+    def get(self, room: str) -> dict | None:
+        with self._lock:
+            return self._load().get(room)
+
+    def last_sequences(self) -> Dict[str, int]:
+        with self._lock:
+            return {room: entry['last_seq'] for room, entry in self._load().items()}
+
+    def room_for_code(self, code: str) -> str | None:
+        with self._lock:
+            self._load()
+            return self._codes.get(code)
+
+    def archive(self, room: str, meta: dict, messages: List[Tuple[int, str]],
+                last_seq: int, reason: str) -> int:
+        """Append the ``(seq, encoded)`` messages not yet on disk and mark
+        ``room`` archived; return the number of messages written."""
+        with self._lock:
+            index = self._load()
+            entry = index.get(room) or {'segments': [], 'last_seq': 0}
+            pending = [message for message in messages if message[0] > entry['last_seq']]
+
+            room_dir = self._room_dir(room)
+            os.makedirs(room_dir, exist_ok=True)
+            for start in range(0, len(pending), self.segment_size):
+                chunk = pending[start:start + self.segment_size]
+                name = f'{len(entry["segments"]) + 1:06d}.jsonl.gz'
+                with gzip.open(os.path.join(room_dir, name), 'wt',
+                               encoding='utf-8') as handle:
+                    handle.write(''.join(encoded + '\n' for _, encoded in chunk))
+                entry['segments'].append({
+                    'file': name,
+                    'first_seq': chunk[0][0],
+                    'last_seq': chunk[-1][0],
+                    'count': len(chunk)
+                })
+
+            entry.update(state=ARCHIVED,
+                         meta=meta,
+                         last_seq=max(last_seq, entry['last_seq']),
+                         reason=reason,
+                         archived_at=datetime.now().isoformat())
+            index[room] = entry
+            if meta.get('code'):
+                self._codes[meta['code']] = room
+            self._save()
+            return len(pending)
+
+    def read(self, room: str, before_seq: int | None = None,
+             limit: int = 50) -> List[RawJSON]:
+        """Newest ``limit`` archived messages older than ``before_seq``, in
+        sequence order."""
+        with self._lock:
+            entry = self._load().get(room)
+            segments = list(entry['segments']) if entry else []
+
+        collected: List[RawJSON] = []
+        room_dir = self._room_dir(room)
+        for segment in reversed(segments):
+            if len(collected) >= limit:
+                break
+            if before_seq is not None and segment['first_seq'] >= before_seq:
+                continue
+            with gzip.open(os.path.join(room_dir, segment['file']), 'rt',
+                           encoding='utf-8') as handle:
+                lines = handle.read().splitlines()
+            if before_seq is not None and segment['last_seq'] >= before_seq:
+                lines = [line for line in lines if loads(line)['seq'] < before_seq]
+            collected = [RawJSON(line) for line in lines[-(limit - len(collected)):]
+                         ] + collected
+        return collected
+
+    def restore(self, room: str, limit: int) -> Tuple[dict, List[RawJSON], int] | None:
+        """Mark an archived ``room`` restored and return its metadata, newest
+        ``limit`` messages and last sequence number.
+
+        Segments stay on disk and remain readable; the next archive of the
+        room only appends what was said after the restore.
+        """
+        with self._lock:
+            entry = self._load().get(room)
+            if not entry or entry['state'] != ARCHIVED:
+                return None
+            entry['state'] = RESTORED
+            self._codes.pop(entry['meta'].get('code'), None)
+            self._save()
+        return entry['meta'], self.read(room, limit=limit), entry['last_seq']
+
+    def delete(self, room: str) -> None:
+        with self._lock:
+            entry = self._load().pop(room, None)
+            if entry is None:
+                return
+            self._codes.pop(entry['meta'].get('code'), None)
+            self._save()
+        shutil.rmtree(self._room_dir(room), ignore_errors=True)
@@ -0,0 +1,220 @@
+"""Build-once static asset pipeline.
+
+``build_assets`` copies the files the templates load into ``static/dist``
+under content-hashed names (``chat.js`` -> ``chat.3f9a1c2b7d.js``), minified
+when ``rjsmin``/``rcssmin`` are installed, with ``.gz`` (and ``.br`` when
+``brotli`` is installed) siblings for text assets, and writes
+``manifest.json`` mapping each source name to its built name. Since a built
+name changes whenever its content does, the files can be cached forever.
+``url('/static/...')`` references inside stylesheets are rewritten to the
+built names too, so images are built before stylesheets.
+
+Files under ``static/`` keep being served as they are, so anything missing
+from the manifest (uploads, or every asset before the first build) still
+resolves through Flask's ``static`` route.
+
+The pinned Socket.IO client is committed under ``static/vendor`` and is
+checked against ``SOCKETIO_CLIENT_INTEGRITY`` both when it is vendored and
+when assets are built, and building fails without it. Building never
+touches the network; ``vendor_socketio_client`` is a separate, explicit
+step for upgrades.
+"""
+import base64
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import urllib.request
+from typing import Dict, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:  # pragma: no cover - optional dependency
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:  # pragma: no cover - optional dependency
+    rjsmin = None
+
+logger = logging.getLogger(__name__)
+
+DIST_DIRNAME = 'dist'
+MANIFEST_FILENAME = 'manifest.json'
+# Built files are served from here by the ``chat.asset`` route
+ASSET_URL_PREFIX = '/assets/'
+
+# Globs relative to static/, built in this order (stylesheets last)
+ASSET_SOURCES = ('chat.js', 'vendor/*.js', 'icons/*', 'stickers/*', '*.css')
+COMPRESSIBLE_EXTENSIONS = {'.js', '.css', '.svg', '.json', '.txt'}
+# Preferred first; the first one the client accepts is served
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+SOCKETIO_CLIENT_VERSION = '4.7.5'
+SOCKETIO_CLIENT_URL = 'https://cdn.socket.io/{version}/socket.io.min.js'
+SOCKETIO_CLIENT_PATH = 'vendor/socket.io.min.js'
+# Subresource Integrity digest published for the pinned build; the browser
+# checks the vendored copy against it too
+SOCKETIO_CLIENT_INTEGRITY = ('sha384-2huaZvOR9iDzHqslqwpR87isEmrfxqyWOF7hr7BY6KG0'
+                             '+hVKLoEXMPUJw3ynWuhO')
+
+_CSS_URL = re.compile(r"""url\((['"]?)/static/([^'")]+)\1\)""")
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+
+
+class AssetManifest:
+
+    def __init__(self, dist_dir: str, entries: Dict[str, str] | None = None):
+        self.dist_dir = dist_dir
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, dist_dir: str) -> 'AssetManifest':
+        try:
+            with open(os.path.join(dist_dir, MANIFEST_FILENAME), encoding='utf-8') as handle:
+                entries = json.load(handle)
+        except FileNotFoundError:
+            logger.info('No asset manifest in %s; serving unbuilt static files', dist_dir)
+            entries = {}
+        return cls(dist_dir, entries)
+
+    def get(self, filename: str) -> str | None:
+        """Built name of ``filename`` (relative to static/), if it was built."""
+        return self.entries.get(filename)
+
+
+def precompressed_variant(dist_dir: str, filename: str,
+                          accept_encodings) -> Tuple[str, str | None]:
+    """``(file to send, Content-Encoding)`` for a built asset, picking the
+    best precompressed sibling the client accepts."""
+    for encoding, suffix in ENCODINGS:
+        if accept_encodings[encoding] and os.path.isfile(
+                os.path.join(dist_dir, filename + suffix)):
+            return filename + suffix, encoding
+    return filename, None
+
+
+def integrity_digest(content: bytes, algorithm: str = 'sha384') -> str:
+    """Subresource Integrity value (``sha384-<base64>``) of ``content``."""
+    digest = hashlib.new(algorithm, content).digest()
+    return f'{algorithm}-{base64.b64encode(digest).decode("ascii")}'
+
+
+def _check_integrity(content: bytes, expected: str, source: str) -> None:
+    algorithm = expected.split('-', 1)[0]
+    actual = integrity_digest(content, algorithm)
+    if actual != expected:
+        raise ValueError(f'{source} does not match the pinned integrity digest '
+                         f'(expected {expected}, got {actual})')
+
+
+def vendor_socketio_client(static_dir: str,
+                           version: str = SOCKETIO_CLIENT_VERSION,
+                           integrity: str = SOCKETIO_CLIENT_INTEGRITY) -> str:
+    """Download the pinned Socket.IO client into ``static/vendor``, refusing
+    it unless it matches ``integrity``. Returns the path written."""
+    url = SOCKETIO_CLIENT_URL.format(version=version)
+    with urllib.request.urlopen(url, timeout=30) as response:
+        content = response.read()
+    _check_integrity(content, integrity, url)
+    path = os.path.join(static_dir, SOCKETIO_CLIENT_PATH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as handle:
+        handle.write(content)
+    return path
+
+
+def verify_socketio_client(static_dir: str,
+                           integrity: str = SOCKETIO_CLIENT_INTEGRITY) -> bool:
+    """Check the vendored client against ``integrity``. Returns False when
+    no copy is vendored; raises ValueError when the copy does not match."""
+    path = os.path.join(static_dir, SOCKETIO_CLIENT_PATH)
+    try:
+        with open(path, 'rb') as handle:
+            content = handle.read()
+    except FileNotFoundError:
+        return False
+    _check_integrity(content, integrity, path)
+    return True
+
+
+def _minify(filename: str, content: bytes) -> bytes:
+    if filename.endswith('.min.js'):
+        return content
+    if filename.endswith('.js') and rjsmin is not None:
+        return rjsmin.jsmin(content.decode('utf-8')).encode('utf-8')
+    if filename.endswith('.css'):
+        text = content.decode('utf-8')
+        if rcssmin is not None:
+            return rcssmin.cssmin(text).encode('utf-8')
+        # Conservative fallback: drop comments, indentation and blank lines
+        lines = (line.strip() for line in _CSS_COMMENT.sub('', text).splitlines())
+        return '\n'.join(line for line in lines if line).encode('utf-8')
+    return content
+
+
+def _rewrite_css_urls(content: bytes, manifest: Dict[str, str]) -> bytes:
+
+    def replace(match: re.Match) -> str:
+        built = manifest.get(match.group(2))
+        if built is None:
+            return match.group(0)
+        return f'url({match.group(1)}{ASSET_URL_PREFIX}{built}{match.group(1)})'
+
+    return _CSS_URL.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def _fingerprint(filename: str, content: bytes) -> str:
+    stem, extension = os.path.splitext(filename)
+    if stem.endswith('.min'):
+        stem, extension = stem[:-4], '.min' + extension
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    return f'{stem}.{digest}{extension}'
+
+
+def build_assets(static_dir: str) -> Dict[str, str]:
+    """Rebuild ``static/dist`` and its manifest; return the manifest."""
+    if not verify_socketio_client(static_dir):
+        raise FileNotFoundError(
+            f'No vendored Socket.IO client at {os.path.join(static_dir, SOCKETIO_CLIENT_PATH)}; '
+            'run `flask --app main vendor-socketio` and commit it')
+    dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+    shutil.rmtree(dist_dir, ignore_errors=True)
+
+    manifest: Dict[str, str] = {}
+    for pattern in ASSET_SOURCES:
+        for path in sorted(glob.glob(os.path.join(static_dir, pattern))):
+            if not os.path.isfile(path):
+                continue
+            filename = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            with open(path, 'rb') as handle:
+                content = _minify(filename, handle.read())
+            if filename.endswith('.css'):
+                content = _rewrite_css_urls(content, manifest)
+
+            built = _fingerprint(filename, content)
+            target = os.path.join(dist_dir, built)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as handle:
+                handle.write(content)
+            if os.path.splitext(filename)[1] in COMPRESSIBLE_EXTENSIONS:
+                with open(target + '.gz', 'wb') as handle:
+                    handle.write(gzip.compress(content, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as handle:
+                        handle.write(brotli.compress(content, quality=11))
+            manifest[filename] = built
+
+    os.makedirs(dist_dir, exist_ok=True)
+    with open(os.path.join(dist_dir, MANIFEST_FILENAME), 'w', encoding='utf-8') as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    return manifest
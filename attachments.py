@@ -0,0 +1,282 @@
+"""Chunked, resumable attachment uploads with content-addressed storage.
+
+An upload is opened with its file name, type and size, and its bytes are
+then sent in order as ``Content-Range`` chunks. Each chunk is streamed from
+the request into ``<root>/partial/<upload id>`` one small block at a time, so
+a worker never holds more than a block of any file in memory. The partial
+file is the only record of progress: after a dropped connection (or a
+restart) the client asks how many bytes arrived and carries on from there.
+
+Completing an upload hashes the file and moves it to
+``<root>/blobs/<aa>/<sha256>``. When a blob with the same content already
+exists the new copy is dropped, so repeated uploads of one file share a
+single blob. Hashing and image thumbnails run on a small pool of native
+threads; thumbnails need Pillow and are skipped without it.
+
+Attachments that no message references are deleted once they are older
+than the upload TTL, together with their blob and thumbnail when no other
+attachment shares the content.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import exists
+
+from models import Attachment, AttachmentUpload, Message, db
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+try:
+    from gevent.monkey import is_module_patched
+    from gevent.threadpool import ThreadPool as GeventThreadPool
+except ImportError:  # pragma: no cover - gevent is optional outside gunicorn
+    GeventThreadPool = None
+
+    def is_module_patched(module_name: str) -> bool:
+        return False
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024
+# Served inline and thumbnailed; everything else downloads as a file
+IMAGE_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
+_CONTENT_TYPE = re.compile(r'^[\w.+-]+/[\w.+-]+$')
+
+
+class UploadLimitExceeded(ValueError):
+    """The user already has too many uploads, or too many bytes, open."""
+
+
+class UploadOffsetMismatch(ValueError):
+    """The chunk does not start where the upload left off."""
+
+    def __init__(self, received: int):
+        super().__init__(f'Upload has {received} bytes')
+        self.received = received
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(BLOCK_SIZE * 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _make_thumbnail(source: str, target: str, size: int) -> None:
+    try:
+        with Image.open(source) as image:
+            image.thumbnail((size, size))
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            image.save(target + '.tmp', 'JPEG', quality=80)
+        os.replace(target + '.tmp', target)
+    except Exception:
+        logger.exception('Failed to make a thumbnail of %s', source)
+
+
+class AttachmentStore:
+
+    def __init__(self, root: str, max_size: int, max_chunk: int,
+                 thumbnail_size: int = 320, workers: int = 2,
+                 max_open_uploads: int | None = None,
+                 max_pending_bytes: int | None = None):
+        self.root = root
+        self.max_size = max_size
+        self.max_chunk = max_chunk
+        # Per user, across uploads that have been opened but not completed
+        self.max_open_uploads = max_open_uploads
+        self.max_pending_bytes = max_pending_bytes
+        self.thumbnail_size = thumbnail_size
+        self._writing: set[str] = set()
+        self._lock = threading.Lock()
+        workers = max(workers, 1)
+        if GeventThreadPool is not None and is_module_patched('threading'):
+            self._pool = GeventThreadPool(workers)
+            self._call = self._pool.apply
+            self._spawn = lambda func, args: self._pool.spawn(func, *args)
+        else:
+            self._pool = ThreadPoolExecutor(workers, thread_name_prefix='attachments')
+            self._call = lambda func, args: self._pool.submit(func, *args).result()
+            self._spawn = lambda func, args: self._pool.submit(func, *args)
+
+    def _partial_path(self, upload: AttachmentUpload) -> str:
+        return os.path.join(self.root, 'partial', upload.id)
+
+    def blob_path(self, attachment: Attachment) -> str:
+        return os.path.join(self.root, 'blobs', attachment.sha256[:2], attachment.sha256)
+
+    def thumbnail_path(self, attachment: Attachment) -> str | None:
+        """Path of the attachment's thumbnail once it has been made."""
+        path = os.path.join(self.root, 'thumbnails', attachment.sha256[:2],
+                            attachment.sha256 + '.jpg')
+        return path if os.path.isfile(path) else None
+
+    def begin(self, user_id: int, filename: str, content_type: str | None,
+              size: int) -> AttachmentUpload:
+        filename = os.path.basename(filename.replace('\\', '/')).strip()[:255]
+        if not filename:
+            raise ValueError('A file name is required.')
+        if not 0 < size <= self.max_size:
+            raise ValueError(f'Attachments must be between 1 byte and {self.max_size} bytes.')
+        content_type = (content_type or '').strip().lower()
+        if not _CONTENT_TYPE.match(content_type):
+            content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        open_uploads, pending_bytes = db.session.query(
+            db.func.count(AttachmentUpload.id),
+            db.func.coalesce(db.func.sum(AttachmentUpload.size), 0)).filter(
+                AttachmentUpload.user_id == user_id).one()
+        if self.max_open_uploads is not None and open_uploads >= self.max_open_uploads:
+            raise UploadLimitExceeded('Too many uploads in progress; finish or wait for '
+                                      'one to expire first.')
+        if self.max_pending_bytes is not None and pending_bytes + size > self.max_pending_bytes:
+            raise UploadLimitExceeded('Uploads in progress would exceed '
+                                      f'{self.max_pending_bytes} bytes.')
+
+        upload = AttachmentUpload(id=uuid.uuid4().hex,
+                                  user_id=user_id,
+                                  filename=filename,
+                                  content_type=content_type,
+                                  size=size)
+        db.session.add(upload)
+        db.session.commit()
+        os.makedirs(os.path.dirname(self._partial_path(upload)), exist_ok=True)
+        open(self._partial_path(upload), 'wb').close()
+        return upload
+
+    def received(self, upload: AttachmentUpload) -> int:
+        try:
+            return os.path.getsize(self._partial_path(upload))
+        except FileNotFoundError:
+            return 0
+
+    def write_chunk(self, upload: AttachmentUpload, start: int, length: int, stream) -> int:
+        """Append ``length`` bytes read from ``stream`` at offset ``start``;
+        return the bytes received so far, which is short of ``start +
+        length`` if the client went away mid-chunk."""
+        if length > self.max_chunk:
+            raise ValueError(f'Chunks may be at most {self.max_chunk} bytes.')
+        if start + length > upload.size:
+            raise ValueError('Chunk runs past the end of the upload.')
+        with self._lock:
+            if upload.id in self._writing:
+                # Another request is appending; the client re-syncs its offset
+                raise UploadOffsetMismatch(self.received(upload))
+            self._writing.add(upload.id)
+        try:
+            received = self.received(upload)
+            if start != received:
+                raise UploadOffsetMismatch(received)
+            with open(self._partial_path(upload), 'ab') as handle:
+                remaining = length
+                while remaining:
+                    block = stream.read(min(BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    handle.write(block)
+                    remaining -= len(block)
+            return self.received(upload)
+        finally:
+            with self._lock:
+                self._writing.discard(upload.id)
+
+    def complete(self, upload: AttachmentUpload) -> Attachment | None:
+        """Store the finished upload as an attachment. Returns None when the
+        upload no longer exists, e.g. a concurrent request completed it."""
+        with self._lock:
+            if upload.id in self._writing:
+                # A chunk (or another complete) for this upload is in flight
+                raise UploadOffsetMismatch(self.received(upload))
+            self._writing.add(upload.id)
+        try:
+            if not AttachmentUpload.query.filter_by(id=upload.id).count():
+                return None
+            return self._complete(upload)
+        finally:
+            with self._lock:
+                self._writing.discard(upload.id)
+
+    def _complete(self, upload: AttachmentUpload) -> Attachment:
+        received = self.received(upload)
+        if received != upload.size:
+            raise UploadOffsetMismatch(received)
+
+        partial = self._partial_path(upload)
+        digest = self._call(_hash_file, (partial, ))
+        attachment = Attachment(sha256=digest,
+                                size=upload.size,
+                                filename=upload.filename,
+                                content_type=upload.content_type,
+                                uploader_id=upload.user_id)
+        blob = self.blob_path(attachment)
+        if os.path.exists(blob):
+            os.remove(partial)
+            # A fresh mtime keeps prune_attachments from collecting the blob
+            # before this attachment row is committed
+            os.utime(blob)
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(partial, blob)
+
+        db.session.add(attachment)
+        db.session.delete(upload)
+        db.session.commit()
+
+        if (Image is not None and attachment.content_type in IMAGE_TYPES and
+                self.thumbnail_path(attachment) is None):
+            target = os.path.join(self.root, 'thumbnails', digest[:2], digest + '.jpg')
+            self._spawn(_make_thumbnail, (blob, target, self.thumbnail_size))
+        return attachment
+
+    def prune_uploads(self, max_age: timedelta) -> int:
+        """Drop uploads that were not completed within ``max_age``."""
+        stale = AttachmentUpload.query.filter(
+            AttachmentUpload.created_at < datetime.utcnow() - max_age).all()
+        for upload in stale:
+            try:
+                os.remove(self._partial_path(upload))
+            except FileNotFoundError:
+                pass
+            db.session.delete(upload)
+        db.session.commit()
+        return len(stale)
+
+    def prune_attachments(self, max_age: timedelta) -> int:
+        """Delete attachments older than ``max_age`` that no message
+        references, with any blobs and thumbnails no longer in use."""
+        cutoff = datetime.utcnow() - max_age
+        orphans = Attachment.query.filter(
+            Attachment.created_at < cutoff,
+            ~exists().where(Message.attachment_id == Attachment.id)).all()
+        if not orphans:
+            return 0
+        digests = {attachment.sha256 for attachment in orphans}
+        for attachment in orphans:
+            db.session.delete(attachment)
+        db.session.commit()
+
+        in_use = {digest for (digest, ) in db.session.query(Attachment.sha256).filter(
+            Attachment.sha256.in_(digests))}
+        expires_before = time.time() - max_age.total_seconds()
+        for digest in digests - in_use:
+            for path in (os.path.join(self.root, 'blobs', digest[:2], digest),
+                         os.path.join(self.root, 'thumbnails', digest[:2], digest + '.jpg')):
+                try:
+                    if os.path.getmtime(path) < expires_before:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return len(orphans)
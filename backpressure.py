@@ -0,0 +1,194 @@
+"""Outbound queue limits for slow Socket.IO consumers.
+
+Engine.IO keeps one outbound packet queue per connection. A client that stops
+reading lets that queue grow without bound, so ``BackpressureManager`` checks
+the recipient's queue depth before every packet is queued and applies a
+policy once the depth passes a soft limit:
+
+``drop_presence``
+    Presence events are not queued for the backlogged socket. It gets the
+    latest snapshot once the queue drains, which supersedes the updates it
+    missed.
+``snapshot``
+    Every event is dropped while backlogged. Once the queue drains the client
+    receives a single ``resync`` event and reloads its state.
+``disconnect``
+    The socket is disconnected.
+
+Sockets past the hard limit are disconnected whatever the policy is.
+Ephemeral events such as typing indicators are worthless once late, so they
+are dropped from ``ephemeral_limit`` on, before any other event, and never
+trigger a catch-up.
+"""
+import logging
+from typing import Callable, Dict, Iterable
+
+from engineio import packet as eio_packet
+from socketio import Manager, packet
+
+logger = logging.getLogger(__name__)
+
+BACKPRESSURE_POLICIES = {'drop_presence', 'snapshot', 'disconnect'}
+
+
+class BackpressureManager(Manager):
+
+    def __init__(self,
+                 policy: str = 'drop_presence',
+                 soft_limit: int = 200,
+                 hard_limit: int = 1000,
+                 presence_events: Iterable[str] = ('active_users', ),
+                 ephemeral_events: Iterable[str] = ('typing', ),
+                 ephemeral_limit: int | None = None):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f'Invalid backpressure policy: {policy}')
+        super().__init__()
+        self.policy = policy
+        self.soft_limit = soft_limit
+        self.hard_limit = max(hard_limit, soft_limit)
+        self.presence_events = set(presence_events)
+        self.ephemeral_events = set(ephemeral_events)
+        self.ephemeral_limit = (soft_limit // 4 if ephemeral_limit is None else
+                                min(ephemeral_limit, soft_limit))
+        self.presence_snapshot: Callable[[], tuple[str, object]] | None = None
+        # sid -> True once a socket skipped events and needs catching up
+        self._stale: Dict[str, bool] = {}
+        self._disconnecting: set[str] = set()
+        self.dropped_packets = 0
+        self.slow_disconnects = 0
+
+    def emit(self, event, data, namespace, room=None, skip_sid=None,
+             callback=None, to=None, **kwargs):
+        if callback:
+            return super().emit(event, data, namespace, room=room,
+                                skip_sid=skip_sid, callback=callback, to=to,
+                                **kwargs)
+
+        room = to or room
+        if namespace not in self.rooms:
+            return
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        pkt = self.server.packet_class(packet.EVENT,
+                                       namespace=namespace,
+                                       data=[event] + data)
+        encoded_packet = pkt.encode()
+        if not isinstance(encoded_packet, list):
+            encoded_packet = [encoded_packet]
+        eio_pkt = [
+            eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded_packet
+        ]
+        is_presence = event in self.presence_events
+        is_ephemeral = event in self.ephemeral_events
+        for sid, eio_sid in list(self.get_participants(namespace, room)):
+            if sid in skip_sid:
+                continue
+            if not self._admit(sid, eio_sid, namespace, is_presence, is_ephemeral):
+                self.dropped_packets += 1
+                continue
+            for p in eio_pkt:
+                self.server._send_eio_packet(eio_sid, p)
+
+    def disconnect(self, sid, namespace, **kwargs):
+        self._stale.pop(sid, None)
+        self._disconnecting.discard(sid)
+        return super().disconnect(sid, namespace, **kwargs)
+
+    def _queue_depth(self, eio_sid: str) -> int:
+        socket = self.server.eio.sockets.get(eio_sid)
+        if socket is None:
+            return 0
+        return socket.queue.qsize()
+
+    def _admit(self, sid: str, eio_sid: str, namespace: str,
+               is_presence: bool, is_ephemeral: bool = False) -> bool:
+        if sid in self._disconnecting:
+            return False
+
+        depth = self._queue_depth(eio_sid)
+        if depth >= self.hard_limit or (depth >= self.soft_limit
+                                        and self.policy == 'disconnect'):
+            self._disconnect_slow(sid, namespace, depth)
+            return False
+
+        if is_ephemeral and depth >= self.ephemeral_limit:
+            return False
+        if depth >= self.soft_limit:
+            if self.policy == 'snapshot' or is_presence:
+                self._stale[sid] = True
+                return False
+            return True
+
+        if self._stale.pop(sid, False):
+            self._catch_up(sid, eio_sid, namespace, is_presence)
+        return True
+
+    def _catch_up(self, sid: str, eio_sid: str, namespace: str,
+                  is_presence: bool) -> None:
+        if self.policy == 'snapshot':
+            self._send(eio_sid, namespace, 'resync', {'reason': 'backpressure'})
+        # A presence event is itself the snapshot the socket was missing.
+        elif not is_presence and self.presence_snapshot:
+            event, payload = self.presence_snapshot()
+            self._send(eio_sid, namespace, event, payload)
+
+    def _send(self, eio_sid: str, namespace: str, event: str, payload) -> None:
+        self.server._send_packet(
+            eio_sid,
+            self.server.packet_class(packet.EVENT,
+                                     namespace=namespace,
+                                     data=[event, payload]))
+
+    def _disconnect_slow(self, sid: str, namespace: str, depth: int) -> None:
+        self._disconnecting.add(sid)
+        self.slow_disconnects += 1
+        logger.warning('Disconnecting slow consumer %s (%d queued packets)', sid,
+                       depth)
+        # Disconnect handlers emit presence updates, so run them outside the
+        # fan-out loop that is iterating room participants.
+        self.server.start_background_task(self.server.disconnect, sid,
+                                           namespace=namespace)
+
+    def queue_stats(self) -> Dict[str, dict]:
+        """Queued packets and bytes per connected sid."""
+        stats: Dict[str, dict] = {}
+        for sid, eio_sid in list(self.get_participants('/', None)):
+            socket = self.server.eio.sockets.get(eio_sid)
+            if socket is None:
+                continue
+            try:
+                pending = list(socket.queue.queue)
+            except (AttributeError, RuntimeError):
+                pending = []
+            stats[sid] = {
+                'packets': len(pending),
+                'bytes': sum(_packet_size(p) for p in pending),
+                'stale': sid in self._stale
+            }
+        return stats
+
+    def queue_summary(self) -> Dict[str, int]:
+        """Queue totals across sids, safe to publish without naming clients."""
+        sizes = [stats['bytes'] for stats in self.queue_stats().values()
+                 if stats['packets']]
+        return {
+            'bytes': sum(sizes),
+            'max_bytes': max(sizes, default=0),
+            'backlogged': len(sizes)
+        }
+
+
+def _packet_size(pkt) -> int:
+    data = getattr(pkt, 'data', None)
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    if isinstance(data, str):
+        return len(data.encode('utf-8'))
+    return 0
@@ -0,0 +1,55 @@
+"""Coalesce bursts of room messages into ``message_batch`` frames.
+
+Every socket in a room receives the same room events, so buffering per room
+gives each recipient one frame per flush window instead of one frame per
+message.
+"""
+import threading
+from typing import Dict, List
+
+from serialization import RawJSON, dumps, join_frames
+
+
+class RoomBatcher:
+
+    def __init__(self, socketio, max_delay_ms: int = 25, max_size: int = 50):
+        self.socketio = socketio
+        self.max_delay = max(max_delay_ms, 0) / 1000
+        self.max_size = max(max_size, 1)
+        self._pending: Dict[str, List[RawJSON]] = {}
+        self._scheduled: set[str] = set()
+        self._lock = threading.Lock()
+
+    def enqueue(self, room: str, frame: RawJSON) -> None:
+        with self._lock:
+            pending = self._pending.setdefault(room, [])
+            pending.append(frame)
+            flush_now = len(pending) >= self.max_size
+            schedule = not flush_now and room not in self._scheduled
+            if schedule:
+                self._scheduled.add(room)
+
+        if flush_now:
+            self.flush(room)
+        elif schedule:
+            self.socketio.start_background_task(self._flush_later, room)
+
+    def _flush_later(self, room: str) -> None:
+        self.socketio.sleep(self.max_delay)
+        with self._lock:
+            self._scheduled.discard(room)
+        self.flush(room)
+
+    def flush(self, room: str) -> None:
+        with self._lock:
+            frames = self._pending.pop(room, None)
+        if not frames:
+            return
+
+        encoded = ('{"room":' + dumps(room) + ',"messages":' +
+                   join_frames(frames) + '}')
+        self.socketio.emit('message_batch', RawJSON(encoded), to=room)
+
+    def discard(self, room: str) -> None:
+        with self._lock:
+            self._pending.pop(room, None)
@@ -0,0 +1,186 @@
+"""Microbenchmarks for the hot functions in main.py.
+
+Runs against a database produced by ``seed_data.py``. The database is
+generated on first use and reused afterwards unless ``--regenerate`` is
+given. Each case is timed in-process and reported as median / p95 in
+milliseconds::
+
+    python benchmarks/bench_hot_paths.py --db /tmp/bench.db
+    python benchmarks/bench_hot_paths.py --db /tmp/small.db --users 2000 \\
+        --messages 200000 --only list_private_chats
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from seed_data import create_schema, generate  # noqa: E402
+
+
+def timed_runs(func: Callable[[], object],
+               repeat: int,
+               setup: Callable[[], object] | None = None) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def build_cases(main, app, args) -> dict[str, tuple]:
+    from flask_login import login_user
+    from sqlalchemy import text
+
+    from models import ConversationParticipant, Message, User, db
+
+    rng = random.Random(args.seed)
+
+    busiest = db.session.query(Message.conversation_id).group_by(
+        Message.conversation_id).order_by(db.func.count(Message.id).desc()).first()[0]
+    reader_id = db.session.query(ConversationParticipant.user_id).filter_by(
+        conversation_id=busiest).first()[0]
+    reader = db.session.get(User, reader_id)
+    partner_id = db.session.query(ConversationParticipant.user_id).filter(
+        ConversationParticipant.conversation_id == busiest,
+        ConversationParticipant.user_id != reader_id).first()[0]
+    pending_recipient = db.session.get(
+        User,
+        db.session.query(Message.recipient_id).filter(
+            Message.delivered_at.is_(None)).first()[0])
+
+    def in_request(path: str, func: Callable[[], object], user=None):
+
+        def run():
+            with app.test_request_context(path):
+                if user is not None:
+                    login_user(user)
+                return func()
+
+        return run
+
+    def in_socket_request(func: Callable[[], object]):
+
+        def run():
+            with app.test_request_context('/'):
+                from flask import request
+                request.sid = 'bench-sid'
+                request.namespace = '/'
+                return func()
+
+        return run
+
+    def reset_read_state():
+        db.session.execute(
+            text('UPDATE message SET read_at = NULL WHERE conversation_id = :cid '
+                 'AND recipient_id = :rid AND id > (SELECT MAX(id) - 50 FROM message '
+                 'WHERE conversation_id = :cid)'), {
+                     'cid': busiest,
+                     'rid': reader_id
+                 })
+        db.session.commit()
+
+    def reset_delivery_state():
+        db.session.execute(
+            text('UPDATE message SET delivered_at = NULL WHERE recipient_id = :rid '
+                 'AND read_at IS NULL'), {'rid': pending_recipient.id})
+        db.session.commit()
+
+    def populate_rooms():
+        main.room_directory.clear()
+        main.room_code_index.clear()
+        main.room_message_history.clear()
+        main.room_history_frames.clear()
+        with app.test_request_context('/'):
+            for index in range(args.rooms):
+                main.add_room(f'bench-room-{index}',
+                              is_public=index % 2 == 0,
+                              expires_in='1_day' if index % 10 == 0 else 'never')
+        expired_at = '2000-01-01T00:00:00'
+        for index in range(0, args.rooms, 10):
+            main.room_directory[f'bench-room-{index}']['expires_at'] = expired_at
+
+    def populate_sockets():
+        main.active_users.clear()
+        for index in range(args.sockets):
+            main.active_users[f'sid-{index}'] = {
+                'username': f'user{rng.randint(1, args.users)}',
+                # a quarter of the sockets force the avatar lookup path
+                'avatar_url': None if index % 4 == 0 else '/static/icons/Guest.jpeg'
+            }
+
+    return {
+        'get_or_create_direct_conversation': (
+            in_request('/', lambda: main.get_or_create_direct_conversation(
+                reader_id, partner_id)), None),
+        'list_private_chats': (in_request('/api/private-chats',
+                                          main.list_private_chats,
+                                          reader), None),
+        'private_chat_messages': (in_request(
+            f'/api/private-chats/{busiest}/messages?limit=50',
+            lambda: main.private_chat_messages(busiest), reader), None),
+        'apply_read_marks': (in_request(
+            '/', lambda: main.apply_read_marks({(reader.id, busiest): None})),
+                             reset_read_state),
+        'emit_missed_private_messages': (in_socket_request(
+            lambda: main.emit_missed_private_messages(pending_recipient)),
+                                         reset_delivery_state),
+        'cleanup_expired_rooms': (in_request('/', main.cleanup_expired_rooms),
+                                  populate_rooms),
+        'build_active_users_payload': (in_request(
+            '/', main.build_active_users_payload), populate_sockets),
+        'list_chat_users': (in_request('/api/users?q=user12',
+                                       main.list_chat_users, reader), None),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=os.path.join(BENCH_DIR, 'bench.db'))
+    parser.add_argument('--regenerate', action='store_true')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--messages', type=int, default=10000000)
+    parser.add_argument('--rooms', type=int, default=5000)
+    parser.add_argument('--sockets', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--only', action='append',
+                        help='run only the named case (repeatable)')
+    args = parser.parse_args()
+
+    if args.regenerate or not os.path.exists(args.db):
+        print(f'Generating {args.users} users / {args.messages} messages in {args.db}')
+        generate(args.db, users=args.users, messages=args.messages, seed=args.seed)
+    else:
+        create_schema(args.db)
+
+    import main as app_main
+
+    # Rooms created by the cases must not land in the real room store
+    scratch = tempfile.mkdtemp(prefix='partychat-bench-')
+    app = app_main.create_app({
+        'ROOM_STORE_DIR': os.path.join(scratch, 'rooms'),
+        'ROOM_ARCHIVE_DIR': os.path.join(scratch, 'room_archive')
+    })
+    with app.app_context():
+        cases = build_cases(app_main, app, args)
+        print(f'{"case":36} {"median ms":>10} {"p95 ms":>10}')
+        for name, (func, setup) in cases.items():
+            if args.only and name not in args.only:
+                continue
+            samples = timed_runs(func, args.repeat, setup)
+            p95 = sorted(samples)[max(0, int(len(samples) * 0.95) - 1)]
+            print(f'{name:36} {statistics.median(samples):10.3f} {p95:10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Time room directory recovery from the room store snapshot and log.
+
+Builds a store with ``--rooms`` rooms in the snapshot and ``--log-ops``
+operations in the log (creates, activity updates and deletes), then times
+``main.load_room_directory()``, which is what ``create_app()`` runs on boot::
+
+    python benchmarks/bench_room_store.py --rooms 100000 --log-ops 10000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from roomstore import RoomStore  # noqa: E402
+
+
+def room_meta(index: int, now: str) -> dict:
+    return {
+        'code': f'R{index:07d}',
+        'is_public': index % 2 == 0,
+        'created_by': f'user{index % 5000}',
+        'created_at': now,
+        'expires_at': None,
+        'last_activity_at': now,
+        'archive_on_inactive': '7_days' if index % 3 == 0 else 'none',
+        'message_policy': 'everyone',
+        'moderators': [],
+        'history_epoch': f'{index:012x}'
+    }
+
+
+def build_store(root: str, rooms: int, log_ops: int, seed: int) -> None:
+    rng = random.Random(seed)
+    now = datetime.now().isoformat()
+    directory = {f'room-{index}': room_meta(index, now) for index in range(rooms)}
+    store = RoomStore(root, directory, snapshot_every=log_ops + 1)
+    store.snapshot()
+
+    next_index = rooms
+    for _ in range(log_ops):
+        choice = rng.random()
+        if choice < 0.3:
+            name = f'room-{next_index}'
+            directory[name] = room_meta(next_index, now)
+            store.record_create(name)
+            next_index += 1
+        elif choice < 0.9:
+            store.record_update(f'room-{rng.randrange(next_index)}', last_activity_at=now)
+        else:
+            name = f'room-{rng.randrange(next_index)}'
+            directory.pop(name, None)
+            store.record_delete(name)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=100000)
+    parser.add_argument('--log-ops', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--target-ms', type=float, default=1000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='partychat-rooms-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "rooms.db")}'
+    store_dir = os.path.join(workdir, 'rooms')
+    build_store(store_dir, args.rooms, args.log_ops, args.seed)
+
+    import main as app_main
+
+    app = app_main.create_app({
+        'ROOM_STORE_DIR': store_dir,
+        'ROOM_ARCHIVE_DIR': os.path.join(workdir, 'room_archive'),
+        'LOG_LEVEL': 'WARNING'
+    })
+
+    samples = []
+    with app.app_context():
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            app_main.load_room_directory()
+            samples.append((time.perf_counter() - started) * 1000)
+        rooms = len(app_main.room_directory)
+
+    median = statistics.median(samples)
+    print(f'{rooms} rooms, {args.log_ops} log entries: '
+          f'median {median:.1f} ms, max {max(samples):.1f} ms')
+    if median > args.target_ms:
+        print(f'Recovery exceeds the {args.target_ms:.0f} ms target')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
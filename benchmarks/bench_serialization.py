@@ -0,0 +1,101 @@
+"""Compare the per-message cost of the old and new private message encoding.
+
+The baseline mirrors the previous ``serialize_private_message`` output: ISO
+timestamp strings encoded with the stdlib ``json`` module. The candidate uses
+epoch-millisecond integers and whichever backend ``serialization`` selected.
+
+Run from the repository root::
+
+    python benchmarks/bench_serialization.py [--messages 50000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization  # noqa: E402
+from serialization import to_epoch_ms  # noqa: E402
+
+
+def build_rows(count: int) -> list[dict]:
+    base = datetime(2026, 1, 1, 12, 0, 0)
+    return [{
+        'id': index,
+        'conversation_id': index % 500,
+        'body': f'message body number {index} with a little bit of text',
+        'from': f'user{index % 97}',
+        'to': f'user{(index + 1) % 97}',
+        'message_type': 'private',
+        'sticker_file': None,
+        'created_at': base + timedelta(seconds=index),
+        'delivered_at': base + timedelta(seconds=index + 1),
+        'read_at': None if index % 3 else base + timedelta(seconds=index + 5),
+        'avatar_url': '/static/icons/Guest.jpeg'
+    } for index in range(count)]
+
+
+def encode_iso(row: dict) -> str:
+    return json.dumps({
+        'id': str(row['id']),
+        'conversation_id': row['conversation_id'],
+        'msg': row['body'],
+        'from': row['from'],
+        'to': row['to'],
+        'message_type': row['message_type'],
+        'file': row['sticker_file'],
+        'timestamp': row['created_at'].isoformat(),
+        'delivered_at': row['delivered_at'].isoformat()
+        if row['delivered_at'] else None,
+        'read_at': row['read_at'].isoformat() if row['read_at'] else None,
+        'avatar_url': row['avatar_url']
+    }, separators=(',', ':'))
+
+
+def encode_epoch(row: dict) -> str:
+    return serialization.dumps({
+        'id': str(row['id']),
+        'conversation_id': row['conversation_id'],
+        'msg': row['body'],
+        'from': row['from'],
+        'to': row['to'],
+        'message_type': row['message_type'],
+        'file': row['sticker_file'],
+        'timestamp': to_epoch_ms(row['created_at']),
+        'delivered_at': to_epoch_ms(row['delivered_at']),
+        'read_at': to_epoch_ms(row['read_at']),
+        'avatar_url': row['avatar_url']
+    })
+
+
+def measure(encoder, rows: list[dict], repeat: int) -> tuple[float, int]:
+    runs = timeit.repeat(lambda: [encoder(row) for row in rows],
+                         number=1,
+                         repeat=repeat)
+    wire_bytes = sum(len(encoder(row).encode('utf-8')) for row in rows)
+    return min(runs) / len(rows), wire_bytes // len(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = build_rows(args.messages)
+    baseline_cost, baseline_size = measure(encode_iso, rows, args.repeat)
+    candidate_cost, candidate_size = measure(encode_epoch, rows, args.repeat)
+
+    print(f'messages: {args.messages}  backend: {serialization.BACKEND}')
+    print(f'iso + json     {baseline_cost * 1e6:8.2f} us/msg  {baseline_size:4d} B/msg')
+    print(f'epoch + {serialization.BACKEND:<7}{candidate_cost * 1e6:8.2f} us/msg  '
+          f'{candidate_size:4d} B/msg')
+    print(f'saving         {(baseline_cost - candidate_cost) * 1e6:8.2f} us/msg  '
+          f'{baseline_size - candidate_size:4d} B/msg')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Measure cold worker startup: importing ``main`` and calling ``create_app()``.
+
+Every run is a fresh interpreter, like a gunicorn worker boot or a
+``--reload`` restart. The script reports median / max wall time for the
+import and the factory and exits non-zero when the median total exceeds
+``--target-ms``::
+
+    python benchmarks/bench_startup.py --runs 10 --target-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.create_app()
+created = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000,
+                  "create_app_ms": (created - imported) * 1000}))
+'''
+
+
+def measure(workdir: str) -> dict:
+    env = dict(os.environ,
+               DATABASE_URL=f'sqlite:///{os.path.join(workdir, "startup.db")}',
+               ROOM_STORE_DIR=os.path.join(workdir, 'rooms'),
+               ROOM_ARCHIVE_DIR=os.path.join(workdir, 'room_archive'),
+               LOG_LEVEL='WARNING')
+    output = subprocess.run([sys.executable, '-c', PROBE],
+                            cwd=ROOT,
+                            env=env,
+                            check=True,
+                            capture_output=True,
+                            text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--target-ms', type=float, default=1500,
+                        help='fail when the median import + create_app time is higher')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='partychat-startup-')
+    samples = [measure(workdir) for _ in range(args.runs)]
+
+    print(f'{"phase":12} {"median ms":>10} {"max ms":>10}')
+    totals = [sample['import_ms'] + sample['create_app_ms'] for sample in samples]
+    for phase, values in (('import', [sample['import_ms'] for sample in samples]),
+                          ('create_app', [sample['create_app_ms'] for sample in samples]),
+                          ('total', totals)):
+        print(f'{phase:12} {statistics.median(values):10.1f} {max(values):10.1f}')
+
+    median_total = statistics.median(totals)
+    if median_total > args.target_ms:
+        print(f'Startup {median_total:.1f} ms exceeds the {args.target_ms:.0f} ms target')
+        return 1
+    print(f'Startup within the {args.target_ms:.0f} ms target')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Compare bytes on the wire and CPU per room message for each socket format.
+
+Rows are room ``message`` payloads shaped like the ones ``main.py`` builds.
+Each format is measured two ways: one live ``message`` event per message,
+and a ``room_history`` snapshot carrying ``--history`` messages at once.
+
+* ``json``: today's text frames
+* ``deflate-N``: the snapshot zlib-compressed at level N, as sent to clients
+  that negotiate ``deflate`` (live messages stay JSON)
+* ``stream-deflate``: every frame compressed with one shared zlib context,
+  which is what websocket permessage-deflate with context takeover achieves
+* ``msgpack``: only when the ``msgpack`` package is installed
+
+CPU is the server-side encode (and compress) cost; ``inflate`` is the
+client-side decompress cost, measured with zlib. Socket.IO and Engine.IO
+framing (a few bytes per packet) is left out. Run from the repository root::
+
+    python benchmarks/bench_wire_format.py [--messages 20000] [--history 100]
+"""
+import argparse
+import os
+import sys
+import timeit
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization  # noqa: E402
+from serialization import deflate  # noqa: E402
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+
+def build_rows(count: int) -> list[dict]:
+    base = 1767268800000
+    return [{
+        'id': str(index),
+        'seq': index,
+        'msg': f'message body number {index} with a little bit of text',
+        'username': f'user{index % 37}',
+        'room': 'General',
+        'timestamp': base + index * 1500,
+        'type': 'message',
+        'reply_to_id': None,
+        'avatar_url': f'/static/uploads/profile_pictures/user{index % 37}.png'
+    } for index in range(count)]
+
+
+def history_documents(rows: list[dict], size: int) -> list[str]:
+    return [
+        '{"room":"General","mode":"snapshot","epoch":null,"last_seq":0,"messages":' +
+        '[' + ','.join(serialization.dumps(row) for row in rows[start:start + size]) + ']}'
+        for start in range(0, len(rows), size)
+    ]
+
+
+def timed(func, repeat: int) -> float:
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def report(label: str, seconds: float, size: int, count: int,
+           inflate_seconds: float | None = None) -> None:
+    line = f'{label:<26}{seconds / count * 1e6:8.2f} us/msg  {size / count:7.1f} B/msg'
+    if inflate_seconds is not None:
+        line += f'  inflate {inflate_seconds / count * 1e6:6.2f} us/msg'
+    print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--history', type=int, default=100,
+                        help='messages per room_history snapshot')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = build_rows(args.messages)
+    count = len(rows)
+    print(f'messages: {count}  history: {args.history}  json backend: {serialization.BACKEND}')
+
+    print('\nlive message events')
+    frames = [serialization.dumps(row) for row in rows]
+    report('json', timed(lambda: [serialization.dumps(row) for row in rows], args.repeat),
+           sum(len(frame.encode('utf-8')) for frame in frames), count)
+
+    def stream_deflate() -> list[bytes]:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return [
+            compressor.compress(serialization.dumps(row).encode('utf-8')) +
+            compressor.flush(zlib.Z_SYNC_FLUSH) for row in rows
+        ]
+
+    compressed = stream_deflate()
+
+    def stream_inflate() -> None:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        for frame in compressed:
+            decompressor.decompress(frame)
+
+    report('stream-deflate', timed(stream_deflate, args.repeat),
+           sum(len(frame) for frame in compressed), count, timed(stream_inflate, args.repeat))
+    if msgpack is not None:
+        report('msgpack', timed(lambda: [msgpack.packb(row) for row in rows], args.repeat),
+               sum(len(msgpack.packb(row)) for row in rows), count)
+    else:
+        print('msgpack                   not installed')
+
+    print(f'\nroom_history snapshots of {args.history}')
+    documents = history_documents(rows, args.history)
+    report('json', timed(lambda: history_documents(rows, args.history), args.repeat),
+           sum(len(document.encode('utf-8')) for document in documents), count)
+    for level in (1, 6, 9):
+        deflated = [deflate(document, level) for document in documents]
+        report(f'deflate-{level}',
+               timed(lambda: [deflate(document, level)
+                              for document in history_documents(rows, args.history)],
+                     args.repeat),
+               sum(len(document) for document in deflated), count,
+               timed(lambda: [zlib.decompress(document) for document in deflated],
+                     args.repeat))
+    if msgpack is not None:
+        packed = [msgpack.packb(rows[start:start + args.history])
+                  for start in range(0, count, args.history)]
+        report('msgpack',
+               timed(lambda: [msgpack.packb(rows[start:start + args.history])
+                              for start in range(0, count, args.history)], args.repeat),
+               sum(len(document) for document in packed), count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+"""Socket.IO load test with synthetic clients.
+
+Starts the app under gunicorn with the gevent websocket worker against a
+throwaway SQLite database, seeds one user per simulated client and then:
+
+1. logs every client in and opens all Socket.IO connections at once
+   (connect storm),
+2. joins each client to a room from ``CHAT_ROOMS``,
+3. sends room messages and DMs through the ``message`` event for
+   ``--duration`` seconds, marking received DMs read,
+
+and reports messages/sec, p50/p99 fan-out latency, connect-storm time and
+server memory per connection. ``--save-baseline`` records the results and
+``--compare`` fails when a run regresses past ``--tolerance``.
+
+Requires the async Socket.IO client::
+
+    pip install "python-socketio[asyncio_client]" gunicorn
+
+Example::
+
+    python benchmarks/loadtest.py --clients 2000 --duration 30 --compare
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baselines', 'loadtest.json')
+PASSWORD = 'loadtest-password'
+WORKER_CLASS = 'geventwebsocket.gunicorn.workers.GeventWebSocketWorker'
+
+# metric -> True when larger values are better
+TRACKED_METRICS = {
+    'room_messages_per_sec': True,
+    'fanout_p50_ms': False,
+    'fanout_p99_ms': False,
+    'connect_storm_sec': False,
+    'memory_per_connection_kb': False,
+}
+
+
+def seed_database(database_url: str, count: int, prefix: str) -> list[str]:
+    """Create the schema and ``count`` users; return the room names."""
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['AUTH_RATE_LIMITS'] = 'false'
+    sys.path.insert(0, ROOT)
+    from werkzeug.security import generate_password_hash
+
+    import main
+    from migrations import upgrade
+    from models import User, db
+
+    # One cheap hash shared by every user keeps seeding and logins fast.
+    password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    app = main.create_app()
+    with app.app_context():
+        upgrade(db.engine)
+        db.session.bulk_insert_mappings(User, [{
+            'username': f'{prefix}{index}',
+            'email': f'{prefix}{index}@loadtest.invalid',
+            'password_hash': password_hash,
+            'is_profile_complete': True
+        } for index in range(count)])
+        db.session.commit()
+    return list(app.config['CHAT_ROOMS'])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, database_url: str) -> subprocess.Popen:
+    # Every simulated client logs in from 127.0.0.1
+    env = dict(os.environ, DATABASE_URL=database_url, AUTH_RATE_LIMITS='false')
+    process = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+        '--worker-class', WORKER_CLASS, '--log-level', 'warning', 'main:create_app()'
+    ],
+                               cwd=ROOT,
+                               env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('Server did not start within 30 seconds')
+
+
+def server_rss_kb(process: subprocess.Popen | None) -> int:
+    """Resident memory of the gunicorn master and its workers, in KiB."""
+    if process is None:
+        return 0
+
+    pids = [process.pid]
+    try:
+        with open(f'/proc/{process.pid}/task/{process.pid}/children') as handle:
+            pids.extend(int(pid) for pid in handle.read().split())
+    except OSError:
+        pass
+
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as handle:
+                for line in handle:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total
+
+
+class LoadClient:
+
+    def __init__(self, index: int, username: str, room: str, stats: dict):
+        self.index = index
+        self.username = username
+        self.room = room
+        self.stats = stats
+        self.http: aiohttp.ClientSession | None = None
+        self.sio: socketio.AsyncClient | None = None
+
+    async def login(self, base_url: str) -> None:
+        # unsafe=True lets the jar keep cookies set by an IP-address host
+        self.http = aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True))
+        async with self.http.post(f'{base_url}/login',
+                                  data={
+                                      'username': self.username,
+                                      'password': PASSWORD
+                                  },
+                                  allow_redirects=False) as response:
+            if response.status != 302:
+                raise RuntimeError(f'Login failed for {self.username}')
+
+    async def connect(self, base_url: str) -> None:
+        self.sio = socketio.AsyncClient(http_session=self.http,
+                                        reconnection=False)
+        self.sio.on('message', self.on_room_message)
+        self.sio.on('message_batch', self.on_message_batch)
+        self.sio.on('private_message', self.on_private_message)
+        self.sio.on('message_error', self.on_error)
+        await self.sio.connect(base_url, transports=['websocket'])
+
+    async def join(self) -> None:
+        await self.sio.emit('join', {'room': self.room})
+
+    def on_room_message(self, data: dict) -> None:
+        parts = str(data.get('msg', '')).split(' ')
+        if len(parts) == 3 and parts[0] == 'lt':
+            self.stats['room_received'] += 1
+            self.stats['latencies'].append((time.time_ns() - int(parts[2])) / 1e6)
+
+    def on_message_batch(self, data: dict) -> None:
+        for message in data.get('messages', []):
+            self.on_room_message(message)
+
+    async def on_private_message(self, data: dict) -> None:
+        self.stats['dm_received'] += 1
+        await self.sio.emit('mark_private_read',
+                            {'conversation_id': data.get('conversation_id')})
+
+    def on_error(self, data: dict) -> None:
+        self.stats['errors'] += 1
+
+    async def run(self, duration: float, rate: float, dm_ratio: float,
+                  peers: list[str]) -> None:
+        deadline = time.monotonic() + duration
+        interval = 1 / rate
+        await asyncio.sleep(random.random() * interval)
+        while time.monotonic() < deadline:
+            if len(peers) > 1 and random.random() < dm_ratio:
+                offset = random.randrange(1, len(peers))
+                await self.sio.emit('message', {
+                    'type': 'private',
+                    'target': peers[(self.index + offset) % len(peers)],
+                    'msg': f'dm {self.index}'
+                })
+                self.stats['dm_sent'] += 1
+            else:
+                await self.sio.emit('message', {
+                    'room': self.room,
+                    'msg': f'lt {self.index} {time.time_ns()}'
+                })
+                self.stats['room_sent'] += 1
+            await asyncio.sleep(interval)
+
+    async def close(self) -> None:
+        if self.sio and self.sio.connected:
+            await self.sio.disconnect()
+        if self.http:
+            await self.http.close()
+
+
+async def gather_limited(coroutines, limit: int) -> None:
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            await coroutine
+
+    await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_load(args, base_url: str, rooms: list[str],
+                   server: subprocess.Popen | None) -> dict:
+    stats = {
+        'room_sent': 0,
+        'room_received': 0,
+        'dm_sent': 0,
+        'dm_received': 0,
+        'errors': 0,
+        'latencies': []
+    }
+    usernames = [f'{args.user_prefix}{index}' for index in range(args.clients)]
+    clients = [
+        LoadClient(index, username, rooms[index % len(rooms)], stats)
+        for index, username in enumerate(usernames)
+    ]
+
+    try:
+        await gather_limited((client.login(base_url) for client in clients),
+                             args.concurrency)
+
+        rss_before = server_rss_kb(server)
+        started = time.perf_counter()
+        await gather_limited((client.connect(base_url) for client in clients),
+                             args.clients)
+        connect_storm = time.perf_counter() - started
+        rss_after = server_rss_kb(server)
+
+        await asyncio.gather(*(client.join() for client in clients))
+        await asyncio.sleep(1)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client.run(args.duration, args.rate,
+                                          args.dm_ratio, usernames)
+                               for client in clients))
+        await asyncio.sleep(args.drain)
+        elapsed = time.perf_counter() - started
+    finally:
+        await asyncio.gather(*(client.close() for client in clients),
+                             return_exceptions=True)
+
+    latencies = stats['latencies']
+    return {
+        'clients': args.clients,
+        'duration_sec': args.duration,
+        'room_messages_sent': stats['room_sent'],
+        'room_messages_delivered': stats['room_received'],
+        'room_messages_per_sec': round(stats['room_received'] / elapsed, 1),
+        'dms_sent': stats['dm_sent'],
+        'dms_delivered': stats['dm_received'],
+        'errors': stats['errors'],
+        'fanout_p50_ms': round(percentile(latencies, 0.50), 2),
+        'fanout_p99_ms': round(percentile(latencies, 0.99), 2),
+        'fanout_mean_ms': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        'connect_storm_sec': round(connect_storm, 3),
+        'memory_per_connection_kb':
+        round((rss_after - rss_before) / args.clients, 1) if server else None,
+    }
+
+
+def compare_with_baseline(results: dict, tolerance: float) -> list[str]:
+    with open(BASELINE_PATH) as handle:
+        baseline = json.load(handle)
+
+    regressions = []
+    for metric, higher_is_better in TRACKED_METRICS.items():
+        old, new = baseline.get(metric), results.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (higher_is_better and change < -tolerance) or (not higher_is_better
+                                                          and change > tolerance):
+            regressions.append(f'{metric}: {old} -> {new} ({change:+.0%})')
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=20,
+                        help='seconds of steady-state traffic')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='messages per second per client')
+    parser.add_argument('--dm-ratio', type=float, default=0.2)
+    parser.add_argument('--drain', type=float, default=2.0,
+                        help='seconds to wait for in-flight messages')
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help='parallel logins')
+    parser.add_argument('--url', help='target a running server instead of '
+                        'starting one; users must already exist')
+    parser.add_argument('--user-prefix', default='load')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    server = None
+    workdir = tempfile.mkdtemp(prefix='partychat-load-')
+    database_url = f'sqlite:///{os.path.join(workdir, "load.db")}'
+    os.environ['ROOM_STORE_DIR'] = os.path.join(workdir, 'rooms')
+    os.environ['ROOM_ARCHIVE_DIR'] = os.path.join(workdir, 'room_archive')
+    rooms = seed_database(database_url, 0 if args.url else args.clients,
+                          args.user_prefix)
+    base_url = args.url
+    if not base_url:
+        port = free_port()
+        server = start_server(port, database_url)
+        base_url = f'http://127.0.0.1:{port}'
+
+    try:
+        results = asyncio.run(run_load(args, base_url, rooms, server))
+    finally:
+        if server:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+    print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, 'w') as handle:
+            json.dump(results, handle, indent=2)
+        print(f'Baseline saved to {BASELINE_PATH}')
+
+    if args.compare:
+        if not os.path.exists(BASELINE_PATH):
+            print(f'No baseline at {BASELINE_PATH}; run with --save-baseline first.')
+            return 1
+        regressions = compare_with_baseline(results, args.tolerance)
+        if regressions:
+            print('Regressions against baseline:')
+            for line in regressions:
+                print(f'  {line}')
+            return 1
+        print('No regressions against baseline.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Generate a SQLite database with realistic chat volumes.
+
+The schema comes from the app's models. Rows are written with ``sqlite3``
+``executemany`` in large transactions, so tens of millions of messages take
+minutes rather than hours. The generator is deterministic for a given seed
+and can be reused for fixtures::
+
+    from benchmarks.seed_data import generate
+    generate('/tmp/fixture.db', users=200, conversations=400, messages=5000)
+
+From the command line::
+
+    python benchmarks/seed_data.py /tmp/bench.db --users 100000 --messages 10000000
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'bench-password'
+BATCH_SIZE = 50000
+
+
+def create_schema(path: str) -> None:
+    """Create the app's tables and indexes by applying every migration."""
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(path)}'
+    sys.path.insert(0, ROOT)
+    import main
+    from migrations import upgrade
+    from models import db
+
+    with main.create_app().app_context():
+        upgrade(db.engine)
+
+
+def generate(path: str,
+             users: int = 100000,
+             conversations: int | None = None,
+             messages: int = 10000000,
+             unread_ratio: float = 0.02,
+             seed: int = 7) -> dict:
+    """Populate ``path`` and return the volumes that were written.
+
+    Users are named ``user<N>`` and share one cheap password hash. Each
+    conversation is a direct chat between two users. Message counts per
+    conversation follow a skewed distribution. The newest ``unread_ratio``
+    of messages stays unread, and half of those are also undelivered.
+    """
+    from werkzeug.security import generate_password_hash
+
+    if os.path.exists(path):
+        os.remove(path)
+    create_schema(path)
+
+    rng = random.Random(seed)
+    conversations = conversations or users * 2
+    password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    start = datetime(2025, 1, 1)
+
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=OFF')
+    connection.execute('PRAGMA synchronous=OFF')
+    try:
+        connection.executemany(
+            'INSERT INTO user (id, username, email, password_hash, created_at, '
+            'display_name, bio, is_profile_complete) VALUES (?, ?, ?, ?, ?, ?, ?, 1)',
+            ((index, f'user{index}', f'user{index}@bench.invalid', password_hash,
+              start.isoformat(sep=' '), f'User {index}', '')
+             for index in range(1, users + 1)))
+
+        pairs: list[tuple[int, int]] = []
+        seen: set[tuple[int, int]] = set()
+        while len(pairs) < conversations:
+            first, second = sorted(rng.sample(range(1, users + 1), 2))
+            if (first, second) not in seen:
+                seen.add((first, second))
+                pairs.append((first, second))
+
+        connection.executemany(
+            'INSERT INTO conversation (id, created_at, metadata) VALUES (?, ?, ?)',
+            ((index, start.isoformat(sep=' '),
+              json.dumps({
+                  'type': 'direct',
+                  'participants': list(pair)
+              })) for index, pair in enumerate(pairs, start=1)))
+        connection.executemany(
+            'INSERT INTO conversation_participant (conversation_id, user_id, joined_at) '
+            'VALUES (?, ?, ?)', ((index, user_id, start.isoformat(sep=' '))
+                                 for index, pair in enumerate(pairs, start=1)
+                                 for user_id in pair))
+        connection.commit()
+
+        unread_from = int(messages * (1 - unread_ratio))
+        undelivered_from = int(messages * (1 - unread_ratio / 2))
+        step = timedelta(seconds=max(1, (365 * 86400) // max(messages, 1)))
+        batch = []
+        for index in range(messages):
+            # paretovariate skews traffic towards a small set of busy threads
+            conversation_index = min(int(rng.paretovariate(1.2)) - 1,
+                                     conversations - 1)
+            conversation_index = (conversation_index * 7919 + index % 3) % conversations
+            first, second = pairs[conversation_index]
+            sender, recipient = (first, second) if rng.random() < 0.5 else (second,
+                                                                             first)
+            created = start + step * index
+            created_at = created.isoformat(sep=' ')
+            delivered_at = None if index >= undelivered_from else created_at
+            read_at = None if index >= unread_from else created_at
+            batch.append((conversation_index + 1, sender, recipient,
+                          f'message {index} from user{sender}', 'private', created_at,
+                          delivered_at, read_at))
+            if len(batch) >= BATCH_SIZE:
+                _insert_messages(connection, batch)
+                batch = []
+        if batch:
+            _insert_messages(connection, batch)
+        connection.commit()
+        connection.execute('ANALYZE')
+    finally:
+        connection.close()
+
+    return {'users': users, 'conversations': conversations, 'messages': messages}
+
+
+def _insert_messages(connection: sqlite3.Connection, rows: list[tuple]) -> None:
+    connection.executemany(
+        'INSERT INTO message (conversation_id, sender_id, recipient_id, body, '
+        'message_type, created_at, delivered_at, read_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--conversations', type=int)
+    parser.add_argument('--messages', type=int, default=10000000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    volumes = generate(args.path,
+                       users=args.users,
+                       conversations=args.conversations,
+                       messages=args.messages,
+                       seed=args.seed)
+    print(f'Generated {volumes} in {time.perf_counter() - started:.1f}s -> {args.path}')
+
+
+if __name__ == '__main__':
+    main()
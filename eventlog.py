@@ -0,0 +1,108 @@
+"""Per-user event stream for keeping every device of a user in sync.
+
+Everything a user's clients need to know about their DMs (new messages, read
+receipts, read acks and new conversations) is appended to ``user_event``
+with a per-user sequence number and emitted to the ``user:<id>`` Socket.IO
+room, which every connected tab of that user joins. A device that reconnects
+sends the last sequence number it saw and gets exactly the events after it
+from one range query on ``(user_id, seq)``.
+
+Sequence numbers are handed out from an in-memory counter per user (seeded
+from the table on first use), which relies on the same single-process
+deployment as the rest of the app's in-memory state; the unique constraint
+on ``(user_id, seq)`` turns a violation of that into an error instead of a
+silently forked stream.
+"""
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import func
+
+from models import UserEvent, db
+from serialization import RawJSON, dumps
+
+Entry = Tuple[str, dict, Iterable[int]]
+
+
+def user_room(user_id: int) -> str:
+    return f'user:{user_id}'
+
+
+class UserEventLog:
+
+    def __init__(self, socketio, max_backlog: int = 500):
+        self.socketio = socketio
+        self.max_backlog = max(max_backlog, 1)
+        self._last_seq: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def last_seq(self, user_id: int) -> int:
+        with self._lock:
+            seq = self._last_seq.get(user_id)
+        if seq is None:
+            seq = db.session.query(func.max(
+                UserEvent.seq)).filter(UserEvent.user_id == user_id).scalar() or 0
+            with self._lock:
+                seq = self._last_seq.setdefault(user_id, seq)
+        return seq
+
+    def _next_seq(self, user_id: int) -> int:
+        self.last_seq(user_id)
+        with self._lock:
+            self._last_seq[user_id] += 1
+            return self._last_seq[user_id]
+
+    def append(self, event: str, payload: dict, user_ids: Iterable[int],
+               skip_sid: str | None = None) -> None:
+        self.append_many([(event, payload, user_ids)], skip_sid=skip_sid)
+
+    def append_many(self, entries: List[Entry], skip_sid: str | None = None) -> None:
+        """Record each ``(event, payload, user_ids)`` entry in the stream of
+        every listed user, commit the session, then emit the events.
+
+        Pending changes in the session (such as the message row an event
+        describes) are committed together with the events. ``skip_sid`` is
+        left out of the live emit, e.g. the tab that sent the message.
+        """
+        published = []
+        for event, payload, user_ids in entries:
+            for user_id in dict.fromkeys(user_ids):
+                seq = self._next_seq(user_id)
+                encoded = dumps(dict(payload, seq=seq))
+                db.session.add(
+                    UserEvent(user_id=user_id, seq=seq, event=event, payload=encoded))
+                published.append((user_id, event, encoded))
+
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # The counters ran ahead of the table (or another process wrote
+            # to these streams); reseed from the table on next use
+            with self._lock:
+                self._last_seq.clear()
+            raise
+
+        for user_id, event, encoded in published:
+            self.socketio.emit(event,
+                               RawJSON(encoded),
+                               to=user_room(user_id),
+                               skip_sid=skip_sid)
+
+    def backlog(self, user_id: int, since_seq: int) -> Tuple[str, int] | None:
+        """Encoded ``[{"seq", "event", "data"}, ...]`` of the events after
+        ``since_seq`` and the user's latest sequence number, or None when the
+        gap cannot be replayed (too large, pruned, or from another log)."""
+        last_seq = self.last_seq(user_id)
+        if since_seq > last_seq or last_seq - since_seq > self.max_backlog:
+            return None
+        if since_seq == last_seq:
+            return '[]', last_seq
+
+        rows = db.session.query(UserEvent.seq, UserEvent.event, UserEvent.payload).filter(
+            UserEvent.user_id == user_id,
+            UserEvent.seq > since_seq).order_by(UserEvent.seq).all()
+        if not rows or rows[0][0] != since_seq + 1:
+            return None
+        return '[' + ','.join(f'{{"seq":{seq},"event":{dumps(event)},"data":{payload}}}'
+                              for seq, event, payload in rows) + ']', last_seq
@@ -0,0 +1,185 @@
+"""Logging setup: per-environment levels, JSON output, sampling and an
+asynchronous writer.
+
+Log calls only enqueue a record; a native OS thread formats it and writes it
+to stdout, so socket greenlets never block on terminal or disk I/O. High
+frequency events opt into sampling by passing ``extra={'event': name}``; only
+one in every ``sample_rates[name]`` of those records is kept.
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import sys
+from datetime import datetime, timezone
+from typing import Dict
+
+try:
+    from gevent.monkey import get_original
+except ImportError:  # pragma: no cover - gevent is optional outside gunicorn
+
+    def get_original(module_name: str, item_name: str):
+        return getattr(__import__(module_name), item_name)
+
+LOGGING_PRESETS = {
+    'development': {
+        'level': 'INFO',
+        'format': 'text',
+        'packet_logging': True,
+        'sample_rates': {}
+    },
+    'production': {
+        'level': 'INFO',
+        'format': 'json',
+        'packet_logging': False,
+        'sample_rates': {
+            'room_message': 100,
+            'private_message': 100,
+            'join': 10,
+            'leave': 10,
+            'connect': 10,
+            'disconnect': 10
+        }
+    }
+}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime'
+}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line; ``extra`` fields become top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in every N records for events listed in ``rates``."""
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = {event: rate for event, rate in rates.items() if rate > 1}
+        self._counters = {event: itertools.count() for event in self.rates}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, 'event', None)
+        rate = self.rates.get(event)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        kept = next(self._counters[event]) % rate == 0
+        if kept:
+            record.sample_rate = rate
+        return kept
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the %-args now so later mutation of the arguments cannot
+        # change the message, but leave formatting to the writer thread.
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class AsyncLogWriter:
+    """Drain queued records on a native thread.
+
+    Under gevent, ``_thread`` and ``queue`` are monkey-patched to
+    greenlet-based versions. A writer greenlet blocked on the queue would
+    stall the whole worker, so the thread, locks and queue are taken from
+    the unpatched originals.
+    """
+
+    _STOP = object()
+
+    def __init__(self, handler: logging.Handler):
+        # A gevent-patched RLock cannot be acquired from a native thread.
+        handler.lock = get_original('_thread', 'RLock')()
+        self.handler = handler
+        self.queue = get_original('_queue', 'SimpleQueue')()
+        self._done = get_original('_thread', 'allocate_lock')()
+        self._done.acquire()
+        get_original('_thread', 'start_new_thread')(self._run, ())
+
+    def _run(self) -> None:
+        while True:
+            record = self.queue.get()
+            if record is self._STOP:
+                break
+            try:
+                self.handler.handle(record)
+            except Exception:
+                self.handler.handleError(record)
+        self._done.release()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self.queue.put(self._STOP)
+        self._done.acquire(timeout=timeout)
+
+
+_writer: AsyncLogWriter | None = None
+
+
+def configure_logging(environment: str,
+                      level: str | None = None,
+                      output_format: str | None = None,
+                      sample_rates: Dict[str, int] | None = None) -> dict:
+    """Install the root handlers for ``environment`` and return the preset
+    that was applied (with any overrides)."""
+    global _writer
+
+    preset = dict(LOGGING_PRESETS.get(environment, LOGGING_PRESETS['production']))
+    if level:
+        preset['level'] = level.upper()
+    if output_format:
+        preset['format'] = output_format
+    if sample_rates is not None:
+        preset['sample_rates'] = sample_rates
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JSONFormatter() if preset['format'] ==
+                        'json' else logging.Formatter(TEXT_FORMAT))
+
+    if _writer is not None:
+        _writer.stop()
+    else:
+        atexit.register(lambda: _writer.stop())
+    _writer = AsyncLogWriter(output)
+
+    queue_handler = AsyncQueueHandler(_writer.queue)
+    queue_handler.addFilter(SamplingFilter(preset['sample_rates']))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(preset['level'])
+
+    if not preset['packet_logging']:
+        for name in ('socketio', 'socketio.server', 'engineio', 'engineio.server',
+                     'geventwebsocket', 'werkzeug'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    return preset
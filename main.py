@@ -1,91 +1,516 @@
 # Imports here
+import bisect
+import functools
+import hmac
+import mimetypes
 import os
 import random
 import logging
 import uuid
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Callable, Dict, List
 import re
+import time
 
-from flask import Flask, render_template, request, session, redirect, url_for, flash
+import click
+from flask import (Blueprint, Flask, current_app, render_template, request, session,
+                   redirect, url_for, flash, g, send_file, send_from_directory)
+from flask.cli import with_appcontext
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_login import LoginManager, login_user, current_user, logout_user, login_required
+from werkzeug.local import LocalProxy
 from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
-from sqlalchemy import inspect, text, func, distinct, or_
-from models import db, User, Conversation, ConversationParticipant, Message
+from sqlalchemy import text, func, distinct, or_
+from models import db, User, Conversation, ConversationParticipant, Message, Attachment, AttachmentUpload
+from archive import RoomArchive
+from assets import (SOCKETIO_CLIENT_INTEGRITY, SOCKETIO_CLIENT_PATH, SOCKETIO_CLIENT_VERSION,
+                    AssetManifest, precompressed_variant)
+from attachments import IMAGE_TYPES, AttachmentStore, UploadLimitExceeded, UploadOffsetMismatch
+from backpressure import BackpressureManager
+from batching import RoomBatcher
+from eventlog import UserEventLog, user_room
+from memberships import RoomMembershipStore
+from passwords import PasswordHasher, PasswordHasherBusy
+from ratelimit import EventRateLimiter
+from receipts import ReadMarks, ReadReceiptAggregator
+from retention import MessageCompactor
+from roomstore import RoomStore
+from typing_indicators import Channel, TypingTracker
+from metrics import registry as metrics
+from logging_config import configure_logging
+from migrations import LATEST_VERSION as LATEST_SCHEMA_VERSION
+from migrations import current_version as current_schema_version
+from query_profiler import QueryProfiler
+from serialization import (FastJSONProvider, RawJSON, SocketJSON, deflate, dumps as encode_json,
+                           encode_frame, join_frames, loads as decode_json, to_epoch_ms)
 
-app = Flask(__name__)
-
-# Config logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# App Configuration Settings
-app.config.update(SECRET_KEY=os.environ.get('SESSION_SECRET', 'dev-key'),
-                  SQLALCHEMY_DATABASE_URI='sqlite:///chat.db',
-                  SQLALCHEMY_TRACK_MODIFICATIONS=False,
-                  DEBUG=os.environ.get('FLASK_DEBUG', 'false').lower()
-                  in ('1', 'true'),
-                  CORS_ORIGINS='*',
-                  CHAT_ROOMS=[
-                      'General', 'Study Corner', 'Games and Entertainment',
-                      'Technology Nook'
-                  ],
-                  PROFILE_UPLOAD_FOLDER='uploads/profile_pictures',
-                  PROFILE_UPLOAD_EXTENSIONS={'.jpg', '.jpeg', '.png', '.gif', '.webp'})
-# Available chat rooms - stored as constant for now, could be moved to database
-
-# Handle reverse proxy headers
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# Extension
-
-db.init_app(app)
-def ensure_user_profile_columns() -> None:
-    inspector = inspect(db.engine)
-    table_names = set(inspector.get_table_names())
-    if 'user' not in table_names:
-        return
+# Extensions are created unbound and attached to an app in create_app()
+login_manager = LoginManager()
+login_manager.login_view = 'chat.login'
+query_profiler = QueryProfiler()
+chat = Blueprint('chat', __name__)
+# Socket.IO handlers, registered on every app's own SocketIO in create_app()
+socket_handlers: List[tuple[str, Callable]] = []
+
+
+def socket_event(name: str):
+    """Register a Socket.IO event handler for every app create_app() builds."""
+
+    def decorator(handler):
+        socket_handlers.append((name, handler))
+        return handler
+
+    return decorator
+
+
+class ChatState:
+    """Everything one app owns: its Socket.IO server, the helpers built from
+    its config, and the in-memory room and presence state. create_app()
+    keeps it in ``app.extensions['chat']``, so apps in one process never
+    share state."""
+
+    def __init__(self):
+        self.socketio: SocketIO | None = None
+        self.outbound_manager: BackpressureManager | None = None
+        self.room_batcher: RoomBatcher | None = None
+        self.socket_rate_limiter: EventRateLimiter | None = None
+        self.room_archive: RoomArchive | None = None
+        self.room_store: RoomStore | None = None
+        self.auth_rate_limiter: EventRateLimiter | None = None
+        self.password_hasher: PasswordHasher | None = None
+        self.room_memberships: RoomMembershipStore | None = None
+        self.read_receipts: ReadReceiptAggregator | None = None
+        self.typing_tracker: TypingTracker | None = None
+        self.user_events: UserEventLog | None = None
+        self.message_compactor: MessageCompactor | None = None
+        self.asset_manifest: AssetManifest | None = None
+        self.attachment_store: AttachmentStore | None = None
+        # In production, consider using Redis or another distributed storage
+        self.active_users: Dict[str, dict] = {}
+        # user id -> sids of the user's connected tabs, all joined to user_room(id)
+        self.user_presence: Dict[int, set[str]] = {}
+        # sids whose client inflates deflated binary documents (see emit_document)
+        self.deflate_sids: set[str] = set()
+        self.room_directory: Dict[str, dict] = {}
+        self.room_code_index: Dict[str, str] = {}
+        self.room_message_history: Dict[str, List[dict]] = {}
+        # Wire-encoded copy of each history entry, kept index-aligned with
+        # room_message_history so joins can replay history without re-serializing.
+        self.room_history_frames: Dict[str, List[RawJSON]] = {}
+        self.room_sequences: Dict[str, int] = {}
+        # DM participants never change, so typing hints can skip the database
+        self.conversation_participant_cache: Dict[int, tuple[int, ...]] = {}
+
+
+def _current_state(name: str) -> LocalProxy:
+    return LocalProxy(lambda: getattr(current_app.extensions['chat'], name))
+
+
+# The current app's objects; usable wherever an app context is active
+socketio: SocketIO = _current_state('socketio')
+outbound_manager: BackpressureManager = _current_state('outbound_manager')
+room_batcher: RoomBatcher | None = _current_state('room_batcher')
+socket_rate_limiter: EventRateLimiter = _current_state('socket_rate_limiter')
+room_archive: RoomArchive = _current_state('room_archive')
+room_store: RoomStore = _current_state('room_store')
+auth_rate_limiter: EventRateLimiter = _current_state('auth_rate_limiter')
+password_hasher: PasswordHasher = _current_state('password_hasher')
+room_memberships: RoomMembershipStore = _current_state('room_memberships')
+read_receipts: ReadReceiptAggregator = _current_state('read_receipts')
+typing_tracker: TypingTracker = _current_state('typing_tracker')
+user_events: UserEventLog = _current_state('user_events')
+message_compactor: MessageCompactor = _current_state('message_compactor')
+asset_manifest: AssetManifest = _current_state('asset_manifest')
+attachment_store: AttachmentStore = _current_state('attachment_store')
+active_users: Dict[str, dict] = _current_state('active_users')
+user_presence: Dict[int, set[str]] = _current_state('user_presence')
+deflate_sids: set[str] = _current_state('deflate_sids')
+room_directory: Dict[str, dict] = _current_state('room_directory')
+room_code_index: Dict[str, str] = _current_state('room_code_index')
+room_message_history: Dict[str, List[dict]] = _current_state('room_message_history')
+room_history_frames: Dict[str, List[RawJSON]] = _current_state('room_history_frames')
+room_sequences: Dict[str, int] = _current_state('room_sequences')
+conversation_participant_cache: Dict[int, tuple[int, ...]] = _current_state(
+    'conversation_participant_cache')
+
+
+def create_app(config: dict | None = None) -> Flask:
+    """Build and configure an app; ``config`` overrides the defaults.
+
+    Only cheap, per-process work happens here. Schema changes and other
+    once-per-deployment steps belong in ``flask --app main migrate``.
+    """
+    started_at = time.perf_counter()
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+
+    # App Configuration Settings
+    app.config.update(SECRET_KEY=os.environ.get('SESSION_SECRET', 'dev-key'),
+                      SQLALCHEMY_DATABASE_URI=os.environ.get('DATABASE_URL', 'sqlite:///chat.db'),
+                      SQLALCHEMY_TRACK_MODIFICATIONS=False,
+                      DEBUG=os.environ.get('FLASK_DEBUG', 'false').lower()
+                      in ('1', 'true'),
+                      CORS_ORIGINS='*',
+                      # development keeps per-packet Socket.IO logs; production
+                      # writes sampled JSON lines (see logging_config.LOGGING_PRESETS)
+                      APP_ENV=os.environ.get(
+                          'APP_ENV', 'development' if os.environ.get(
+                              'FLASK_DEBUG', 'false').lower() in ('1', 'true') else
+                          'production'),
+                      LOG_LEVEL=os.environ.get('LOG_LEVEL'),
+                      LOG_FORMAT=os.environ.get('LOG_FORMAT'),
+                      CHAT_ROOMS=[
+                          'General', 'Study Corner', 'Games and Entertainment',
+                          'Technology Nook'
+                      ],
+                      PROFILE_UPLOAD_FOLDER='uploads/profile_pictures',
+                      PROFILE_UPLOAD_EXTENSIONS={'.jpg', '.jpeg', '.png', '.gif', '.webp'},
+                      METRICS_ENABLED=os.environ.get('METRICS_ENABLED', 'true').lower()
+                      in ('1', 'true'),
+                      # Bearer token for scrapers; without one /metrics only
+                      # answers requests from loopback
+                      METRICS_TOKEN=os.environ.get('METRICS_TOKEN', ''),
+                      QUERY_PROFILER_ENABLED=os.environ.get('QUERY_PROFILER', 'false').lower()
+                      in ('1', 'true'),
+                      QUERY_PROFILER_SLOW_MS=float(os.environ.get('QUERY_PROFILER_SLOW_MS', 100)),
+                      QUERY_PROFILER_N_PLUS_ONE=5,
+                      # Required in the X-Profiler-Token header to toggle the
+                      # profiler at runtime; the toggle is disabled when unset
+                      QUERY_PROFILER_TOKEN=os.environ.get('QUERY_PROFILER_TOKEN'),
+                      ROOM_BATCHING_ENABLED=os.environ.get('ROOM_BATCHING', 'false').lower()
+                      in ('1', 'true'),
+                      ROOM_BATCH_MAX_DELAY_MS=int(os.environ.get('ROOM_BATCH_MAX_DELAY_MS', 25)),
+                      ROOM_BATCH_MAX_SIZE=int(os.environ.get('ROOM_BATCH_MAX_SIZE', 50)),
+                      # Largest delta sent on join before falling back to a snapshot
+                      # of the most recent messages
+                      ROOM_HISTORY_SNAPSHOT_SIZE=100,
+                      # Expired and inactive rooms are moved here; defaults to
+                      # <instance>/room_archive
+                      ROOM_ARCHIVE_DIR=os.environ.get('ROOM_ARCHIVE_DIR'),
+                      ROOM_ARCHIVE_SEGMENT_SIZE=1000,
+                      # Snapshot + operation log of the room directory; defaults
+                      # to <instance>/rooms
+                      ROOM_STORE_DIR=os.environ.get('ROOM_STORE_DIR'),
+                      ROOM_STORE_SNAPSHOT_EVERY=10000,
+                      # Outbound packets queued per socket before the slow consumer
+                      # policy (drop_presence, snapshot or disconnect) applies
+                      OUTBOUND_QUEUE_POLICY=os.environ.get('OUTBOUND_QUEUE_POLICY',
+                                                           'drop_presence'),
+                      OUTBOUND_QUEUE_SOFT_LIMIT=200,
+                      OUTBOUND_QUEUE_HARD_LIMIT=1000,
+                      # (tokens per second, burst) per socket event, applied both
+                      # per socket and per user
+                      SOCKET_RATE_LIMITS={
+                          'message': (5, 10),
+                          'join': (1, 5),
+                          'mark_private_read': (2, 5),
+                          'typing': (2, 4)
+                      },
+                      # Refilled buckets are swept once a limiter holds this many
+                      RATE_LIMIT_PRUNE_THRESHOLD=10000,
+                      # Same (rate, burst) shape, applied per client IP and per
+                      # (client IP, submitted username) pair. 'login_user' is
+                      # one bucket per username across all clients, loose
+                      # enough that a guesser cannot lock the owner out for long
+                      AUTH_RATE_LIMITS={
+                          'login': (0.2, 10),
+                          'login_user': (0.5, 30),
+                          'register': (0.05, 5)
+                      },
+                      AUTH_RATE_LIMITS_ENABLED=os.environ.get('AUTH_RATE_LIMITS',
+                                                              'true').lower()
+                      in ('1', 'true'),
+                      # Proxies in front of the app whose X-Forwarded-For is
+                      # trusted for the client IP; 0 uses the socket peer
+                      PROXY_FIX_X_FOR=int(os.environ.get('PROXY_FIX_X_FOR', 0)),
+                      # Stored hashes with a different prefix are upgraded on the
+                      # next successful login
+                      PASSWORD_HASH_METHOD=os.environ.get('PASSWORD_HASH_METHOD',
+                                                          'scrypt:32768:8:1'),
+                      PASSWORD_HASH_WORKERS=int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+                      PASSWORD_HASH_QUEUE=16,
+                      # Members whose private room sets stay cached in memory
+                      ROOM_MEMBERSHIP_CACHE_SIZE=10000,
+                      # Guest room memberships are dropped by the compaction
+                      # run this long after joining
+                      GUEST_MEMBERSHIP_TTL_HOURS=int(
+                          os.environ.get('GUEST_MEMBERSHIP_TTL_HOURS', 7 * 24)),
+                      # Read marks for the same thread within this window are
+                      # applied and announced once
+                      READ_RECEIPT_FLUSH_MS=int(os.environ.get('READ_RECEIPT_FLUSH_MS', 250)),
+                      # A typing hint lasts this long unless refreshed; changes
+                      # within the coalesce window go out as one update
+                      TYPING_TTL_SECONDS=5.0,
+                      TYPING_COALESCE_MS=150,
+                      # Largest gap in a user's event stream replayed on reconnect;
+                      # clients further behind reload their DM threads instead
+                      USER_EVENT_MAX_BACKLOG=500,
+                      # Clients that offer `deflate` in their connect auth get
+                      # room_history and user_events documents of at least
+                      # SOCKET_DEFLATE_THRESHOLD bytes as zlib-compressed binary
+                      SOCKET_DEFLATE_ENABLED=os.environ.get('SOCKET_DEFLATE', 'false').lower()
+                      in ('1', 'true'),
+                      SOCKET_DEFLATE_THRESHOLD=1024,
+                      SOCKET_DEFLATE_LEVEL=6,
+                      # message_type -> days to keep (None keeps forever), e.g.
+                      # MESSAGE_RETENTION_DAYS="private=365,private_sticker=90"
+                      MESSAGE_RETENTION_DAYS=parse_retention_days(
+                          os.environ.get('MESSAGE_RETENTION_DAYS', '')),
+                      # Deleted messages are appended here as gzip JSON lines;
+                      # unset deletes them outright
+                      MESSAGE_ARCHIVE_DIR=os.environ.get('MESSAGE_ARCHIVE_DIR'),
+                      USER_EVENT_RETENTION_DAYS=30,
+                      COMPACTION_BATCH_SIZE=500,
+                      # Hours between background compaction runs; 0 disables
+                      # them (use `flask --app main compact` instead)
+                      COMPACTION_INTERVAL_HOURS=float(
+                          os.environ.get('COMPACTION_INTERVAL_HOURS', 24)),
+                      # Blobs, partial uploads and thumbnails; defaults to
+                      # instance/attachments
+                      ATTACHMENT_DIR=os.environ.get('ATTACHMENT_DIR'),
+                      ATTACHMENT_MAX_BYTES=int(os.environ.get('ATTACHMENT_MAX_BYTES',
+                                                              25 * 1024 * 1024)),
+                      # Largest chunk accepted per upload request
+                      ATTACHMENT_CHUNK_BYTES=1024 * 1024,
+                      ATTACHMENT_THUMBNAIL_SIZE=320,
+                      # Per user, across uploads that are open but not complete
+                      ATTACHMENT_MAX_OPEN_UPLOADS=10,
+                      ATTACHMENT_MAX_PENDING_BYTES=int(
+                          os.environ.get('ATTACHMENT_MAX_PENDING_BYTES', 100 * 1024 * 1024)),
+                      ATTACHMENT_WORKERS=2,
+                      # Unfinished uploads, and attachments no message refers
+                      # to, are dropped by the compaction run after this long
+                      ATTACHMENT_UPLOAD_TTL_HOURS=24,
+                      # Most parents returned when walking a reply chain
+                      REPLY_CHAIN_MAX_DEPTH=50)
+    if config:
+        app.config.update(config)
+
+    # Config logging
+    logging_preset = configure_logging(app.config['APP_ENV'],
+                                       level=app.config['LOG_LEVEL'],
+                                       output_format=app.config['LOG_FORMAT'])
+
+    # Handle reverse proxy headers
+    app.wsgi_app = ProxyFix(app.wsgi_app,
+                            x_for=app.config['PROXY_FIX_X_FOR'],
+                            x_proto=1,
+                            x_host=1)
+
+    db.init_app(app)
+    login_manager.init_app(app)
+
+    state = ChatState()
+    app.extensions['chat'] = state
+
+    def in_app_context(func):
+        # For callbacks that run on background tasks outside any request
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with app.app_context():
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    state.outbound_manager = outbound_manager = BackpressureManager(
+        policy=app.config['OUTBOUND_QUEUE_POLICY'],
+        soft_limit=app.config['OUTBOUND_QUEUE_SOFT_LIMIT'],
+        hard_limit=app.config['OUTBOUND_QUEUE_HARD_LIMIT'])
+    outbound_manager.presence_snapshot = in_app_context(lambda: ('active_users', {
+        'users': build_active_users_payload()
+    }))
+
+    # Initialize SocketIO with appropriate CORS settings
+    state.socketio = socketio = SocketIO(json=SocketJSON)
+    for event_name, handler in socket_handlers:
+        socketio.on(event_name)(handler)
+    socketio.init_app(app,
+                      cors_allowed_origins=app.config['CORS_ORIGINS'],
+                      client_manager=outbound_manager,
+                      logger=logging_preset['packet_logging'],
+                      engineio_logger=logging_preset['packet_logging'])
+
+    state.room_batcher = RoomBatcher(
+        socketio,
+        max_delay_ms=app.config['ROOM_BATCH_MAX_DELAY_MS'],
+        max_size=app.config['ROOM_BATCH_MAX_SIZE']
+    ) if app.config['ROOM_BATCHING_ENABLED'] else None
+    state.socket_rate_limiter = EventRateLimiter(
+        app.config['SOCKET_RATE_LIMITS'],
+        prune_threshold=app.config['RATE_LIMIT_PRUNE_THRESHOLD'])
+
+    state.message_compactor = MessageCompactor(app.config['MESSAGE_RETENTION_DAYS'],
+                                         event_retention_days=app.config['USER_EVENT_RETENTION_DAYS'],
+                                         batch_size=app.config['COMPACTION_BATCH_SIZE'],
+                                         archive_dir=app.config['MESSAGE_ARCHIVE_DIR'],
+                                         sleep=socketio.sleep)
+    state.user_events = UserEventLog(socketio, max_backlog=app.config['USER_EVENT_MAX_BACKLOG'])
+    state.typing_tracker = TypingTracker(socketio,
+                                         in_app_context(publish_typing),
+                                   ttl=app.config['TYPING_TTL_SECONDS'],
+                                   coalesce_ms=app.config['TYPING_COALESCE_MS'])
+    state.read_receipts = ReadReceiptAggregator(socketio,
+                                                in_app_context(apply_read_marks),
+                                          max_delay_ms=app.config['READ_RECEIPT_FLUSH_MS'])
+    state.auth_rate_limiter = EventRateLimiter(app.config['AUTH_RATE_LIMITS']
+                                         if app.config['AUTH_RATE_LIMITS_ENABLED'] else {},
+                                         prune_threshold=app.config['RATE_LIMIT_PRUNE_THRESHOLD'])
+    state.room_memberships = RoomMembershipStore(app.config['ROOM_MEMBERSHIP_CACHE_SIZE'])
+    state.password_hasher = PasswordHasher(app.config['PASSWORD_HASH_METHOD'],
+                                     max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                                     max_queue=app.config['PASSWORD_HASH_QUEUE'])
+    state.room_archive = RoomArchive(app.config['ROOM_ARCHIVE_DIR'] or
+                               os.path.join(app.instance_path, 'room_archive'),
+                               segment_size=app.config['ROOM_ARCHIVE_SEGMENT_SIZE'])
+    query_profiler.enabled = app.config['QUERY_PROFILER_ENABLED']
+    query_profiler.slow_query_ms = app.config['QUERY_PROFILER_SLOW_MS']
+    query_profiler.n_plus_one_threshold = app.config['QUERY_PROFILER_N_PLUS_ONE']
+    query_profiler.install()
+
+    state.attachment_store = AttachmentStore(app.config['ATTACHMENT_DIR'] or
+                                       os.path.join(app.instance_path, 'attachments'),
+                                       max_size=app.config['ATTACHMENT_MAX_BYTES'],
+                                       max_chunk=app.config['ATTACHMENT_CHUNK_BYTES'],
+                                       thumbnail_size=app.config['ATTACHMENT_THUMBNAIL_SIZE'],
+                                       workers=app.config['ATTACHMENT_WORKERS'],
+                                       max_open_uploads=app.config['ATTACHMENT_MAX_OPEN_UPLOADS'],
+                                       max_pending_bytes=app.config['ATTACHMENT_MAX_PENDING_BYTES'])
+    state.asset_manifest = AssetManifest.load(os.path.join(app.static_folder, 'dist'))
+
+    state.room_store = RoomStore(app.config['ROOM_STORE_DIR'] or
+                                 os.path.join(app.instance_path, 'rooms'),
+                                 state.room_directory,
+                           snapshot_every=app.config['ROOM_STORE_SNAPSHOT_EVERY'])
+
+    app.register_blueprint(chat)
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(compact_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(vendor_socketio_command)
+
+    with app.app_context():
+        load_room_directory()
+        for default_room in app.config['CHAT_ROOMS']:
+            add_room(default_room, is_public=True)
+        schema_version = current_schema_version(db.engine)
+    if schema_version < LATEST_SCHEMA_VERSION:
+        logger.warning(
+            'Database schema is at version %d but the app expects %d; '
+            'run `flask --app main migrate`', schema_version, LATEST_SCHEMA_VERSION)
+
+    logger.info('App created in %.1f ms', (time.perf_counter() - started_at) * 1000)
+    return app
+
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """Apply pending schema migrations."""
+    from migrations import upgrade
+
+    applied = upgrade(db.engine)
+    if applied:
+        print(f'Applied migrations: {", ".join(map(str, applied))}')
+    print(f'Schema is at version {current_schema_version(db.engine)}')
+
+
+@click.command('compact')
+@click.option('--enable-incremental-vacuum', is_flag=True,
+              help='Rewrite the database once so freed pages can be reclaimed online.')
+@with_appcontext
+def compact_command(enable_incremental_vacuum):
+    """Apply message retention and reclaim free database pages."""
+    from retention import enable_incremental_vacuum as enable_vacuum
+
+    if enable_incremental_vacuum:
+        enable_vacuum(db.engine)
+        print('Incremental VACUUM enabled')
+    report = message_compactor.run()
+    report['uploads_pruned'] = prune_attachment_uploads()
+    report['attachments_pruned'] = prune_attachments()
+    report['guest_memberships_pruned'] = prune_guest_memberships()
+    print(', '.join(f'{key}={value}' for key, value in report.items()))
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Build fingerprinted, precompressed assets into static/dist."""
+    from assets import build_assets
 
-    existing_columns = {column['name'] for column in inspector.get_columns('user')}
-    column_statements = {
-        'display_name': 'ALTER TABLE user ADD COLUMN display_name VARCHAR(80)',
-        'bio': 'ALTER TABLE user ADD COLUMN bio VARCHAR(500)',
-        'avatar_url': 'ALTER TABLE user ADD COLUMN avatar_url VARCHAR(255)',
-        'is_profile_complete': 'ALTER TABLE user ADD COLUMN is_profile_complete BOOLEAN NOT NULL DEFAULT 0'
-    }
+    try:
+        manifest = build_assets(current_app.static_folder)
+    except (FileNotFoundError, ValueError) as error:
+        raise click.ClickException(str(error))
+    print(f'Built {len(manifest)} assets into static/dist')
 
-    missing_statements = [
-        statement for column_name, statement in column_statements.items()
-        if column_name not in existing_columns
-    ]
 
-    if not missing_statements:
-        return
+@click.command('vendor-socketio')
+@with_appcontext
+def vendor_socketio_command():
+    """Download the pinned Socket.IO client into static/vendor and verify it."""
+    from assets import vendor_socketio_client
 
-    with db.engine.begin() as conn:
-        for statement in missing_statements:
-            conn.execute(text(statement))
+    try:
+        path = vendor_socketio_client(current_app.static_folder)
+    except (OSError, ValueError) as error:
+        raise click.ClickException(str(error))
+    print(f'Vendored Socket.IO client {SOCKETIO_CLIENT_VERSION} into {path}')
 
-with app.app_context():
-    db.create_all()
-    ensure_user_profile_columns()
 
-os.makedirs(os.path.join(app.static_folder, app.config['PROFILE_UPLOAD_FOLDER']),
-            exist_ok=True)
-    
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+def parse_retention_days(value: str) -> Dict[str, int | None]:
+    """Parse ``"private=365,private_sticker=90"``; types not listed (or
+    set to ``forever``) are kept forever."""
+    retention = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        message_type, _, days = item.partition('=')
+        days = days.strip().lower()
+        retention[message_type.strip()] = None if days in ('', 'forever') else int(days)
+    return retention
+
+
+def prune_attachment_uploads() -> int:
+    return attachment_store.prune_uploads(
+        timedelta(hours=current_app.config['ATTACHMENT_UPLOAD_TTL_HOURS']))
+
+
+def prune_attachments() -> int:
+    return attachment_store.prune_attachments(
+        timedelta(hours=current_app.config['ATTACHMENT_UPLOAD_TTL_HOURS']))
 
-# Initialize SocketIO with appropriate CORS settings
-socketio = SocketIO(app,
-                    cors_allowed_origins=app.config['CORS_ORIGINS'],
-                    logger=True,
-                    engineio_logger=True)
+
+def prune_guest_memberships() -> int:
+    return room_memberships.prune_guests(
+        timedelta(hours=current_app.config['GUEST_MEMBERSHIP_TTL_HOURS']))
+
+
+def start_compaction_loop(app: Flask) -> None:
+    """Start the periodic compaction task once per app.
+
+    Started from the first request rather than create_app so CLI commands,
+    benchmark seeding and tests that build an app never spawn the loop.
+    """
+    if app.extensions.get('compaction_loop') or app.config['COMPACTION_INTERVAL_HOURS'] <= 0:
+        return
+    app.extensions['compaction_loop'] = app.extensions['chat'].socketio.start_background_task(
+        run_compaction_loop, app, app.config['COMPACTION_INTERVAL_HOURS'] * 3600)
+
+
+def run_compaction_loop(app: Flask, interval: float) -> None:
+    while True:
+        app.extensions['chat'].socketio.sleep(interval)
+        with app.app_context():
+            try:
+                message_compactor.run()
+                prune_attachment_uploads()
+                prune_attachments()
+                prune_guest_memberships()
+            except Exception:
+                logger.exception('Message compaction failed')
+                db.session.rollback()
 
 
 # Login Loader
@@ -94,13 +519,7 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 
-# In-memory storage for active users
-# In production, consider using Redis or another distributed storage
-active_users: Dict[str, dict] = {}
-user_presence: Dict[int, str] = {}
-room_directory: Dict[str, dict] = {}
-room_code_index: Dict[str, str] = {}
-room_message_history: Dict[str, List[dict]] = {}
+CONVERSATION_PARTICIPANT_CACHE_SIZE = 10000
 MESSAGE_POLICIES = {'everyone', 'host_mods_only'}
 EXPIRATION_OPTIONS = {
     'never': None,
@@ -135,20 +554,21 @@ def save_profile_image(uploaded_file) -> str | None:
 
     _, ext = os.path.splitext(uploaded_file.filename)
     ext = ext.lower()
-    if ext not in app.config['PROFILE_UPLOAD_EXTENSIONS']:
+    if ext not in current_app.config['PROFILE_UPLOAD_EXTENSIONS']:
         return None
 
     safe_name = secure_filename(uploaded_file.filename)
     unique_name = f'{uuid.uuid4().hex}_{safe_name}'
-    relative_path = os.path.join(app.config['PROFILE_UPLOAD_FOLDER'], unique_name)
-    absolute_path = os.path.join(app.static_folder, relative_path)
+    relative_path = os.path.join(current_app.config['PROFILE_UPLOAD_FOLDER'], unique_name)
+    absolute_path = os.path.join(current_app.static_folder, relative_path)
+    os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
     uploaded_file.save(absolute_path)
     return relative_path.replace('\\', '/')
 
 
 def get_available_stickers() -> List[str]:
     """Return sticker file paths under static/stickers for rendering in the UI."""
-    stickers_dir = os.path.join(app.static_folder, 'stickers')
+    stickers_dir = os.path.join(current_app.static_folder, 'stickers')
 
     if not os.path.isdir(stickers_dir):
         logger.warning('Sticker directory does not exist: %s', stickers_dir)
@@ -167,7 +587,7 @@ def generate_room_code(length: int = 6) -> str:
     alphabet = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
     while True:
         code = ''.join(random.choices(alphabet, k=length))
-        if code not in room_code_index:
+        if code not in room_code_index and not room_archive.room_for_code(code):
             return code
 
 
@@ -188,7 +608,9 @@ def add_room(room_name: str,
         room_meta.setdefault('expires_at', None)
         room_meta.setdefault('last_activity_at', room_meta.get('created_at'))
         room_meta.setdefault('archive_on_inactive', 'none')
+        room_meta.setdefault('history_epoch', uuid.uuid4().hex[:12])
         room_message_history.setdefault(normalized_name, [])
+        room_history_frames.setdefault(normalized_name, [])
         return room_meta['code']
 
     if message_policy not in MESSAGE_POLICIES:
@@ -211,12 +633,35 @@ def add_room(room_name: str,
         'last_activity_at': now.isoformat(),
         'archive_on_inactive': archive_on_inactive,
         'message_policy': message_policy,
-        'moderators': []
+        'moderators': [],
+        # Changes whenever the room's sequence numbers restart, so clients
+        # can tell their cached cursor no longer applies
+        'history_epoch': uuid.uuid4().hex[:12]
     }
     room_code_index[code] = normalized_name
     room_message_history.setdefault(normalized_name, [])
+    room_history_frames.setdefault(normalized_name, [])
+    room_store.record_create(normalized_name)
     return code
 
+
+def load_room_directory() -> None:
+    """Rebuild the room directory and code index from the room store."""
+    started_at = time.perf_counter()
+    replayed = room_store.load()
+    # Message history is not persisted, so sequences restart under a new
+    # epoch; restored rooms continue after their archived messages
+    history_epoch = uuid.uuid4().hex[:12]
+    archived_seqs = room_archive.last_sequences()
+    room_code_index.clear()
+    for room_name, room_meta in room_directory.items():
+        room_code_index[room_meta['code']] = room_name
+        room_meta['history_epoch'] = history_epoch
+        if room_name in archived_seqs:
+            room_sequences[room_name] = archived_seqs[room_name]
+    logger.info('Loaded %d rooms (%d log entries replayed) in %.1f ms',
+                len(room_directory), replayed, (time.perf_counter() - started_at) * 1000)
+
 def parse_iso_datetime(value: str | None) -> datetime | None:
     if not value:
         return None
@@ -252,38 +697,183 @@ def remove_room(room_name: str) -> None:
     room_meta = room_directory.pop(room_name, None)
     if not room_meta:
         return
+    room_store.record_delete(room_name)
 
     room_code = room_meta.get('code')
     if room_code:
         room_code_index.pop(room_code, None)
     room_message_history.pop(room_name, None)
+    room_history_frames.pop(room_name, None)
+    room_sequences.pop(room_name, None)
+    if room_batcher:
+        room_batcher.discard(room_name)
 
 
-def append_room_history(room_name: str, payload: dict) -> None:
+def archive_room(room_name: str) -> None:
+    """Move an expired or inactive room's history to the on-disk archive and
+    drop the room from memory."""
+    room_meta = room_directory.get(room_name)
+    if not room_meta:
+        return
+
+    expires_at = parse_iso_datetime(room_meta.get('expires_at'))
+    reason = 'expired' if expires_at and datetime.now() >= expires_at else 'inactive'
+    messages = [(entry['seq'], frame.encoded) for entry, frame in zip(
+        room_message_history.get(room_name, []), room_history_frames.get(room_name, []))]
+    written = room_archive.archive(room_name, room_meta, messages,
+                                   room_sequences.get(room_name, 0), reason)
+    remove_room(room_name)
+    if reason == 'expired' and not room_meta.get('is_public'):
+        # Expired rooms are never restored, so their members are not needed;
+        # rooms archived for inactivity keep them for when they come back.
+        # Public rooms never have members.
+        room_memberships.remove_room(room_name)
+    logger.info('Archived room %s (%s, %d new messages)', room_name, reason, written)
+
+
+def restore_archived_room(room_name: str) -> bool:
+    """Bring a room archived for inactivity back into memory with its most
+    recent history. Rooms that expired stay archived and read-only."""
+    entry = room_archive.get(room_name)
+    if not entry or entry.get('reason') != 'inactive':
+        return False
+    restored = room_archive.restore(room_name,
+                                    current_app.config['ROOM_HISTORY_SNAPSHOT_SIZE'])
+    if restored is None:
+        return False
+
+    room_meta, frames, last_seq = restored
+    room_meta['last_activity_at'] = datetime.now().isoformat()
+    if room_meta.get('code') in room_code_index:
+        room_meta['code'] = generate_room_code()
+    room_directory[room_name] = room_meta
+    room_code_index[room_meta['code']] = room_name
+    room_store.record_create(room_name)
+    # Same epoch and sequence, so cursors held by clients stay valid
+    room_message_history[room_name] = [decode_json(frame.encoded) for frame in frames]
+    room_history_frames[room_name] = frames
+    room_sequences[room_name] = last_seq
+    logger.info('Restored archived room %s', room_name)
+    return True
+
+
+def append_room_history(room_name: str, payload: dict,
+                        frame: RawJSON | None = None) -> None:
     history = room_message_history.setdefault(room_name, [])
     history.append(payload)
+    room_history_frames.setdefault(room_name, []).append(
+        frame if frame is not None else encode_frame(payload))
 
 
-def emit_room_history(room_name: str) -> None:
+def find_room_message_index(room_name: str, seq: int | None) -> int | None:
+    """Position of message ``seq`` in the room's history, if it is there."""
+    if seq is None:
+        return None
     history = room_message_history.get(room_name, [])
-    emit('room_history', {'room': room_name, 'messages': history}, room=request.sid)
+    index = bisect.bisect_left(history, seq, key=lambda entry: entry['seq'])
+    if index < len(history) and history[index]['seq'] == seq:
+        return index
+    return None
 
 
+def get_conversation_participant_ids(conversation_id: int) -> tuple[int, ...]:
+    participant_ids = conversation_participant_cache.get(conversation_id)
+    if participant_ids is not None:
+        return participant_ids
+
+    participant_ids = tuple(
+        user_id for (user_id, ) in db.session.query(ConversationParticipant.user_id).filter(
+            ConversationParticipant.conversation_id == conversation_id))
+    if participant_ids:
+        if len(conversation_participant_cache) >= CONVERSATION_PARTICIPANT_CACHE_SIZE:
+            conversation_participant_cache.pop(next(iter(conversation_participant_cache)))
+        conversation_participant_cache[conversation_id] = participant_ids
+    return participant_ids
+
+
+def publish_typing(channel: Channel, users: List[str]) -> None:
+    """Send the current typing set for ``channel`` to everyone in it."""
+    if channel[0] == 'room':
+        socketio.emit('typing', {'room': channel[1], 'users': users}, to=channel[1])
+        return
+
+    _, conversation_id, participant_ids = channel
+    payload = {'conversation_id': conversation_id, 'users': users}
+    for user_id in participant_ids:
+        if user_id in user_presence:
+            socketio.emit('typing', payload, to=user_room(user_id))
+
+
+def emit_document(event: str, encoded: str) -> None:
+    """Send a pre-encoded JSON document to the current socket, deflated
+    when the client negotiated it and the document is large enough to gain
+    from compression."""
+    if (request.sid in deflate_sids and
+            len(encoded) >= current_app.config['SOCKET_DEFLATE_THRESHOLD']):
+        emit(event,
+             deflate(encoded, current_app.config['SOCKET_DEFLATE_LEVEL']),
+             room=request.sid)
+    else:
+        emit(event, RawJSON(encoded), room=request.sid)
+
+
+def broadcast_room_message(room_name: str, frame: RawJSON) -> None:
+    if room_batcher:
+        room_batcher.enqueue(room_name, frame)
+        return
+    emit('message', frame, room=room_name)
+
+
+def next_room_sequence(room_name: str) -> int:
+    sequence = room_sequences.get(room_name, 0) + 1
+    room_sequences[room_name] = sequence
+    return sequence
+
+
+def emit_room_history(room_name: str,
+                      since_seq: int | None = None,
+                      epoch: str | None = None) -> None:
+    """Send the messages a client is missing from ``room_name``.
+
+    Clients that present a cursor from the current history epoch get only the
+    messages after ``since_seq``. Everyone else, including clients whose gap
+    is larger than ROOM_HISTORY_SNAPSHOT_SIZE, gets a snapshot of the most
+    recent messages.
+    """
+    history = room_message_history.get(room_name, [])
+    frames = room_history_frames.get(room_name, [])
+    snapshot_size = current_app.config['ROOM_HISTORY_SNAPSHOT_SIZE']
+    current_epoch = room_directory.get(room_name, {}).get('history_epoch')
+    last_seq = room_sequences.get(room_name, 0)
+
+    mode = 'snapshot'
+    start = max(len(frames) - snapshot_size, 0)
+    if since_seq is not None and epoch == current_epoch and since_seq <= last_seq:
+        delta_start = bisect.bisect_right(history,
+                                          since_seq,
+                                          key=lambda entry: entry['seq'])
+        first_seq = history[0]['seq'] if history else last_seq + 1
+        if since_seq >= first_seq - 1 and len(frames) - delta_start <= snapshot_size:
+            mode = 'delta'
+            start = delta_start
+
+    encoded = ('{"room":' + encode_json(room_name) + ',"mode":"' + mode +
+               '","epoch":' + encode_json(current_epoch) + ',"last_seq":' +
+               str(last_seq) + ',"messages":' + join_frames(frames[start:]) + '}')
+    emit_document('room_history', encoded)
+
+
+@metrics.timed('function', 'cleanup_expired_rooms')
 def cleanup_expired_rooms() -> None:
     expired_rooms = [room_name for room_name in room_directory if is_room_expired(room_name)]
     for room_name in expired_rooms:
-        remove_room(room_name)
-
-    private_rooms = session.get('private_rooms')
-    if isinstance(private_rooms, list):
-        session['private_rooms'] = [
-            room_name for room_name in private_rooms if room_name in room_directory
-        ]
+        archive_room(room_name)
 
 
 def touch_room_activity(room_name: str) -> None:
     if room_name in room_directory:
         room_directory[room_name]['last_activity_at'] = datetime.now().isoformat()
+        room_store.record_activity(room_name)
 
 
 def get_public_rooms() -> List[str]:
@@ -293,42 +883,70 @@ def get_public_rooms() -> List[str]:
         if meta.get('is_public')
     ]
 
-# tes
+
+def get_member_key() -> str | None:
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    guest_token = session.get('guest_token')
+    return f'guest:{guest_token}' if guest_token else None
+
+
+def start_guest_session() -> None:
+    """Give the session a guest name and the random token its room
+    memberships are stored under."""
+    if 'username' not in session:
+        session['username'] = generate_guest_username()
+    session.setdefault('guest_token', uuid.uuid4().hex)
+
+
+def adopt_guest_memberships(guest_key: str | None) -> None:
+    """Move the rooms of the guest session that just logged in to the user."""
+    session.pop('guest_token', None)
+    if guest_key:
+        room_memberships.merge(guest_key, get_member_key())
+        room_memberships.remove_member(guest_key)
+
+
 def get_saved_private_rooms() -> List[str]:
-    cleanup_expired_rooms()
-    private_rooms = session.get('private_rooms', [])
-    if not isinstance(private_rooms, list):
+    member_key = get_member_key()
+    if not member_key:
         return []
 
+    legacy_rooms = session.pop('private_rooms', None)
+    if isinstance(legacy_rooms, list):
+        # Carry over rooms saved in the cookie before membership moved server-side
+        room_memberships.add_many(member_key, [
+            room_name for room_name in legacy_rooms if room_name in room_directory
+        ])
+
     return [
-        room_name for room_name in private_rooms if room_name in room_directory
+        room_name for room_name in room_memberships.rooms_for(member_key)
+        if room_name in room_directory
         and not room_directory[room_name].get('is_public', False)
     ]
 
 
 def save_private_room(room_name: str) -> None:
-    if room_name not in room_directory:
-        return
-
-    room_meta = room_directory.get(room_name, {})
-    if room_meta.get('is_public', False):
+    room_meta = room_directory.get(room_name)
+    member_key = get_member_key()
+    if not room_meta or room_meta.get('is_public', False) or not member_key:
         return
+    room_memberships.add(member_key, room_name)
 
-    private_rooms = get_saved_private_rooms()
-    if room_name in private_rooms:
-        return
 
-    private_rooms.append(room_name)
-    session['private_rooms'] = private_rooms
+def can_access_room(room_name: str) -> bool:
+    room_meta = room_directory.get(room_name)
+    if not room_meta:
+        return False
+    if room_meta.get('is_public', False):
+        return True
+    member_key = get_member_key()
+    return bool(member_key) and room_memberships.is_member(member_key, room_name)
 
 
 def get_rooms_for_sidebar() -> List[str]:
     cleanup_expired_rooms()
-    rooms = list(get_public_rooms())
-    for private_room in get_saved_private_rooms():
-        if private_room not in rooms:
-            rooms.append(private_room)
-    return rooms
+    return get_public_rooms() + sorted(get_saved_private_rooms())
 
 
 
@@ -420,14 +1038,40 @@ def get_or_create_direct_conversation(sender_id: int,
                                 user_id=recipient_id)
     ])
     db.session.flush()
+    participants = [{
+        'id': user_id,
+        'username': username
+    } for user_id, username in db.session.query(User.id, User.username).filter(
+        User.id.in_(participant_ids))]
+    user_events.append('conversation', {
+        'conversation_id': conversation.id,
+        'participants': participants
+    }, participant_ids)
     return conversation
 
 
-def find_active_user_sid(username: str) -> str | None:
-    for sid, user_data in active_users.items():
-        if user_data.get('username') == username:
-            return sid
-    return None
+def parse_reply_to_id(data: dict) -> int | None:
+    # Older clients send the whole quoted message; only its id is used
+    value = data.get('reply_to_id')
+    if value is None and isinstance(data.get('reply_to'), dict):
+        value = data['reply_to'].get('id')
+    try:
+        reply_to_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return reply_to_id if reply_to_id > 0 else None
+
+
+def format_message_id(message_id: int | None) -> str | None:
+    return str(message_id) if message_id is not None else None
+
+
+def resolve_private_reply(conversation_id: int, reply_to_id: int | None) -> int | None:
+    """``reply_to_id`` if it is a message in the conversation, else None."""
+    if reply_to_id is None:
+        return None
+    return db.session.query(Message.id).filter(
+        Message.id == reply_to_id, Message.conversation_id == conversation_id).scalar()
 
 
 def get_message_status(message: Message) -> str:
@@ -438,8 +1082,41 @@ def get_message_status(message: Message) -> str:
     return 'sent'
 
 
+def serialize_attachment(attachment: Attachment) -> dict:
+    return {
+        'id': attachment.id,
+        'filename': attachment.filename,
+        'content_type': attachment.content_type,
+        'size': attachment.size,
+        'url': url_for('chat.download_attachment', attachment_id=attachment.id),
+        'thumbnail_url': url_for('chat.attachment_thumbnail', attachment_id=attachment.id)
+        if attachment.content_type in IMAGE_TYPES else None
+    }
+
+
+def get_message_attachments(messages: List[Message]) -> Dict[int, Attachment]:
+    attachment_ids = {message.attachment_id for message in messages if message.attachment_id}
+    if not attachment_ids:
+        return {}
+    return {
+        attachment.id: attachment
+        for attachment in Attachment.query.filter(Attachment.id.in_(attachment_ids))
+    }
+
+
+def can_access_attachment(attachment: Attachment, user_id: int) -> bool:
+    if attachment.uploader_id == user_id:
+        return True
+    return db.session.query(Message.id).join(
+        ConversationParticipant,
+        ConversationParticipant.conversation_id == Message.conversation_id).filter(
+            Message.attachment_id == attachment.id,
+            ConversationParticipant.user_id == user_id).first() is not None
+
+
 def serialize_private_message(message: Message, sender: User,
-                              recipient: User) -> dict:
+                              recipient: User,
+                              attachment: Attachment | None = None) -> dict:
     return {
         'id': str(message.id),
         'conversation_id': message.conversation_id,
@@ -448,15 +1125,49 @@ def serialize_private_message(message: Message, sender: User,
         'to': recipient.username,
         'message_type': message.message_type,
         'file': message.sticker_file,
-        'timestamp': message.created_at.isoformat(),
-        'delivered_at': message.delivered_at.isoformat()
-        if message.delivered_at else None,
-        'read_at': message.read_at.isoformat() if message.read_at else None,
+        'timestamp': to_epoch_ms(message.created_at),
+        'delivered_at': to_epoch_ms(message.delivered_at),
+        'read_at': to_epoch_ms(message.read_at),
         'status': get_message_status(message),
+        'reply_to_id': format_message_id(message.reply_to_id),
+        'attachment': serialize_attachment(attachment) if attachment else None,
         'avatar_url': get_user_avatar_path(sender)
     }
 
 
+@metrics.timed('function', 'emit_user_event_backlog')
+def emit_user_event_backlog(user: User, since_seq: int | None) -> None:
+    """Bring a connecting device up to date from its last event sequence.
+
+    Devices without a usable cursor (first connect, or too far behind) get
+    the undelivered-message scan and a ``resync`` so they reload their
+    threads; either way the reply carries the sequence to resume from.
+    """
+    backlog = user_events.backlog(user.id, since_seq) if since_seq is not None else None
+    if backlog is None:
+        emit_missed_private_messages(user)
+        if since_seq is not None:
+            emit('resync', {'reason': 'event_backlog'}, room=request.sid)
+        emit('user_events', {
+            'events': [],
+            'last_seq': user_events.last_seq(user.id)
+        },
+             room=request.sid)
+        return
+
+    encoded_events, last_seq = backlog
+    emit_document('user_events',
+                  '{"events":' + encoded_events + ',"last_seq":' + str(last_seq) + '}')
+    # The replayed messages are delivered now; only rows still undelivered
+    # match, so this touches no more than what was missed
+    Message.query.filter(Message.recipient_id == user.id,
+                         Message.delivered_at.is_(None)).update(
+                             {Message.delivered_at: datetime.utcnow()},
+                             synchronize_session=False)
+    db.session.commit()
+
+
+@metrics.timed('function', 'emit_missed_private_messages')
 def emit_missed_private_messages(user: User) -> None:
     pending_messages = Message.query.filter(
         Message.recipient_id == user.id, Message.delivered_at.is_(None)).order_by(
@@ -471,12 +1182,15 @@ def emit_missed_private_messages(user: User) -> None:
         for sender in User.query.filter(User.id.in_(sender_ids)).all()
     }
 
+    attachments = get_message_attachments(pending_messages)
     batch = []
     for message in pending_messages:
         sender = sender_lookup.get(message.sender_id)
         if not sender:
             continue
-        batch.append(serialize_private_message(message, sender, user))
+        batch.append(
+            serialize_private_message(message, sender, user,
+                                      attachments.get(message.attachment_id)))
 
     if not batch:
         return
@@ -488,45 +1202,78 @@ def emit_missed_private_messages(user: User) -> None:
     db.session.commit()
 
 
-def mark_conversation_as_read(reader: User, conversation_id: int) -> dict | None:
-    participant = ConversationParticipant.query.filter_by(
-        conversation_id=conversation_id, user_id=reader.id).first()
-    if not participant:
-        return None
+def apply_read_marks(marks: ReadMarks) -> None:
+    """Mark every unread message up to each high-water id read with a single
+    UPDATE, then log one ``private_messages_read`` batch per sender and one
+    ack per reader."""
+    now = datetime.utcnow()
+    read_at = to_epoch_ms(now)
+    message_ids: list[int] = []
+    receipts_by_sender: Dict[int, list[dict]] = {}
+    acks: list[tuple[int, dict]] = []
+    reader_names = dict(
+        db.session.query(User.id, User.username).filter(
+            User.id.in_({reader_id for reader_id, _ in marks})))
+
+    for (reader_id, conversation_id), up_to_id in marks.items():
+        # recipient_id == reader already limits this to the reader's own
+        # inbound messages, so no participant lookup is needed
+        query = db.session.query(Message.id, Message.sender_id).filter(
+            Message.conversation_id == conversation_id,
+            Message.recipient_id == reader_id,
+            Message.read_at.is_(None))
+        if up_to_id is not None:
+            query = query.filter(Message.id <= up_to_id)
+        rows = query.all()
+        if not rows:
+            continue
 
-    unread_messages = Message.query.filter(
-        Message.conversation_id == conversation_id,
-        Message.recipient_id == reader.id,
-        Message.read_at.is_(None)).all()
+        by_sender: Dict[int, list[int]] = {}
+        for message_id, sender_id in rows:
+            by_sender.setdefault(sender_id, []).append(message_id)
+            message_ids.append(message_id)
+        for sender_id, ids in by_sender.items():
+            receipts_by_sender.setdefault(sender_id, []).append({
+                'conversation_id': conversation_id,
+                'reader_id': reader_id,
+                'reader_username': reader_names.get(reader_id),
+                'message_ids': ids,
+                'up_to_id': max(ids),
+                'read_at': read_at
+            })
+        acks.append((reader_id, {
+            'conversation_id': conversation_id,
+            'updated': len(rows),
+            'read_at': read_at,
+            'message_ids': [message_id for message_id, _ in rows]
+        }))
 
-    if not unread_messages:
-        return {'updated': 0, 'read_at': None, 'message_ids': []}
+    if not message_ids:
+        return
 
-    now = datetime.utcnow()
-    sender_ids: set[int] = set()
-    message_ids: list[int] = []
-    for message in unread_messages:
-        if not message.delivered_at:
-            message.delivered_at = now
-        message.read_at = now
-        sender_ids.add(message.sender_id)
-        message_ids.append(message.id)
+    Message.query.filter(Message.id.in_(message_ids)).update(
+        {
+            Message.read_at: now,
+            Message.delivered_at: db.func.coalesce(Message.delivered_at, now)
+        },
+        synchronize_session=False)
+    # Committed together with the update; the ack reaches every tab of the
+    # reader so their unread counts agree
+    user_events.append_many(
+        [('private_messages_read', {'receipts': receipts}, [sender_id])
+         for sender_id, receipts in receipts_by_sender.items()] +
+        [('mark_private_read_ack', ack, [reader_id]) for reader_id, ack in acks])
 
-    db.session.commit()
 
-    receipt_payload = {
-        'conversation_id': conversation_id,
-        'reader_id': reader.id,
-        'reader_username': reader.username,
-        'message_ids': message_ids,
-        'read_at': now.isoformat()
-    }
-    for sender_id in sender_ids:
-        sender_sid = user_presence.get(sender_id)
-        if sender_sid:
-            emit('private_messages_read', receipt_payload, room=sender_sid)
+def parse_read_mark(data: dict) -> tuple[int, int | None] | None:
+    """``(conversation_id, up_to_id)`` from a read mark payload, or None."""
+    try:
+        conversation_id = int(data.get('conversation_id'))
+        up_to_id = data.get('up_to_id')
+        return conversation_id, int(up_to_id) if up_to_id is not None else None
+    except (TypeError, ValueError):
+        return None
 
-    return {'updated': len(message_ids), 'read_at': now.isoformat(), 'message_ids': message_ids}
 
 def get_room_message_policy(room_name: str) -> str:
     return room_directory.get(room_name, {}).get('message_policy', 'everyone')
@@ -558,19 +1305,143 @@ def emit_room_state(room_name: str, username: str) -> None:
          room=request.sid)
 
 
-for default_room in app.config['CHAT_ROOMS']:
-    add_room(default_room, is_public=True)
-
 CHAT_PROTECTED_ENDPOINTS = {
-    'index',
-    'create_room_page',
-    'create_room',
-    'delete_room',
-    'join_room_by_code'
+    'chat.index',
+    'chat.create_room_page',
+    'chat.create_room',
+    'chat.delete_room',
+    'chat.join_room_by_code'
 }
 
 
-@app.before_request
+@chat.before_app_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+    start_compaction_loop(current_app._get_current_object())
+    query_profiler.begin(f'http {request.endpoint}')
+
+
+@chat.after_app_request
+def record_request_latency(response):
+    started_at = g.pop('request_started_at', None)
+    if started_at is not None:
+        metrics.observe('http', request.endpoint or 'unmatched',
+                        time.perf_counter() - started_at,
+                        error=response.status_code >= 500)
+    query_profiler.finish()
+    return response
+
+
+@chat.teardown_app_request
+def record_failed_request(exc):
+    # after_request is skipped when a view raises, so the timer is still set
+    started_at = g.pop('request_started_at', None)
+    if started_at is not None:
+        metrics.observe('http', request.endpoint or 'unmatched',
+                        time.perf_counter() - started_at,
+                        error=True)
+    query_profiler.finish()
+
+
+metrics.register_gauge('active_sockets', 'Connected Socket.IO clients.',
+                       lambda: len(active_users))
+metrics.register_gauge('rooms', 'Rooms in the room directory.',
+                       lambda: len(room_directory))
+metrics.register_gauge('room_history_messages',
+                       'Room messages held in memory across all rooms.',
+                       lambda: sum(len(history)
+                                   for history in room_message_history.values()))
+metrics.register_gauge('read_marks_pending',
+                       'Private read marks waiting for the next receipt flush.',
+                       lambda: read_receipts.pending)
+metrics.register_gauge('compaction_bytes_reclaimed',
+                       'Bytes returned to the filesystem by the last compaction run.',
+                       lambda: message_compactor.last_report.get('bytes_reclaimed', 0))
+metrics.register_gauge('password_hashes_in_flight',
+                       'Password hashes queued or running in the hashing pool.',
+                       lambda: password_hasher.in_flight)
+metrics.register_gauge('outbound_dropped_packets',
+                       'Packets skipped for backlogged sockets since start.',
+                       lambda: outbound_manager.dropped_packets)
+metrics.register_gauge('slow_consumer_disconnects',
+                       'Sockets disconnected for exceeding the outbound queue limit.',
+                       lambda: outbound_manager.slow_disconnects)
+metrics.register_gauge('outbound_queued_bytes',
+                       'Bytes waiting in outbound queues across all sockets.',
+                       lambda: outbound_manager.queue_summary()['bytes'])
+metrics.register_gauge('outbound_queued_bytes_max',
+                       'Bytes queued for the most backlogged socket.',
+                       lambda: outbound_manager.queue_summary()['max_bytes'])
+metrics.register_gauge('outbound_backlogged_sockets',
+                       'Sockets with packets waiting in their outbound queue.',
+                       lambda: outbound_manager.queue_summary()['backlogged'])
+
+
+def asset_url(filename: str) -> str:
+    """URL of a file under static/, fingerprinted when it has been built."""
+    built = asset_manifest.get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('chat.asset', filename=built)
+
+
+@chat.app_context_processor
+def inject_asset_url():
+    return {
+        'asset_url': asset_url,
+        'socketio_client_path': SOCKETIO_CLIENT_PATH,
+        'socketio_client_integrity': SOCKETIO_CLIENT_INTEGRITY
+    }
+
+
+@chat.route('/assets/<path:filename>')
+def asset(filename):
+    name, encoding = precompressed_variant(asset_manifest.dist_dir, filename,
+                                           request.accept_encodings)
+    response = send_from_directory(asset_manifest.dist_dir,
+                                   name,
+                                   mimetype=mimetypes.guess_type(filename)[0],
+                                   max_age=365 * 24 * 3600)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@chat.route('/metrics')
+def metrics_endpoint():
+    if not current_app.config['METRICS_ENABLED']:
+        return {'error': 'Metrics are disabled.'}, 404
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                   f'Bearer {token}'):
+            return {'error': 'Not found.'}, 404
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        return {'error': 'Not found.'}, 404
+    return current_app.response_class(metrics.render(),
+                              mimetype='text/plain; version=0.0.4')
+
+
+@chat.route('/debug/query-profiler', methods=['POST'])
+def toggle_query_profiler():
+    token = current_app.config['QUERY_PROFILER_TOKEN']
+    if not token or not hmac.compare_digest(request.headers.get('X-Profiler-Token', ''),
+                                            token):
+        return {'error': 'Not found.'}, 404
+
+    enabled = request.form.get('enabled', '').strip().lower()
+    if enabled not in ('true', 'false'):
+        return {'error': 'enabled must be true or false.'}, 400
+
+    query_profiler.enabled = enabled == 'true'
+    logger.info('Query profiler %s', 'enabled' if query_profiler.enabled else 'disabled')
+    return {'enabled': query_profiler.enabled}
+
+
+@chat.before_app_request
 def enforce_profile_completion():
     if not current_user.is_authenticated:
         return None
@@ -584,30 +1455,62 @@ def enforce_profile_completion():
     if request.endpoint == 'static':
         return None
 
-    allowed_endpoints = {'onboarding', 'logout', 'login', 'register'}
+    allowed_endpoints = {'chat.onboarding', 'chat.logout', 'chat.login', 'chat.register'}
     if request.endpoint in allowed_endpoints:
         return None
 
     if request.endpoint in CHAT_PROTECTED_ENDPOINTS:
-        return redirect(url_for('onboarding'))
+        return redirect(url_for('chat.onboarding'))
 
     return None
 
+def get_rate_limit_key() -> int | str | None:
+    if current_user.is_authenticated:
+        return current_user.id
+    return session.get('username')
+
+
+def rate_limited(event_name: str, silent: bool = False):
+    """Skip a socket handler and report an error when the sender is over
+    the configured limit for ``event_name``. ``silent`` handlers are skipped
+    without the error, for hints that are fine to lose."""
+
+    def decorator(handler):
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            if not socket_rate_limiter.allow(event_name, request.sid,
+                                             get_rate_limit_key()):
+                if silent:
+                    return None
+                emit('message_error', {
+                    'error': 'You are sending too quickly. Please slow down.',
+                    'event': event_name,
+                    'rate_limited': True
+                },
+                     room=request.sid)
+                return None
+            return handler(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
 def generate_guest_username() -> str:
     """Generate a unique guest username with timestamp to avoid collisions"""
     timestamp = datetime.now().strftime('%H%M')
     return f'Guest{timestamp}{random.randint(1000,9999)}'
 
 
-@app.route('/')
+@chat.route('/')
 def index():
     cleanup_expired_rooms()
     if current_user.is_authenticated:
         username = current_user.username
 
     else:
-        if 'username' not in session:
-            session['username'] = generate_guest_username()
+        start_guest_session()
         username = session['username']
 
     return render_template('index.html',
@@ -621,13 +1524,13 @@ def index():
                            profile_username=current_user.username if current_user.is_authenticated else username)
 
 
-@app.route('/create-room')
+@chat.route('/create-room')
 def create_room_page():
     cleanup_expired_rooms()
     return render_template('create_room.html')
 
 
-@app.route('/api/rooms', methods=['POST'])
+@chat.route('/api/rooms', methods=['POST'])
 def create_room():
     cleanup_expired_rooms()
     room_name = request.form.get('room_name', '').strip()
@@ -651,6 +1554,8 @@ def create_room():
         return {'error': 'Invalid expires_in setting'}, 400
     if archive_on_inactive not in INACTIVITY_OPTIONS:
         return {'error': 'Invalid archive_on_inactive setting'}, 400
+    if room_name not in room_directory and room_archive.is_archived(room_name):
+        return {'error': 'An archived room already uses this name'}, 409
 
     created_by = current_user.username if current_user.is_authenticated else session.get(
         'username', 'Guest')
@@ -671,7 +1576,7 @@ def create_room():
             'expires_at': room_directory[room_name].get('expires_at')}
 
 
-@app.route('/api/rooms/delete', methods=['POST'])
+@chat.route('/api/rooms/delete', methods=['POST'])
 def delete_room():
     cleanup_expired_rooms()
     room_name = request.form.get('room_name', '').strip()
@@ -687,10 +1592,12 @@ def delete_room():
         return {'error': 'Only the room creator can delete this room'}, 403
 
     remove_room(room_name)
+    room_archive.delete(room_name)
+    room_memberships.remove_room(room_name)
     return {'deleted': room_name}
 
 
-@app.route('/api/rooms/join', methods=['POST'])
+@chat.route('/api/rooms/join', methods=['POST'])
 def join_room_by_code():
     cleanup_expired_rooms()
     room_code = request.form.get('room_code', '').strip().upper()
@@ -699,11 +1606,15 @@ def join_room_by_code():
 
     room_name = room_code_index.get(room_code)
     if not room_name:
-        return {'error': 'Invalid room code'}, 404
+        room_name = room_archive.room_for_code(room_code)
+        if not room_name:
+            return {'error': 'Invalid room code'}, 404
+        if not restore_archived_room(room_name):
+            return {'error': 'This room has expired'}, 410
 
     room_info = room_directory.get(room_name, {})
     if is_room_expired(room_name):
-        remove_room(room_name)
+        archive_room(room_name)
         return {'error': 'This room has expired'}, 410
 
     if not room_info.get('is_public', False):
@@ -717,7 +1628,33 @@ def join_room_by_code():
     }
 
 
-@app.route('/api/users', methods=['GET'])
+@chat.route('/api/rooms/archive', methods=['GET'])
+def read_room_archive():
+    room_name = request.args.get('room', '').strip()
+    entry = room_archive.get(room_name) if room_name else None
+    if not entry:
+        return {'error': 'Archived room not found'}, 404
+
+    room_meta = entry['meta']
+    if not room_meta.get('is_public') and request.args.get(
+            'code', '').strip().upper() != room_meta.get('code'):
+        return {'error': 'Archived room not found'}, 404
+
+    before_seq = request.args.get('before_seq', type=int)
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    frames = room_archive.read(room_name, before_seq=before_seq, limit=limit)
+    first_seq = decode_json(frames[0].encoded)['seq'] if frames else None
+    has_more = first_seq is not None and first_seq > entry['segments'][0]['first_seq']
+
+    encoded = ('{"room":' + encode_json(room_name) + ',"state":' +
+               encode_json(entry['state']) + ',"reason":' + encode_json(entry['reason']) +
+               ',"messages":' + join_frames(frames) + ',"has_more":' +
+               encode_json(has_more) + ',"next_before_seq":' +
+               encode_json(first_seq if has_more else None) + '}')
+    return current_app.response_class(encoded, mimetype='application/json')
+
+
+@chat.route('/api/users', methods=['GET'])
 @login_required
 def list_chat_users():
     search_query = request.args.get('q', '').strip()
@@ -740,7 +1677,7 @@ def list_chat_users():
     }
 
 
-@app.route('/api/private-chats/start', methods=['POST'])
+@chat.route('/api/private-chats/start', methods=['POST'])
 @login_required
 def start_private_chat():
     payload = request.get_json(silent=True) or request.form
@@ -774,7 +1711,7 @@ def start_private_chat():
     }
 
 
-@app.route('/api/private-chats', methods=['GET'])
+@chat.route('/api/private-chats', methods=['GET'])
 @login_required
 def list_private_chats():
     participant_rows = db.session.query(ConversationParticipant.conversation_id).filter(
@@ -810,9 +1747,9 @@ def list_private_chats():
     for conversation_id, latest_message in rows:
         partner = get_private_conversation_partner(conversation_id, current_user.id)
         preview = ''
-        updated_at = datetime.utcnow().isoformat()
+        updated_at = to_epoch_ms(datetime.utcnow())
         if latest_message:
-            updated_at = latest_message.created_at.isoformat()
+            updated_at = to_epoch_ms(latest_message.created_at)
             if latest_message.message_type == 'private_sticker':
                 preview = '📎 Sticker'
             else:
@@ -828,12 +1765,38 @@ def list_private_chats():
             'unread_count': unread_by_conversation.get(conversation_id, 0)
         })
 
-    threads.sort(key=lambda thread: thread.get('updated_at', ''), reverse=True)
+    threads.sort(key=lambda thread: thread['updated_at'], reverse=True)
     return {'threads': threads}
 
 
 
-@app.route('/api/private-chats/<int:conversation_id>/messages', methods=['GET'])
+def serialize_history_messages(rows: list) -> List[dict]:
+    """Serialize ``(Message, sender username, sender display name)`` rows
+    for the DM history endpoints."""
+    attachments = get_message_attachments([message for message, _, _ in rows])
+    messages = []
+    for message, sender_username, sender_display_name in rows:
+        attachment = attachments.get(message.attachment_id)
+        messages.append({
+            'id': message.id,
+            'conversation_id': message.conversation_id,
+            'sender_id': message.sender_id,
+            'sender_username': sender_username,
+            'sender_display_name': sender_display_name,
+            'body': message.body,
+            'message_type': message.message_type,
+            'sticker_file': message.sticker_file,
+            'reply_to_id': message.reply_to_id,
+            'attachment': serialize_attachment(attachment) if attachment else None,
+            'created_at': to_epoch_ms(message.created_at),
+            'delivered_at': to_epoch_ms(message.delivered_at),
+            'read_at': to_epoch_ms(message.read_at),
+            'status': get_message_status(message)
+        })
+    return messages
+
+
+@chat.route('/api/private-chats/<int:conversation_id>/messages', methods=['GET'])
 @login_required
 def private_chat_messages(conversation_id: int):
     member = ConversationParticipant.query.filter_by(
@@ -875,22 +1838,7 @@ def private_chat_messages(conversation_id: int):
         rows.reverse()
 
     partner = get_private_conversation_partner(conversation_id, current_user.id)
-    messages = []
-    for message, sender_username, sender_display_name in rows:
-        messages.append({
-            'id': message.id,
-            'conversation_id': conversation_id,
-            'sender_id': message.sender_id,
-            'sender_username': sender_username,
-            'sender_display_name': sender_display_name,
-            'body': message.body,
-            'message_type': message.message_type,
-            'sticker_file': message.sticker_file,
-            'created_at': message.created_at.isoformat(),
-            'delivered_at': message.delivered_at.isoformat() if message.delivered_at else None,
-            'read_at': message.read_at.isoformat() if message.read_at else None,
-            'status': get_message_status(message)
-        })
+    messages = serialize_history_messages(rows)
 
     next_cursor = None
     if has_more and messages:
@@ -914,22 +1862,240 @@ def private_chat_messages(conversation_id: int):
     }
 
 
-@app.route('/api/private-chats/<int:conversation_id>/read', methods=['POST'])
+@chat.route('/api/private-chats/<int:conversation_id>/messages/<int:message_id>/thread',
+            methods=['GET'])
 @login_required
-def mark_private_chat_read(conversation_id: int):
-    result = mark_conversation_as_read(current_user, conversation_id)
-    if result is None:
+def private_chat_thread(conversation_id: int, message_id: int):
+    """Messages around ``message_id`` (``mode=context``), or the chain of
+    messages it replies to, oldest first (``mode=chain``)."""
+    member = ConversationParticipant.query.filter_by(
+        conversation_id=conversation_id, user_id=current_user.id).first()
+    if not member:
         return {'error': 'Conversation not found.'}, 404
 
+    mode = request.args.get('mode', 'context').strip().lower()
+    if mode not in ('context', 'chain'):
+        return {'error': 'Invalid mode. Use context or chain.'}, 400
+
+    query = db.session.query(Message, User.username, User.display_name).join(
+        User, User.id == Message.sender_id).filter(
+            Message.conversation_id == conversation_id)
+
+    if mode == 'context':
+        before = max(0, min(request.args.get('before', 20, type=int), 100))
+        after = max(0, min(request.args.get('after', 20, type=int), 100))
+        # Two range scans on the primary key, one each way from the target
+        older = query.filter(Message.id < message_id).order_by(
+            Message.id.desc()).limit(before).all() if before else []
+        newer = query.filter(Message.id >= message_id).order_by(
+            Message.id.asc()).limit(after + 1).all()
+        if not newer or newer[0][0].id != message_id:
+            return {'error': 'Message not found.'}, 404
+        rows = older[::-1] + newer
+    else:
+        # Walk reply_to_id upwards in one recursive query; the conversation
+        # check at each step keeps the walk inside this conversation
+        chain = text('WITH RECURSIVE chain(id, reply_to_id, depth) AS ('
+                     'SELECT id, reply_to_id, 0 FROM message '
+                     'WHERE id = :message_id AND conversation_id = :conversation_id '
+                     'UNION ALL SELECT m.id, m.reply_to_id, chain.depth + 1 '
+                     'FROM message m JOIN chain ON m.id = chain.reply_to_id '
+                     'WHERE m.conversation_id = :conversation_id AND chain.depth < :max_depth) '
+                     'SELECT id FROM chain')
+        chain_ids = [
+            row_id for (row_id, ) in db.session.execute(
+                chain, {
+                    'message_id': message_id,
+                    'conversation_id': conversation_id,
+                    'max_depth': current_app.config['REPLY_CHAIN_MAX_DEPTH']
+                })
+        ]
+        if not chain_ids:
+            return {'error': 'Message not found.'}, 404
+        rows = query.filter(Message.id.in_(chain_ids)).order_by(Message.id.asc()).all()
+
     return {
         'conversation_id': conversation_id,
-        'updated': result['updated'],
-        'read_at': result['read_at'],
-        'message_ids': result['message_ids']
+        'message_id': message_id,
+        'mode': mode,
+        'messages': serialize_history_messages(rows)
+    }
+
+
+@chat.route('/api/rooms/thread', methods=['GET'])
+def room_thread():
+    """Room messages around ``seq`` (``mode=context``), or the chain of
+    messages it replies to (``mode=chain``), from the in-memory history."""
+    room_name = request.args.get('room', '').strip()
+    seq = request.args.get('seq', type=int)
+    if not room_name or not can_access_room(room_name):
+        return {'error': 'Room not found.'}, 404
+
+    mode = request.args.get('mode', 'context').strip().lower()
+    if mode not in ('context', 'chain'):
+        return {'error': 'Invalid mode. Use context or chain.'}, 400
+
+    index = find_room_message_index(room_name, seq)
+    if index is None:
+        return {'error': 'Message not found.'}, 404
+    frames = room_history_frames.get(room_name, [])
+
+    if mode == 'context':
+        before = max(0, min(request.args.get('before', 20, type=int), 100))
+        after = max(0, min(request.args.get('after', 20, type=int), 100))
+        selected = frames[max(index - before, 0):index + after + 1]
+    else:
+        history = room_message_history[room_name]
+        indexes = [index]
+        for _ in range(current_app.config['REPLY_CHAIN_MAX_DEPTH']):
+            parent = history[indexes[-1]].get('reply_to_id')
+            parent_index = find_room_message_index(room_name,
+                                                   int(parent) if parent else None)
+            if parent_index is None:
+                break
+            indexes.append(parent_index)
+        selected = [frames[position] for position in reversed(indexes)]
+
+    encoded = ('{"room":' + encode_json(room_name) + ',"seq":' + str(seq) + ',"mode":"' +
+               mode + '","messages":' + join_frames(selected) + '}')
+    return current_app.response_class(encoded, mimetype='application/json')
+
+
+@chat.route('/api/private-chats/<int:conversation_id>/read', methods=['POST'])
+@login_required
+def mark_private_chat_read(conversation_id: int):
+    # Fallback for clients without a socket; applied with the socket marks
+    read_mark = parse_read_mark({
+        'conversation_id': conversation_id,
+        'up_to_id': (request.get_json(silent=True) or {}).get('up_to_id')
+    })
+    if read_mark is None:
+        return {'error': 'Invalid message id.'}, 400
+
+    read_receipts.mark(current_user.id, *read_mark)
+    return {'conversation_id': conversation_id, 'queued': True}, 202
+
+
+def get_own_upload(upload_id: str) -> AttachmentUpload | None:
+    return AttachmentUpload.query.filter_by(id=upload_id, user_id=current_user.id).first()
+
+
+@chat.route('/api/attachments/uploads', methods=['POST'])
+@login_required
+def begin_attachment_upload():
+    data = request.get_json(silent=True) or {}
+    size = data.get('size')
+    if not isinstance(size, int) or isinstance(size, bool):
+        return {'error': 'size must be an integer.'}, 400
+    try:
+        upload = attachment_store.begin(current_user.id, str(data.get('filename') or ''),
+                                        data.get('content_type'), size)
+    except UploadLimitExceeded as e:
+        return {'error': str(e)}, 429
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    return {
+        'upload_id': upload.id,
+        'received': 0,
+        'size': upload.size,
+        'chunk_size': current_app.config['ATTACHMENT_CHUNK_BYTES']
+    }, 201
+
+
+@chat.route('/api/attachments/uploads/<upload_id>', methods=['GET'])
+@login_required
+def attachment_upload_status(upload_id: str):
+    upload = get_own_upload(upload_id)
+    if not upload:
+        return {'error': 'Upload not found.'}, 404
+    return {
+        'upload_id': upload.id,
+        'received': attachment_store.received(upload),
+        'size': upload.size
     }
 
 
-@app.route('/register', methods=["GET", "POST"])
+@chat.route('/api/attachments/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_attachment_chunk(upload_id: str):
+    upload = get_own_upload(upload_id)
+    if not upload:
+        return {'error': 'Upload not found.'}, 404
+
+    # Content-Range: bytes <first>-<last>/<size>
+    match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+)',
+                         request.headers.get('Content-Range', '').strip())
+    if not match:
+        return {'error': 'A Content-Range header is required.'}, 400
+    start, end, total = (int(value) for value in match.groups())
+    length = end - start + 1
+    if length < 1 or total != upload.size or request.content_length != length:
+        return {'error': 'Content-Range does not match the upload.'}, 400
+
+    try:
+        received = attachment_store.write_chunk(upload, start, length, request.stream)
+    except UploadOffsetMismatch as e:
+        return {'error': 'Chunk does not start at the received offset.',
+                'received': e.received}, 409
+    except ValueError as e:
+        return {'error': str(e)}, 413
+    return {'upload_id': upload.id, 'received': received, 'size': upload.size}
+
+
+@chat.route('/api/attachments/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_attachment_upload(upload_id: str):
+    upload = get_own_upload(upload_id)
+    if not upload:
+        return {'error': 'Upload not found.'}, 404
+    try:
+        attachment = attachment_store.complete(upload)
+    except UploadOffsetMismatch as e:
+        return {'error': 'Upload is incomplete.', 'received': e.received}, 409
+    if attachment is None:
+        return {'error': 'Upload not found.'}, 404
+    return {'attachment': serialize_attachment(attachment)}, 201
+
+
+def send_attachment_file(attachment: Attachment, path: str, mimetype: str):
+    is_image = attachment.content_type in IMAGE_TYPES
+    # Conditional responses honour Range requests, so downloads can resume
+    response = send_file(path,
+                         mimetype=mimetype,
+                         as_attachment=not is_image,
+                         download_name=attachment.filename,
+                         conditional=True,
+                         max_age=7 * 24 * 3600)
+    response.cache_control.private = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+@chat.route('/api/attachments/<int:attachment_id>', methods=['GET'])
+@login_required
+def download_attachment(attachment_id: int):
+    attachment = db.session.get(Attachment, attachment_id)
+    if not attachment or not can_access_attachment(attachment, current_user.id):
+        return {'error': 'Attachment not found.'}, 404
+    return send_attachment_file(attachment, attachment_store.blob_path(attachment),
+                                attachment.content_type)
+
+
+@chat.route('/api/attachments/<int:attachment_id>/thumbnail', methods=['GET'])
+@login_required
+def attachment_thumbnail(attachment_id: int):
+    attachment = db.session.get(Attachment, attachment_id)
+    if not attachment or not can_access_attachment(attachment, current_user.id):
+        return {'error': 'Attachment not found.'}, 404
+    thumbnail = attachment_store.thumbnail_path(attachment)
+    if thumbnail is None:
+        # Not made yet (or Pillow is missing); the image itself will do
+        return send_attachment_file(attachment, attachment_store.blob_path(attachment),
+                                    attachment.content_type)
+    return send_attachment_file(attachment, thumbnail, 'image/jpeg')
+
+
+@chat.route('/register', methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         username = request.form.get("username", "").strip()
@@ -937,58 +2103,91 @@ def register():
         password = request.form.get("password", "")
         confirm = request.form.get("confirm_password", "")
 
+        if not auth_rate_limiter.allow('register', request.remote_addr):
+            flash('Too many sign-up attempts. Please wait and try again.', 'danger')
+            return render_template('register.html'), 429
+
         if not (3 <= len(username) <= 80):
             flash('Username must be between 3 to 80 characters long', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('chat.register'))
 
         if not re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", email):
             flash('Please enter a valid email address', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('chat.register'))
 
         if password != confirm:
             flash('Passwords do not match', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('chat.register'))
 
         if User.query.filter_by(username=username).first():
             flash('Username already exists', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('chat.register'))
 
         if User.query.filter_by(email=email).first():
             flash('Email already registered', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('chat.register'))
+
+        try:
+            password_hash = password_hasher.hash(password)
+        except PasswordHasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'danger')
+            return render_template('register.html'), 503
 
-        user = User(username=username, email=email)
-        user.set_password(password)
+        user = User(username=username, email=email, password_hash=password_hash)
 
         db.session.add(user)
         db.session.commit()
 
+        guest_key = get_member_key()
         login_user(user)
+        adopt_guest_memberships(guest_key)
         flash('Account created successfully! Please complete your profile.', 'success')
-        return redirect(url_for('onboarding'))
+        return redirect(url_for('chat.onboarding'))
 
     # GET request
     return render_template('register.html')
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@chat.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '')
 
+        # Keyed on the pair so failed guesses from one client cannot lock
+        # the account out for everyone else; the per-username bucket still
+        # slows guessing spread across many clients
+        if not (auth_rate_limiter.allow('login', request.remote_addr,
+                                        (request.remote_addr, username.lower()))
+                and auth_rate_limiter.allow('login_user', username.lower())):
+            flash('Too many login attempts. Please wait a minute and try again.',
+                  'danger')
+            return render_template('login.html'), 429
+
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
+        try:
+            password_ok = bool(user) and password_hasher.verify(user.password_hash,
+                                                                password)
+            if password_ok and password_hasher.needs_rehash(user.password_hash):
+                user.password_hash = password_hasher.hash(password)
+                db.session.commit()
+        except PasswordHasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'danger')
+            return render_template('login.html'), 503
+
+        if password_ok:
+            guest_key = get_member_key()
             login_user(user)
+            adopt_guest_memberships(guest_key)
             flash('Logged in successfully!', 'success')
-            return redirect(url_for('index'))
+            return redirect(url_for('chat.index'))
 
         flash('Invalid username or password', 'danger')
 
     return render_template('login.html')
 
 
-@app.route('/onboarding', methods=['GET', 'POST'])
+@chat.route('/onboarding', methods=['GET', 'POST'])
 @login_required
 def onboarding():
     if request.method == 'POST':
@@ -998,17 +2197,17 @@ def onboarding():
 
         if not (2 <= len(display_name) <= 80):
             flash('Display name must be between 2 and 80 characters.', 'danger')
-            return redirect(url_for('onboarding'))
+            return redirect(url_for('chat.onboarding'))
 
         if len(bio) > 500:
             flash('Bio must be 500 characters or fewer.', 'danger')
-            return redirect(url_for('onboarding'))
+            return redirect(url_for('chat.onboarding'))
 
         if profile_image and profile_image.filename:
             _, ext = os.path.splitext(profile_image.filename)
-            if ext.lower() not in app.config['PROFILE_UPLOAD_EXTENSIONS']:
+            if ext.lower() not in current_app.config['PROFILE_UPLOAD_EXTENSIONS']:
                 flash('Profile image must be jpg, jpeg, png, gif, or webp.', 'danger')
-                return redirect(url_for('onboarding'))
+                return redirect(url_for('chat.onboarding'))
 
         saved_avatar_path = save_profile_image(profile_image) if profile_image else None
 
@@ -1020,36 +2219,39 @@ def onboarding():
         db.session.commit()
 
         flash('Profile completed successfully!', 'success')
-        return redirect(url_for('index'))
+        return redirect(url_for('chat.index'))
 
     return render_template('onboarding.html',
                            profile_avatar=get_user_avatar_path(current_user))
 
 
-@app.route('/profile/<string:username>')
+@chat.route('/profile/<string:username>')
 def profile(username: str):
     user = User.query.filter_by(username=username).first()
     if not user:
         flash('User profile not found.', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('chat.index'))
 
     return render_template('profile.html',
                            profile_user=user,
                            profile_avatar=get_user_avatar_path(user),
                            default_avatar=get_default_avatar_path())
 
-@app.route('/logout')
+@chat.route('/logout')
 def logout():
     if current_user.is_authenticated:
         logout_user()
 
     session.pop('username', None)
+    session.pop('guest_token', None)
     flash('You have been logged out.', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('chat.index'))
 
 
-@socketio.event
-def connect():
+@socket_event('connect')
+@metrics.timed('socket', 'connect')
+@query_profiler.profile('socket connect')
+def connect(auth=None):
     try:
         cleanup_expired_rooms()
         if current_user.is_authenticated:
@@ -1057,8 +2259,7 @@ def connect():
             session['username'] = username
 
         else:
-            if 'username' not in session:
-                session['username'] = generate_guest_username()
+            start_guest_session()
 
         active_users[request.sid] = {
             'username': session['username'],
@@ -1066,46 +2267,66 @@ def connect():
             'connected_at': datetime.now().isoformat()
         }
 
+        if (current_app.config['SOCKET_DEFLATE_ENABLED'] and isinstance(auth, dict)
+                and auth.get('deflate') is True):
+            deflate_sids.add(request.sid)
+
         if current_user.is_authenticated:
-            user_presence[current_user.id] = request.sid
-            emit_missed_private_messages(current_user)
+            join_room(user_room(current_user.id))
+            user_presence.setdefault(current_user.id, set()).add(request.sid)
+            since_seq = auth.get('since_seq') if isinstance(auth, dict) else None
+            emit_user_event_backlog(current_user,
+                                    since_seq if isinstance(since_seq, int) else None)
 
         emit('active_users',
              {'users': build_active_users_payload()},
              broadcast=True)
 
-        logger.info(f"User connected: {session['username']}")
+        logger.info('User connected: %s', session['username'],
+                    extra={'event': 'connect'})
 
     except Exception as e:
-        logger.error(f"Connection error: {str(e)}")
+        metrics.record_error('socket', 'connect')
+        logger.exception('Connection error: %s', e)
         return False
 
 
-@socketio.event
-def disconnect():
+@socket_event('disconnect')
+@metrics.timed('socket', 'disconnect')
+@query_profiler.profile('socket disconnect')
+def disconnect(reason=None):
     try:
+        socket_rate_limiter.evict(request.sid, get_rate_limit_key())
+        deflate_sids.discard(request.sid)
         if request.sid in active_users:
             username = active_users[request.sid]['username']
             del active_users[request.sid]
+            typing_tracker.clear_user(username)
 
-            stale_user_ids = [
-                user_id for user_id, sid in user_presence.items() if sid == request.sid
-            ]
-            for user_id in stale_user_ids:
-                user_presence.pop(user_id, None)
+            for user_id in [
+                    user_id for user_id, sids in user_presence.items() if request.sid in sids
+            ]:
+                user_presence[user_id].discard(request.sid)
+                if not user_presence[user_id]:
+                    del user_presence[user_id]
 
             emit('active_users', {
                 'users': build_active_users_payload()
             },
                  broadcast=True)
 
-            logger.info(f"User disconnected: {username}")
+            logger.info('User disconnected: %s', username,
+                        extra={'event': 'disconnect'})
 
     except Exception as e:
-        logger.error(f"Disconnection error: {str(e)}")
+        metrics.record_error('socket', 'disconnect')
+        logger.exception('Disconnection error: %s', e)
 
 
-@socketio.on('join')
+@socket_event('join')
+@metrics.timed('socket', 'join')
+@query_profiler.profile('socket join')
+@rate_limited('join')
 def on_join(data: dict):
     try:
         username = session['username']
@@ -1113,17 +2334,33 @@ def on_join(data: dict):
         cleanup_expired_rooms()
 
         if room not in room_directory:
-            logger.warning(f"Invalid room join attempt: {room}")
-            return
+            # Only public rooms come back on a plain join; private ones are
+            # restored by join_room_by_code once the caller shows the code
+            entry = room_archive.get(room)
+            if (not entry or not entry['meta'].get('is_public')
+                    or not restore_archived_room(room)):
+                logger.warning('Invalid room join attempt: %s', room)
+                return
         if is_room_expired(room):
-            remove_room(room)
+            archive_room(room)
             emit('room_expired', {'room': room}, room=request.sid)
             return
+        if not can_access_room(room):
+            logger.warning('Denied join to private room %s for %s', room, username)
+            emit('message_error', {
+                'error': 'Join this private room with its code first.',
+                'room': room
+            },
+                 room=request.sid)
+            return
 
         join_room(room)
         active_users[request.sid]['room'] = room
         emit_room_state(room, username)
-        emit_room_history(room)
+        since_seq = data.get('since_seq')
+        emit_room_history(room,
+                          since_seq=since_seq if isinstance(since_seq, int) else None,
+                          epoch=data.get('epoch'))
 
         emit('status', {
             'msg': f'{username} has joined the room.',
@@ -1132,19 +2369,24 @@ def on_join(data: dict):
         },
              room=room)
 
-        logger.info(f"User {username} joined room: {room}")
+        logger.info('User %s joined room: %s', username, room,
+                    extra={'event': 'join'})
 
     except Exception as e:
-        logger.error(f"Join room error: {str(e)}")
+        metrics.record_error('socket', 'join')
+        logger.exception('Join room error: %s', e)
 
 
-@socketio.on('leave')
+@socket_event('leave')
+@metrics.timed('socket', 'leave')
+@query_profiler.profile('socket leave')
 def on_leave(data: dict):
     try:
         username = session['username']
         room = data['room']
 
         leave_room(room)
+        typing_tracker.update(('room', room), username, False)
         if request.sid in active_users:
             active_users[request.sid].pop('room', None)
 
@@ -1155,13 +2397,18 @@ def on_leave(data: dict):
         },
              room=room)
 
-        logger.info(f"User {username} left room: {room}")
+        logger.info('User %s left room: %s', username, room,
+                    extra={'event': 'leave'})
 
     except Exception as e:
-        logger.error(f"Leave room error: {str(e)}")
+        metrics.record_error('socket', 'leave')
+        logger.exception('Leave room error: %s', e)
 
 
-@socketio.on('message')
+@socket_event('message')
+@metrics.timed('socket', 'message')
+@query_profiler.profile('socket message')
+@rate_limited('message')
 def handle_message(data: dict):
     try:
         username = session['username']
@@ -1170,19 +2417,28 @@ def handle_message(data: dict):
         room = data.get('room', 'General')
         msg_type = data.get('type', 'message')
         message = data.get('msg', '').strip()
-        reply_to = data.get('reply_to')
+        reply_to_id = parse_reply_to_id(data)
 
-        timestamp = datetime.now().isoformat()
+        timestamp = to_epoch_ms(datetime.utcnow())
 
         if msg_type == 'sticker':
             if room not in room_directory:
-                logger.warning(f"Sticker to invalid room: {room}")
+                logger.warning('Sticker to invalid room: %s', room)
                 return
             if is_room_expired(room):
-                remove_room(room)
+                archive_room(room)
                 emit('room_expired', {'room': room}, room=request.sid)
                 return
-            
+            if not can_access_room(room):
+                logger.warning('Denied message to private room %s from %s', room,
+                               username)
+                emit('message_error', {
+                    'error': 'Join this private room with its code first.',
+                    'room': room
+                },
+                     room=request.sid)
+                return
+
             if not can_user_send_to_room(room, username):
                 emit('message_error', {
                     'error':
@@ -1198,8 +2454,10 @@ def handle_message(data: dict):
                 return
 
 
+            seq = next_room_sequence(room)
             message_payload = {
-                'id': str(uuid.uuid4()),
+                'id': str(seq),
+                'seq': seq,
                 'type': 'sticker',
                 'username': username,
                 'room': room,
@@ -1207,11 +2465,13 @@ def handle_message(data: dict):
                 'timestamp': timestamp,
                 'avatar_url': sender_avatar_url
             }
-            emit('message', message_payload, room=room)
-            append_room_history(room, message_payload)
+            message_frame = encode_frame(message_payload)
+            broadcast_room_message(room, message_frame)
+            append_room_history(room, message_payload, message_frame)
             touch_room_activity(room)
 
-            logger.info(f"Sticker sent in {room} by {username}")
+            logger.info('Sticker sent in %s by %s', room, username,
+                        extra={'event': 'room_message'})
             return
 
         if msg_type == 'private_sticker':
@@ -1237,39 +2497,103 @@ def handle_message(data: dict):
             conversation = get_or_create_direct_conversation(sender_user.id,
                                                              recipient_user.id)
 
+            now = datetime.utcnow()
+            recipient_online = recipient_user.id in user_presence
             message_row = Message(conversation_id=conversation.id,
                                   sender_id=sender_user.id,
                                   recipient_id=recipient_user.id,
                                   message_type='private_sticker',
-                                  sticker_file=file)
+                                  sticker_file=file,
+                                  created_at=now,
+                                  delivered_at=now if recipient_online else None)
             db.session.add(message_row)
-            db.session.commit()
-
-            recipient_sid = find_active_user_sid(target_user)
-            if recipient_sid:
-                delivered_at = datetime.utcnow()
-                message_row.delivered_at = delivered_at
-                db.session.commit()
-                emit('private_sticker', {
-                    'id': str(message_row.id),
-                    'conversation_id': conversation.id,
-                    'from': username,
-                    'to': target_user,
-                    'file': file,
-                    'timestamp': message_row.created_at.isoformat(),
-                    'delivered_at': delivered_at.isoformat(),
-                    'read_at': None,
-                    'status': 'delivered',
-                    'avatar_url': sender_avatar_url
-                },
-                     room=recipient_sid)
-                logger.info(f"Private sticker sent: {username} -> {target_user}")
+            db.session.flush()
+
+            # Both users' streams, so the sender's other tabs see it too
+            user_events.append('private_sticker', {
+                'id': str(message_row.id),
+                'conversation_id': conversation.id,
+                'from': username,
+                'to': target_user,
+                'file': file,
+                'timestamp': to_epoch_ms(now),
+                'delivered_at': to_epoch_ms(message_row.delivered_at),
+                'read_at': None,
+                'status': get_message_status(message_row),
+                'avatar_url': sender_avatar_url
+            }, [recipient_user.id, sender_user.id],
+                               skip_sid=request.sid)
+            typing_tracker.update(('dm', conversation.id,
+                                   get_conversation_participant_ids(conversation.id)),
+                                  username, False)
+            if recipient_online:
+                logger.info('Private sticker sent: %s -> %s', username, target_user,
+                            extra={'event': 'private_message'})
             else:
-                logger.info(
-                    f"Private sticker queued (recipient offline): {username} -> {target_user}"
-                )
+                logger.info('Private sticker queued (recipient offline): %s -> %s',
+                            username, target_user,
+                            extra={'event': 'private_message'})
             return
 
+        if msg_type == 'private_attachment':
+            target_user = data.get('target')
+            attachment_id = data.get('attachment_id')
+            sender_user = get_user_by_username(username)
+            recipient_user = get_user_by_username(target_user) if target_user else None
+            attachment = db.session.get(Attachment, attachment_id) if isinstance(
+                attachment_id, int) else None
+            if (not sender_user or not recipient_user or not attachment or
+                    attachment.uploader_id != sender_user.id):
+                logger.warning('Private attachment failed: %s -> %s (%s)', username,
+                               target_user, attachment_id)
+                emit('message_error', {
+                    'error': 'Unable to send this attachment.'
+                },
+                     room=request.sid)
+                return
+
+            conversation = get_or_create_direct_conversation(sender_user.id,
+                                                             recipient_user.id)
+
+            now = datetime.utcnow()
+            recipient_online = recipient_user.id in user_presence
+            message_row = Message(conversation_id=conversation.id,
+                                  sender_id=sender_user.id,
+                                  recipient_id=recipient_user.id,
+                                  body=message or None,
+                                  message_type='private_attachment',
+                                  attachment_id=attachment.id,
+                                  reply_to_id=resolve_private_reply(conversation.id,
+                                                                    reply_to_id),
+                                  created_at=now,
+                                  delivered_at=now if recipient_online else None)
+            db.session.add(message_row)
+            db.session.flush()
+
+            user_events.append('private_message', {
+                'id': str(message_row.id),
+                'conversation_id': conversation.id,
+                'msg': message,
+                'from': username,
+                'to': target_user,
+                'message_type': 'private_attachment',
+                'attachment': serialize_attachment(attachment),
+                'timestamp': to_epoch_ms(now),
+                'delivered_at': to_epoch_ms(message_row.delivered_at),
+                'read_at': None,
+                'status': get_message_status(message_row),
+                'reply_to_id': format_message_id(message_row.reply_to_id),
+                'avatar_url': sender_avatar_url
+            }, [recipient_user.id, sender_user.id],
+                               skip_sid=request.sid)
+            typing_tracker.update(('dm', conversation.id,
+                                   get_conversation_participant_ids(conversation.id)),
+                                  username, False)
+            logger.info('Private attachment sent: %s -> %s', username, target_user,
+                        extra={'event': 'private_message'})
+            # Acknowledged with the stored id so the sending tab can be replied to
+            return {'id': str(message_row.id)}
+
         if not message:
             return
 
@@ -1292,58 +2616,65 @@ def handle_message(data: dict):
             conversation = get_or_create_direct_conversation(sender_user.id,
                                                              recipient_user.id)
 
+            now = datetime.utcnow()
+            recipient_online = recipient_user.id in user_presence
             message_row = Message(conversation_id=conversation.id,
                                   sender_id=sender_user.id,
                                   recipient_id=recipient_user.id,
                                   body=message,
-                                  message_type='private')
+                                  message_type='private',
+                                  reply_to_id=resolve_private_reply(conversation.id,
+                                                                    reply_to_id),
+                                  created_at=now,
+                                  delivered_at=now if recipient_online else None)
             db.session.add(message_row)
-            db.session.commit()
-
+            db.session.flush()
 
-            reply_payload = None
-            if isinstance(reply_to, dict):
-                reply_payload = {
-                    'id': reply_to.get('id'),
-                    'sender': reply_to.get('sender'),
-                    'msg': reply_to.get('msg')
-                }
-
-            recipient_sid = find_active_user_sid(target_user)
-            if recipient_sid:
-                delivered_at = datetime.utcnow()
-                message_row.delivered_at = delivered_at
-                db.session.commit()
-                emit('private_message', {
-                    'id': str(message_row.id),
-                    'conversation_id': conversation.id,
-                    'msg': message,
-                    'from': username,
-                    'to': target_user,
-                    'timestamp': message_row.created_at.isoformat(),
-                    'delivered_at': delivered_at.isoformat(),
-                    'read_at': None,
-                    'status': 'delivered',
-                    'reply_to': reply_payload,
-                    'avatar_url': sender_avatar_url
-                },
-                     room=recipient_sid)
-                logger.info(f"Private message sent: {username} -> {target_user}")
+            user_events.append('private_message', {
+                'id': str(message_row.id),
+                'conversation_id': conversation.id,
+                'msg': message,
+                'from': username,
+                'to': target_user,
+                'timestamp': to_epoch_ms(now),
+                'delivered_at': to_epoch_ms(message_row.delivered_at),
+                'read_at': None,
+                'status': get_message_status(message_row),
+                'reply_to_id': format_message_id(message_row.reply_to_id),
+                'avatar_url': sender_avatar_url
+            }, [recipient_user.id, sender_user.id],
+                               skip_sid=request.sid)
+            typing_tracker.update(('dm', conversation.id,
+                                   get_conversation_participant_ids(conversation.id)),
+                                  username, False)
+            if recipient_online:
+                logger.info('Private message sent: %s -> %s', username, target_user,
+                            extra={'event': 'private_message'})
             else:
-                logger.info(
-                    f"Private message queued (recipient offline): {username} -> {target_user}"
-                )
+                logger.info('Private message queued (recipient offline): %s -> %s',
+                            username, target_user,
+                            extra={'event': 'private_message'})
+            return {'id': str(message_row.id)}
 
         else:
             # Regular room message
             if room not in room_directory:
-                logger.warning(f"Message to invalid room: {room}")
+                logger.warning('Message to invalid room: %s', room)
                 return
             if is_room_expired(room):
-                remove_room(room)
+                archive_room(room)
                 emit('room_expired', {'room': room}, room=request.sid)
                 return
-            
+            if not can_access_room(room):
+                logger.warning('Denied message to private room %s from %s', room,
+                               username)
+                emit('message_error', {
+                    'error': 'Join this private room with its code first.',
+                    'room': room
+                },
+                     room=request.sid)
+                return
+
             if not can_user_send_to_room(room, username):
                 emit('message_error', {
                     'error':
@@ -1353,64 +2684,93 @@ def handle_message(data: dict):
                      room=request.sid)
                 return
 
-            reply_payload = None
-            if isinstance(reply_to, dict):
-                reply_payload = {
-                    'id': reply_to.get('id'),
-                    'sender': reply_to.get('sender'),
-                    'msg': reply_to.get('msg')
-                }
-
+            if find_room_message_index(room, reply_to_id) is None:
+                reply_to_id = None
+            seq = next_room_sequence(room)
             message_payload = {
-                'id': str(uuid.uuid4()),
+                'id': str(seq),
+                'seq': seq,
                 'msg': message,
                 'username': username,
                 'room': room,
                 'timestamp': timestamp,
                 'type': 'message',
-                'reply_to': reply_payload,
+                'reply_to_id': format_message_id(reply_to_id),
                 'avatar_url': sender_avatar_url
             }
-            emit('message', message_payload, room=room)
-            append_room_history(room, message_payload)
+            message_frame = encode_frame(message_payload)
+            broadcast_room_message(room, message_frame)
+            append_room_history(room, message_payload, message_frame)
             touch_room_activity(room)
+            typing_tracker.update(('room', room), username, False)
 
-            logger.info(f"Message sent in {room} by {username}")
+            logger.info('Message sent in %s by %s', room, username,
+                        extra={'event': 'room_message'})
 
     except Exception as e:
-        logger.error(f"Message handling error: {str(e)}")
+        metrics.record_error('socket', 'message')
+        logger.exception('Message handling error: %s', e)
 
 
-@socketio.on('mark_private_read')
+@socket_event('typing')
+@metrics.timed('socket', 'typing')
+@rate_limited('typing', silent=True)
+def on_typing(data: dict):
+    """Ephemeral typing hint for a room (``room``) or DM (``conversation_id``).
+
+    Nothing is validated beyond access, stored or acknowledged; invalid hints
+    are dropped.
+    """
+    if not isinstance(data, dict):
+        return
+    is_typing = data.get('typing', True) is not False
+
+    if data.get('conversation_id') is not None:
+        if not current_user.is_authenticated:
+            return
+        try:
+            conversation_id = int(data['conversation_id'])
+        except (TypeError, ValueError):
+            return
+        participant_ids = get_conversation_participant_ids(conversation_id)
+        if current_user.id in participant_ids:
+            typing_tracker.update(('dm', conversation_id, participant_ids),
+                                  current_user.username, is_typing)
+        return
+
+    room = data.get('room')
+    sender = active_users.get(request.sid)
+    # A missing room must not match a sender who has not joined one, or the
+    # update would be published with to=None to every socket
+    if not isinstance(room, str) or not room or not sender or sender.get('room') != room:
+        return
+    typing_tracker.update(('room', room), sender['username'], is_typing)
+
+
+@socket_event('mark_private_read')
+@metrics.timed('socket', 'mark_private_read')
+@query_profiler.profile('socket mark_private_read')
+@rate_limited('mark_private_read')
 def on_mark_private_read(data: dict):
     if not current_user.is_authenticated:
         emit('message_error', {'error': 'Authentication required.'}, room=request.sid)
         return
 
-    conversation_id = data.get('conversation_id')
-    try:
-        normalized_conversation_id = int(conversation_id)
-    except (TypeError, ValueError):
+    read_mark = parse_read_mark(data if isinstance(data, dict) else {})
+    if read_mark is None:
         emit('message_error', {'error': 'Invalid conversation id.'}, room=request.sid)
         return
 
-    result = mark_conversation_as_read(current_user, normalized_conversation_id)
-    if result is None:
-        emit('message_error', {'error': 'Conversation not found.'}, room=request.sid)
-        return
-
-    emit('mark_private_read_ack', {
-        'conversation_id': normalized_conversation_id,
-        'updated': result['updated'],
-        'read_at': result['read_at'],
-        'message_ids': result['message_ids']
-    }, room=request.sid)
+    # Acked with mark_private_read_ack once the flush window closes
+    read_receipts.mark(current_user.id, *read_mark)
 
 
 if __name__ == '__main__':
     # In production, use gunicorn or uwsgi instead
     port = int(os.environ.get('PORT', 5000))
-    socketio.run(app,
+    app = create_app()
+    start_compaction_loop(app)
+    app.extensions['chat'].socketio.run(app,
                  host='0.0.0.0',
                  port=port,
                  debug=app.config['DEBUG'],
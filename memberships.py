@@ -0,0 +1,109 @@
+"""Server-side private room membership.
+
+Rows in ``room_member`` link a room name to a member key: ``user:<id>`` for
+registered users and ``guest:<token>`` for guests, where the token is a
+random value kept in the guest's session. Each member's set of
+rooms is loaded with one indexed query and kept in a bounded LRU cache, so
+building the sidebar or checking access on ``join`` is a set lookup. Writes
+go to the database first and then update the cached set in place. Guest
+rows are dropped when the guest logs in or after a TTL.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterable, Set
+
+from sqlalchemy.exc import IntegrityError
+
+from models import RoomMember, db
+
+
+class RoomMembershipStore:
+
+    def __init__(self, cache_size: int = 10000):
+        self.cache_size = max(cache_size, 1)
+        self._cache: 'OrderedDict[str, Set[str]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rooms_for(self, member_key: str) -> Set[str]:
+        """Rooms ``member_key`` belongs to. The returned set is shared with
+        the cache and must not be modified."""
+        with self._lock:
+            rooms = self._cache.get(member_key)
+            if rooms is not None:
+                self._cache.move_to_end(member_key)
+                return rooms
+
+        rooms = {
+            room_name for (room_name, ) in db.session.query(RoomMember.room_name).filter(
+                RoomMember.member_key == member_key)
+        }
+        with self._lock:
+            self._cache[member_key] = rooms
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return rooms
+
+    def is_member(self, member_key: str, room_name: str) -> bool:
+        return room_name in self.rooms_for(member_key)
+
+    def add(self, member_key: str, room_name: str) -> None:
+        self.add_many(member_key, [room_name])
+
+    def add_many(self, member_key: str, room_names: Iterable[str]) -> None:
+        rooms = self.rooms_for(member_key)
+        new_rooms = [room_name for room_name in dict.fromkeys(room_names)
+                     if room_name not in rooms]
+        if not new_rooms:
+            return
+
+        now = datetime.utcnow()
+        try:
+            with db.session.begin_nested():
+                db.session.add_all(
+                    RoomMember(room_name=room_name, member_key=member_key, joined_at=now)
+                    for room_name in new_rooms)
+        except IntegrityError:
+            # Another worker added one of these rooms first; reload from the
+            # database on the next lookup
+            self.invalidate(member_key)
+        else:
+            rooms.update(new_rooms)
+        db.session.commit()
+
+    def merge(self, from_key: str, to_key: str) -> None:
+        """Give ``to_key`` every room ``from_key`` belongs to, e.g. when a
+        guest logs in."""
+        if from_key != to_key:
+            self.add_many(to_key, self.rooms_for(from_key))
+
+    def remove_member(self, member_key: str) -> None:
+        RoomMember.query.filter_by(member_key=member_key).delete(synchronize_session=False)
+        db.session.commit()
+        self.invalidate(member_key)
+
+    def prune_guests(self, max_age: timedelta) -> int:
+        """Delete guest memberships older than ``max_age``; return the count."""
+        cutoff = datetime.utcnow() - max_age
+        expired = RoomMember.query.filter(RoomMember.member_key.like('guest:%'),
+                                          RoomMember.joined_at < cutoff)
+        keys = {member_key for (member_key, ) in expired.with_entities(
+            RoomMember.member_key).distinct()}
+        if not keys:
+            return 0
+        deleted = expired.delete(synchronize_session=False)
+        db.session.commit()
+        for member_key in keys:
+            self.invalidate(member_key)
+        return deleted
+
+    def remove_room(self, room_name: str) -> None:
+        RoomMember.query.filter_by(room_name=room_name).delete(synchronize_session=False)
+        db.session.commit()
+        with self._lock:
+            for rooms in self._cache.values():
+                rooms.discard(room_name)
+
+    def invalidate(self, member_key: str) -> None:
+        with self._lock:
+            self._cache.pop(member_key, None)
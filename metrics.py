@@ -0,0 +1,124 @@
+"""In-process latency histograms, error counters and gauges.
+
+Recording an observation is a ``perf_counter`` call, a bisect into a short
+bucket list and a few integer increments. The registry renders itself in the
+Prometheus text exposition format for the ``/metrics`` endpoint.
+"""
+import bisect
+import functools
+import time
+from typing import Callable, Dict, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+
+    def __init__(self, prefix: str = 'partychat'):
+        self.prefix = prefix
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.errors: Dict[Tuple[str, str], int] = {}
+        self.gauges: Dict[str, Tuple[str, Callable[[], object]]] = {}
+
+    def observe(self, kind: str, name: str, seconds: float,
+                error: bool = False) -> None:
+        key = (kind, name)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram()
+        histogram.observe(seconds)
+        if error:
+            self.record_error(kind, name)
+
+    def record_error(self, kind: str, name: str) -> None:
+        key = (kind, name)
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def timed(self, kind: str, name: str):
+        """Decorator recording the wrapped call's latency under
+        ``(kind, name)``. Exceptions are counted and re-raised."""
+
+        def decorator(func):
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                failed = False
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    self.observe(kind, name, time.perf_counter() - started,
+                                 failed)
+
+            return wrapper
+
+        return decorator
+
+    def register_gauge(self, name: str, help_text: str,
+                       callback: Callable[[], object]) -> None:
+        """Register a gauge sampled at scrape time.
+
+        ``callback`` returns either a number or a mapping of label value to
+        number; mappings are rendered with a ``key`` label.
+        """
+        self.gauges[name] = (help_text, callback)
+
+    def render(self) -> str:
+        lines = []
+        latency_name = f'{self.prefix}_latency_seconds'
+        lines.append(f'# HELP {latency_name} Handler latency in seconds.')
+        lines.append(f'# TYPE {latency_name} histogram')
+        for (kind, name), histogram in sorted(self.latency.items()):
+            labels = f'kind="{kind}",name="{_escape(name)}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{latency_name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{latency_name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'{latency_name}_sum{{{labels}}} {histogram.sum:.6f}')
+            lines.append(f'{latency_name}_count{{{labels}}} {histogram.count}')
+
+        errors_name = f'{self.prefix}_errors_total'
+        lines.append(f'# HELP {errors_name} Handler errors.')
+        lines.append(f'# TYPE {errors_name} counter')
+        for (kind, name), count in sorted(self.errors.items()):
+            lines.append(f'{errors_name}{{kind="{kind}",name="{_escape(name)}"}} {count}')
+
+        for gauge_name, (help_text, callback) in sorted(self.gauges.items()):
+            full_name = f'{self.prefix}_{gauge_name}'
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} gauge')
+            value = callback()
+            if isinstance(value, dict):
+                for key, item in sorted(value.items()):
+                    lines.append(f'{full_name}{{key="{_escape(str(key))}"}} {item}')
+            else:
+                lines.append(f'{full_name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,182 @@
+"""Versioned schema migrations.
+
+Each migration is a numbered, idempotent step that receives an open
+connection. Applied versions are recorded in the ``schema_version`` table, so
+every step runs once per database. Migrations are not run on import; apply
+them before starting the workers with::
+
+    flask --app main migrate
+
+New steps are appended to ``MIGRATIONS`` with the next version number and
+must be safe to re-run against a database that already has the change (for
+example ``CREATE INDEX IF NOT EXISTS``).
+"""
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import (JSON, Boolean, Column, DateTime, ForeignKey, Index, Integer, MetaData,
+                        String, Table, Text, UniqueConstraint, inspect, text)
+from sqlalchemy.engine import Connection, Engine
+
+from models import Attachment, AttachmentUpload, RoomMember, UserEvent
+
+logger = logging.getLogger(__name__)
+
+
+# The tables as db.create_all() made them before migrations existed, frozen
+# here so later model changes are only ever applied by their own migration.
+_baseline = MetaData()
+Table('user', _baseline,
+      Column('id', Integer, primary_key=True),
+      Column('username', String(80), unique=True, nullable=False),
+      Column('email', String(120), unique=True, nullable=False),
+      Column('password_hash', String(256), nullable=False),
+      Column('created_at', DateTime))
+Table('conversation', _baseline,
+      Column('id', Integer, primary_key=True),
+      Column('created_at', DateTime, nullable=False),
+      Column('metadata', JSON))
+Table('conversation_participant', _baseline,
+      Column('id', Integer, primary_key=True),
+      Column('conversation_id', Integer, ForeignKey('conversation.id'), nullable=False,
+             index=True),
+      Column('user_id', Integer, ForeignKey('user.id'), nullable=False, index=True),
+      Column('joined_at', DateTime, nullable=False),
+      UniqueConstraint('conversation_id', 'user_id', name='uq_conversation_user'))
+Table('message', _baseline,
+      Column('id', Integer, primary_key=True),
+      Column('conversation_id', Integer, ForeignKey('conversation.id'), nullable=False),
+      Column('sender_id', Integer, ForeignKey('user.id'), nullable=False),
+      Column('recipient_id', Integer, ForeignKey('user.id')),
+      Column('body', Text),
+      Column('message_type', String(32), nullable=False),
+      Column('sticker_file', String(255)),
+      Column('created_at', DateTime, nullable=False),
+      Column('delivered_at', DateTime),
+      Column('read_at', DateTime),
+      Index('ix_message_recipient_read', 'recipient_id', 'read_at'),
+      Index('ix_message_conversation_created', 'conversation_id', 'created_at'))
+
+
+def _create_tables(conn: Connection) -> None:
+    _baseline.create_all(conn)
+
+
+def _add_user_profile_columns(conn: Connection) -> None:
+    # Databases created before onboarding existed lack these columns.
+    existing_columns = {column['name'] for column in inspect(conn).get_columns('user')}
+    column_statements = {
+        'display_name': 'ALTER TABLE user ADD COLUMN display_name VARCHAR(80)',
+        'bio': 'ALTER TABLE user ADD COLUMN bio VARCHAR(500)',
+        'avatar_url': 'ALTER TABLE user ADD COLUMN avatar_url VARCHAR(255)',
+        'is_profile_complete': 'ALTER TABLE user ADD COLUMN is_profile_complete BOOLEAN NOT NULL DEFAULT 0'
+    }
+    for column_name, statement in column_statements.items():
+        if column_name not in existing_columns:
+            conn.execute(text(statement))
+
+
+def _add_message_hot_path_indexes(conn: Connection) -> None:
+    # Pending delivery on connect and newest-first paging of a conversation.
+    conn.execute(
+        text('CREATE INDEX IF NOT EXISTS ix_message_recipient_delivered '
+             'ON message (recipient_id, delivered_at)'))
+    conn.execute(
+        text('CREATE INDEX IF NOT EXISTS ix_message_conversation_id '
+             'ON message (conversation_id, id)'))
+    conn.execute(text('ANALYZE'))
+
+
+def _create_room_member_table(conn: Connection) -> None:
+    # Private room access used to live in the session cookie.
+    RoomMember.__table__.create(conn, checkfirst=True)
+
+
+def _create_user_event_table(conn: Connection) -> None:
+    # Per-user event stream for multi-device DM sync.
+    UserEvent.__table__.create(conn, checkfirst=True)
+
+
+def _create_attachment_tables(conn: Connection) -> None:
+    # Chunked uploads and the attachments messages can reference.
+    Attachment.__table__.create(conn, checkfirst=True)
+    AttachmentUpload.__table__.create(conn, checkfirst=True)
+    existing_columns = {column['name'] for column in inspect(conn).get_columns('message')}
+    if 'attachment_id' not in existing_columns:
+        conn.execute(
+            text('ALTER TABLE message ADD COLUMN attachment_id INTEGER '
+                 'REFERENCES attachment (id)'))
+    conn.execute(
+        text('CREATE INDEX IF NOT EXISTS ix_message_attachment_id '
+             'ON message (attachment_id)'))
+
+
+def _add_message_reply_to(conn: Connection) -> None:
+    # Replies reference their parent instead of carrying a copy of it.
+    existing_columns = {column['name'] for column in inspect(conn).get_columns('message')}
+    if 'reply_to_id' not in existing_columns:
+        conn.execute(
+            text('ALTER TABLE message ADD COLUMN reply_to_id INTEGER '
+                 'REFERENCES message (id)'))
+    conn.execute(
+        text('CREATE INDEX IF NOT EXISTS ix_message_reply_to_id '
+             'ON message (reply_to_id)'))
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, 'create tables', _create_tables),
+    (2, 'add user profile columns', _add_user_profile_columns),
+    (3, 'add message hot path indexes', _add_message_hot_path_indexes),
+    (4, 'create room member table', _create_room_member_table),
+    (5, 'create user event table', _create_user_event_table),
+    (6, 'create attachment tables', _create_attachment_tables),
+    (7, 'add message reply_to_id', _add_message_reply_to),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table(conn: Connection) -> None:
+    conn.execute(
+        text('CREATE TABLE IF NOT EXISTS schema_version ('
+             'version INTEGER PRIMARY KEY, description VARCHAR(200) NOT NULL, '
+             'applied_at DATETIME NOT NULL)'))
+
+
+def current_version(engine: Engine) -> int:
+    """Highest applied version, or 0 for an unmigrated database."""
+    if not inspect(engine).has_table('schema_version'):
+        return 0
+    with engine.connect() as conn:
+        return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+
+
+def upgrade(engine: Engine) -> List[int]:
+    """Apply every pending migration in order; return the versions applied."""
+    applied = []
+    if engine.dialect.name == 'sqlite' and not inspect(engine).get_table_names():
+        # auto_vacuum can only be chosen before the first table exists; the
+        # retention job reclaims space with PRAGMA incremental_vacuum
+        with engine.connect() as conn:
+            conn.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+    version = current_version(engine)
+
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        # One transaction per step so a failure leaves earlier steps recorded.
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(
+                text('INSERT INTO schema_version (version, description, applied_at) '
+                     'VALUES (:version, :description, :applied_at)'), {
+                         'version': number,
+                         'description': description,
+                         'applied_at': datetime.utcnow()
+                     })
+        logger.info('Applied migration %d: %s', number, description)
+        applied.append(number)
+    return applied
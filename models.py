@@ -62,9 +62,66 @@ class Message(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     delivered_at = db.Column(db.DateTime, nullable=True)
     read_at = db.Column(db.DateTime, nullable=True)
+    attachment_id = db.Column(db.Integer,
+                              db.ForeignKey('attachment.id'),
+                              nullable=True,
+                              index=True)
+    # Parent message in the same conversation, validated when the reply is sent
+    reply_to_id = db.Column(db.Integer,
+                            db.ForeignKey('message.id'),
+                            nullable=True,
+                            index=True)
 
     __table_args__ = (
         db.Index('ix_message_recipient_read', 'recipient_id', 'read_at'),
         db.Index('ix_message_conversation_created', 'conversation_id',
                  'created_at'),
-    )
\ No newline at end of file
+        db.Index('ix_message_recipient_delivered', 'recipient_id',
+                 'delivered_at'),
+        db.Index('ix_message_conversation_id', 'conversation_id', 'id'),
+    )
+
+class RoomMember(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    room_name = db.Column(db.String(60), nullable=False, index=True)
+    # 'user:<id>' for registered users, 'guest:<session token>' for guests
+    member_key = db.Column(db.String(100), nullable=False)
+    joined_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('member_key',
+                                          'room_name',
+                                          name='uq_room_member'), )
+
+
+class UserEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Per-user, gapless and strictly increasing
+    seq = db.Column(db.Integer, nullable=False)
+    event = db.Column(db.String(32), nullable=False)
+    # Encoded JSON of the payload as it was emitted, including ``seq``
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'seq', name='uq_user_event_seq'), )
+
+
+class Attachment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # Hex SHA-256 of the content; uploads of the same bytes share one blob
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    uploader_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class AttachmentUpload(db.Model):
+    # An upload in progress; the bytes received so far are the partial file
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
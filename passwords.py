@@ -0,0 +1,67 @@
+"""Password hashing off the request greenlet.
+
+PBKDF2 and scrypt take tens to hundreds of milliseconds of CPU. Run inline
+on a gevent worker they stall every websocket greenlet on that worker, so
+hashing is handed to a small pool of native threads (hashlib releases the
+GIL while it works). The number of hashes waiting or running is capped;
+past the cap callers get ``PasswordHasherBusy`` instead of queueing without
+bound.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:
+    from gevent.monkey import is_module_patched
+    from gevent.threadpool import ThreadPool as GeventThreadPool
+except ImportError:  # pragma: no cover - gevent is optional outside gunicorn
+    GeventThreadPool = None
+
+    def is_module_patched(module_name: str) -> bool:
+        return False
+
+
+class PasswordHasherBusy(RuntimeError):
+    pass
+
+
+class PasswordHasher:
+
+    def __init__(self, method: str, max_workers: int = 2, max_queue: int = 16):
+        # ``method`` must be fully specified (e.g. ``scrypt:32768:8:1``) so it
+        # can be compared with the prefix of stored hashes.
+        self.method = method
+        self.max_workers = max(max_workers, 1)
+        self.max_pending = self.max_workers + max(max_queue, 0)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        if GeventThreadPool is not None and is_module_patched('threading'):
+            # A patched ThreadPoolExecutor would run on greenlets, so use
+            # gevent's pool of real threads.
+            self._pool = GeventThreadPool(self.max_workers)
+            self._run = self._pool.apply
+        else:
+            self._pool = ThreadPoolExecutor(self.max_workers,
+                                            thread_name_prefix='password-hash')
+            self._run = lambda func, args: self._pool.submit(func, *args).result()
+
+    def _submit(self, func, *args):
+        with self._lock:
+            if self.in_flight >= self.max_pending:
+                raise PasswordHasherBusy('Password hashing queue is full')
+            self.in_flight += 1
+        try:
+            return self._run(func, args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def hash(self, password: str) -> str:
+        return self._submit(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return self._submit(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        return password_hash.split('$', 1)[0] != self.method
@@ -0,0 +1,111 @@
+"""Per-request SQL profiling built on SQLAlchemy cursor events.
+
+While enabled, every HTTP request and profiled socket event collects the
+number of statements it ran and the time spent in the database. Statements
+slower than ``slow_query_ms`` are logged with their parameters, and a statement
+executed ``n_plus_one_threshold`` or more times within one unit of work is
+reported as a likely N+1 pattern. The listeners return immediately while the
+profiler is disabled, so it can stay installed in production and be switched
+on at runtime.
+"""
+import functools
+import logging
+import time
+from typing import Dict
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    __slots__ = ('label', 'count', 'total_time', 'statements')
+
+    def __init__(self, label: str):
+        self.label = label
+        self.count = 0
+        self.total_time = 0.0
+        self.statements: Dict[str, int] = {}
+
+
+class QueryProfiler:
+
+    def __init__(self,
+                 enabled: bool = False,
+                 slow_query_ms: float = 100,
+                 n_plus_one_threshold: int = 5):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._installed = False
+        # Per-instance attribute, so two installed profilers never read each
+        # other's start times
+        self._started_attr = f'_query_started_at_{id(self)}'
+
+    def install(self) -> None:
+        if self._installed:
+            return
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        self._installed = True
+
+    def begin(self, label: str) -> None:
+        if self.enabled:
+            g.query_stats = QueryStats(label)
+
+    def finish(self) -> QueryStats | None:
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return None
+
+        logger.info('%s: %d queries in %.1f ms', stats.label, stats.count,
+                    stats.total_time * 1000)
+        for statement, executions in stats.statements.items():
+            if executions >= self.n_plus_one_threshold:
+                logger.warning('Possible N+1 in %s: %d executions of %s',
+                               stats.label, executions, statement)
+        return stats
+
+    def profile(self, label: str):
+        """Decorator profiling every call of a socket event handler."""
+
+        def decorator(func):
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                self.begin(label)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.finish()
+
+            return wrapper
+
+        return decorator
+
+    def _before_execute(self, conn, cursor, statement, parameters, context,
+                        executemany):
+        if self.enabled and context is not None:
+            # Kept on the execution context rather than the pooled connection,
+            # so a statement that raises leaves nothing behind
+            setattr(context, self._started_attr, time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        started = getattr(context, self._started_attr, None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+
+        if elapsed * 1000 >= self.slow_query_ms:
+            logger.warning('Slow query (%.1f ms): %s; parameters=%r',
+                           elapsed * 1000, statement, parameters)
+
+        stats = g.get('query_stats') if has_app_context() else None
+        if stats is None:
+            return
+        stats.count += 1
+        stats.total_time += elapsed
+        stats.statements[statement] = stats.statements.get(statement, 0) + 1
@@ -0,0 +1,116 @@
+"""Token-bucket rate limiting for Socket.IO events and auth attempts.
+
+Each (event, sid) and (event, user) pair owns a bucket holding two floats.
+Buckets are created lazily on the first event. Sid buckets are dropped when
+the socket disconnects; user buckets are only dropped then if they have
+refilled, since other tabs may share them. ``prune_threshold`` bounds what
+is left over (and every bucket of limiters keyed by something that never
+disconnects, such as a client IP): once that many buckets exist, the ones
+that have refilled are swept.
+"""
+import time
+from typing import Dict, Hashable, Tuple
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated_at')
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated_at = now
+
+    def consume(self, rate: float, capacity: float, now: float) -> bool:
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(capacity, self.tokens + elapsed * rate)
+            self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def is_full(self, rate: float, capacity: float, now: float) -> bool:
+        return self.tokens + (now - self.updated_at) * rate >= capacity
+
+
+class EventRateLimiter:
+    """Per-sid and per-user token buckets, configured per event name.
+
+    ``limits`` maps an event name to ``(rate_per_second, burst)``. Events that
+    are not listed are never limited.
+    """
+
+    def __init__(self,
+                 limits: Dict[str, Tuple[float, float]],
+                 prune_threshold: int | None = None):
+        self.limits = dict(limits)
+        self.prune_threshold = prune_threshold
+        self._next_prune_at = prune_threshold
+        self._sid_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._user_buckets: Dict[Tuple[str, Hashable], TokenBucket] = {}
+
+    def allow(self, event: str, sid: str, user_key: Hashable | None = None) -> bool:
+        limit = self.limits.get(event)
+        if not limit:
+            return True
+
+        rate, capacity = limit
+        now = time.monotonic()
+        if self._next_prune_at and (len(self._sid_buckets) + len(self._user_buckets)
+                                    > self._next_prune_at):
+            self.prune(now)
+        sid_bucket = self._get_bucket(self._sid_buckets, (event, sid), capacity, now)
+        if not sid_bucket.consume(rate, capacity, now):
+            return False
+
+        if user_key is None:
+            return True
+
+        user_bucket = self._get_bucket(self._user_buckets, (event, user_key),
+                                       capacity, now)
+        if user_bucket.consume(rate, capacity, now):
+            return True
+
+        # The user-wide bucket rejected the event; refund the sid token so
+        # the two buckets stay consistent.
+        sid_bucket.tokens = min(capacity, sid_bucket.tokens + 1)
+        return False
+
+    def evict(self, sid: str, user_key: Hashable | None = None) -> None:
+        for event in self.limits:
+            self._sid_buckets.pop((event, sid), None)
+
+        if user_key is None:
+            return
+
+        # Other tabs may still share the user buckets, so only drop the ones
+        # that have fully refilled and therefore carry no state.
+        now = time.monotonic()
+        for event, (rate, capacity) in self.limits.items():
+            bucket = self._user_buckets.get((event, user_key))
+            if bucket and bucket.is_full(rate, capacity, now):
+                del self._user_buckets[(event, user_key)]
+
+    def prune(self, now: float | None = None) -> None:
+        """Drop every bucket that has refilled and therefore carries no state."""
+        now = time.monotonic() if now is None else now
+        for buckets in (self._sid_buckets, self._user_buckets):
+            for key in [
+                    key for key, bucket in buckets.items()
+                    if bucket.is_full(*self.limits[key[0]], now)
+            ]:
+                del buckets[key]
+        if self.prune_threshold:
+            # While most buckets are still refilling, wait for the table to
+            # double before sweeping again so each event stays O(1) amortized
+            self._next_prune_at = max(self.prune_threshold,
+                                      2 * (len(self._sid_buckets) + len(self._user_buckets)))
+
+    @staticmethod
+    def _get_bucket(buckets: Dict, key: Hashable, capacity: float,
+                    now: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(capacity, now)
+            buckets[key] = bucket
+        return bucket
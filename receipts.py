@@ -0,0 +1,64 @@
+"""Coalesce private read marks into one database write per flush window.
+
+Opening a DM thread, scrolling and switching threads each mark the thread
+read, often through both the HTTP endpoint and the socket event. Marks are
+buffered per ``(reader_id, conversation_id)`` as a single high-water message
+id, so any number of marks inside the window collapse into one entry, and
+every entry is applied together by ``flush_handler`` when the window closes.
+"""
+import logging
+import threading
+from typing import Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+ReadMarks = Dict[Tuple[int, int], int | None]
+
+
+class ReadReceiptAggregator:
+
+    def __init__(self, socketio, flush_handler: Callable[[ReadMarks], None],
+                 max_delay_ms: int = 250):
+        self.socketio = socketio
+        self.flush_handler = flush_handler
+        self.max_delay = max(max_delay_ms, 0) / 1000
+        # None means "everything in the conversation at flush time"
+        self._pending: ReadMarks = {}
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def mark(self, reader_id: int, conversation_id: int,
+             up_to_id: int | None = None) -> None:
+        key = (reader_id, conversation_id)
+        with self._lock:
+            if key in self._pending:
+                current = self._pending[key]
+                self._pending[key] = (None if current is None or up_to_id is None else
+                                      max(current, up_to_id))
+            else:
+                self._pending[key] = up_to_id
+            schedule = not self._scheduled
+            self._scheduled = True
+
+        if schedule:
+            self.socketio.start_background_task(self._flush_later)
+
+    def _flush_later(self) -> None:
+        self.socketio.sleep(self.max_delay)
+        with self._lock:
+            self._scheduled = False
+        self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            marks, self._pending = self._pending, {}
+        if not marks:
+            return
+        try:
+            self.flush_handler(marks)
+        except Exception:
+            logger.exception('Failed to apply %d read marks', len(marks))
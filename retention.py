@@ -0,0 +1,215 @@
+"""Message retention and SQLite compaction.
+
+``MessageCompactor.run()`` removes messages older than the retention
+configured for their type, prunes old entries from the per-user event
+stream, and returns freed pages to the filesystem with incremental VACUUM.
+Every step works in small batches, each in its own short transaction, with
+a pause in between so socket handlers can take the write lock.
+
+Message ids increase with ``created_at``, so the newest id that is past a
+cutoff is found with a binary search over the primary key. Deletion then
+walks the id range in order, so no extra index on ``created_at`` is needed.
+The ``created_at`` check is applied again to every row, so out-of-order
+timestamps are at worst kept for another run and never deleted early.
+Replies to a deleted message keep their body but lose ``reply_to_id``;
+attachments left without a message are collected by ``AttachmentStore``.
+"""
+import gzip
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from sqlalchemy import text
+
+from models import Message, db
+from serialization import dumps, to_epoch_ms
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA auto_vacuum value that allows PRAGMA incremental_vacuum
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class MessageCompactor:
+
+    def __init__(self,
+                 retention_days: Dict[str, int | None],
+                 event_retention_days: int | None = 30,
+                 batch_size: int = 500,
+                 pause: float = 0.05,
+                 vacuum_pages: int = 1000,
+                 archive_dir: str | None = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        # message_type -> days to keep; None keeps that type forever
+        self.retention_days = dict(retention_days)
+        self.event_retention_days = event_retention_days
+        self.batch_size = max(batch_size, 1)
+        self.pause = pause
+        self.vacuum_pages = max(vacuum_pages, 1)
+        self.archive_dir = archive_dir
+        self.sleep = sleep
+        self.last_report: dict = {}
+
+    def run(self) -> dict:
+        """Apply retention and compact the database; return what was done."""
+        started = time.perf_counter()
+        size_before = self._database_size()
+        report = {
+            'messages_deleted': self._delete_expired_messages(),
+            'events_deleted': self._prune_user_events(),
+            'pages_vacuumed': self._incremental_vacuum(),
+        }
+        report['bytes_reclaimed'] = max(size_before - self._database_size(), 0)
+        report['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        self.last_report = report
+        logger.info(
+            'Compaction removed %d messages and %d events, vacuumed %d pages '
+            '(%d bytes reclaimed) in %.1f ms', report['messages_deleted'],
+            report['events_deleted'], report['pages_vacuumed'],
+            report['bytes_reclaimed'], report['duration_ms'])
+        return report
+
+    def _cutoffs(self) -> Dict[str, datetime]:
+        now = datetime.utcnow()
+        return {
+            message_type: now - timedelta(days=days)
+            for message_type, days in self.retention_days.items() if days is not None
+        }
+
+    def _last_id_before(self, cutoff: datetime) -> int:
+        """Largest message id whose row (by id order) is older than ``cutoff``."""
+        low, high = 0, db.session.query(db.func.max(Message.id)).scalar() or 0
+        while low < high:
+            middle = (low + high + 1) // 2
+            created_at = db.session.query(Message.created_at).filter(
+                Message.id >= middle).order_by(Message.id).limit(1).scalar()
+            if created_at is not None and created_at < cutoff:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _delete_expired_messages(self) -> int:
+        cutoffs = self._cutoffs()
+        if not cutoffs:
+            return 0
+        upper_id = self._last_id_before(max(cutoffs.values()))
+
+        deleted = 0
+        cursor = 0
+        while cursor < upper_id:
+            rows = db.session.query(Message).filter(
+                Message.id > cursor, Message.id <= upper_id).order_by(
+                    Message.id).limit(self.batch_size).all()
+            if not rows:
+                break
+            cursor = rows[-1].id
+            expired = [
+                row for row in rows if row.message_type in cutoffs
+                and row.created_at < cutoffs[row.message_type]
+            ]
+            if expired:
+                self._archive(expired)
+                expired_ids = [row.id for row in expired]
+                Message.query.filter(Message.reply_to_id.in_(expired_ids)).update(
+                    {'reply_to_id': None}, synchronize_session=False)
+                Message.query.filter(Message.id.in_(expired_ids)).delete(
+                    synchronize_session=False)
+                deleted += len(expired)
+            db.session.commit()
+            self.sleep(self.pause)
+        return deleted
+
+    def _archive(self, messages: List[Message]) -> None:
+        if not self.archive_dir:
+            return
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir,
+                            f'messages-{datetime.utcnow():%Y-%m}.jsonl.gz')
+        # Appending to a gzip file adds a member; readers see one stream
+        with gzip.open(path, 'at', encoding='utf-8') as handle:
+            handle.write(''.join(
+                dumps({
+                    'id': message.id,
+                    'conversation_id': message.conversation_id,
+                    'sender_id': message.sender_id,
+                    'recipient_id': message.recipient_id,
+                    'message_type': message.message_type,
+                    'body': message.body,
+                    'sticker_file': message.sticker_file,
+                    'attachment_id': message.attachment_id,
+                    'reply_to_id': message.reply_to_id,
+                    'created_at': to_epoch_ms(message.created_at),
+                    'delivered_at': to_epoch_ms(message.delivered_at),
+                    'read_at': to_epoch_ms(message.read_at)
+                }) + '\n' for message in messages))
+
+    def _prune_user_events(self) -> int:
+        if self.event_retention_days is None:
+            return 0
+        cutoff = datetime.utcnow() - timedelta(days=self.event_retention_days)
+        # Each user's newest event is kept so their sequence never restarts
+        statement = text(
+            'DELETE FROM user_event WHERE id IN ('
+            'SELECT e.id FROM user_event e WHERE e.created_at < :cutoff '
+            'AND EXISTS (SELECT 1 FROM user_event n '
+            'WHERE n.user_id = e.user_id AND n.seq > e.seq) '
+            'ORDER BY e.id LIMIT :batch)')
+        deleted = 0
+        while True:
+            count = db.session.execute(statement, {
+                'cutoff': cutoff,
+                'batch': self.batch_size
+            }).rowcount
+            db.session.commit()
+            deleted += count
+            if count < self.batch_size:
+                return deleted
+            self.sleep(self.pause)
+
+    def _is_sqlite(self) -> bool:
+        return db.engine.dialect.name == 'sqlite'
+
+    def _database_size(self) -> int:
+        if not self._is_sqlite():
+            return 0
+        page_count = db.session.execute(text('PRAGMA page_count')).scalar()
+        page_size = db.session.execute(text('PRAGMA page_size')).scalar()
+        return page_count * page_size
+
+    def _incremental_vacuum(self) -> int:
+        if not self._is_sqlite():
+            return 0
+        if db.session.execute(text('PRAGMA auto_vacuum')).scalar() != AUTO_VACUUM_INCREMENTAL:
+            logger.warning('Incremental VACUUM is off for this database; run '
+                           '`flask --app main compact --enable-incremental-vacuum` once')
+            return 0
+
+        vacuumed = 0
+        while True:
+            free_pages = db.session.execute(text('PRAGMA freelist_count')).scalar()
+            db.session.commit()
+            if not free_pages:
+                return vacuumed
+            step = min(free_pages, self.vacuum_pages)
+            # pysqlite steps a statement once, which frees a single page;
+            # executescript runs the pragma to completion
+            with db.engine.connect() as conn:
+                conn.connection.driver_connection.executescript(
+                    f'PRAGMA incremental_vacuum({step})')
+            vacuumed += step
+            self.sleep(self.pause)
+
+
+def enable_incremental_vacuum(engine) -> None:
+    """Switch an existing SQLite database to incremental auto-vacuum.
+
+    The mode only takes effect after a full VACUUM, which rewrites the whole
+    file and holds the write lock while it runs, so this is an offline,
+    one-off step.
+    """
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.exec_driver_sql('VACUUM')
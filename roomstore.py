@@ -0,0 +1,140 @@
+"""Durable room directory: a compact snapshot plus an append-only log.
+
+Every change to the room directory is appended to ``rooms.log`` as one JSON
+line (``create``, ``update`` or ``delete``). Each operation carries absolute
+values, so replaying the log over any snapshot taken while it was written
+yields the same final state. After ``snapshot_every`` operations the whole
+directory is written to ``rooms.snapshot.json`` (via a temporary file and
+``os.replace``) and the log is truncated, which keeps recovery on boot to
+one snapshot load plus a short replay.
+"""
+import gc
+import os
+import threading
+import time
+from typing import Dict
+
+from serialization import dumps_bytes, loads
+
+# Room activity only matters at day granularity (archive_on_inactive), so
+# activity updates are logged at most this often per room.
+ACTIVITY_LOG_INTERVAL = 60.0
+
+
+class RoomStore:
+
+    def __init__(self, root: str, rooms: Dict[str, dict], snapshot_every: int = 10000):
+        self.root = root
+        self.rooms = rooms
+        self.snapshot_every = max(snapshot_every, 1)
+        self.snapshot_path = os.path.join(root, 'rooms.snapshot.json')
+        self.log_path = os.path.join(root, 'rooms.log')
+        self._log = None
+        self._pending_ops = 0
+        self._activity_logged_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> int:
+        """Replace ``rooms`` with the snapshot plus the replayed log and
+        return the number of log operations replayed."""
+        # Decoding allocates millions of container objects; letting the cyclic
+        # GC scan them repeatedly on the way dominates recovery time.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._load()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _load(self) -> int:
+        rooms: Dict[str, dict] = {}
+        try:
+            with open(self.snapshot_path, 'rb') as handle:
+                rooms = loads(handle.read())
+        except FileNotFoundError:
+            pass
+
+        operations = 0
+        valid_bytes = 0
+        try:
+            with open(self.log_path, 'rb') as handle:
+                for line in handle:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        break
+                    self._apply(rooms, entry)
+                    operations += 1
+                    valid_bytes += len(line)
+            if valid_bytes != os.path.getsize(self.log_path):
+                # Drop a torn final line from a crash mid-write so new
+                # entries are not appended onto it
+                with open(self.log_path, 'r+b') as handle:
+                    handle.truncate(valid_bytes)
+        except FileNotFoundError:
+            pass
+
+        self.rooms.clear()
+        self.rooms.update(rooms)
+        self._pending_ops = operations
+        return operations
+
+    @staticmethod
+    def _apply(rooms: Dict[str, dict], entry: dict) -> None:
+        op, room = entry['op'], entry['room']
+        if op == 'create':
+            rooms[room] = entry['meta']
+        elif op == 'update':
+            if room in rooms:
+                rooms[room].update(entry['fields'])
+        elif op == 'delete':
+            rooms.pop(room, None)
+
+    def _append(self, entry: dict) -> None:
+        with self._lock:
+            if self._log is None:
+                os.makedirs(self.root, exist_ok=True)
+                self._log = open(self.log_path, 'ab')
+            self._log.write(dumps_bytes(entry) + b'\n')
+            self._log.flush()
+            self._pending_ops += 1
+            if self._pending_ops >= self.snapshot_every:
+                self._snapshot()
+
+    def record_create(self, room: str) -> None:
+        self._append({'op': 'create', 'room': room, 'meta': self.rooms[room]})
+
+    def record_update(self, room: str, **fields) -> None:
+        self._append({'op': 'update', 'room': room, 'fields': fields})
+
+    def record_delete(self, room: str) -> None:
+        self._activity_logged_at.pop(room, None)
+        self._append({'op': 'delete', 'room': room})
+
+    def record_activity(self, room: str) -> None:
+        now = time.monotonic()
+        if now - self._activity_logged_at.get(room, float('-inf')) < ACTIVITY_LOG_INTERVAL:
+            return
+        self._activity_logged_at[room] = now
+        self.record_update(room, last_activity_at=self.rooms[room]['last_activity_at'])
+
+    def snapshot(self) -> None:
+        with self._lock:
+            self._snapshot()
+
+    def _snapshot(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as handle:
+            handle.write(dumps_bytes(self.rooms))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        # Every logged operation is now part of the snapshot
+        if self._log is not None:
+            self._log.close()
+        self._log = open(self.log_path, 'wb')
+        self._pending_ops = 0
@@ -0,0 +1,132 @@
+"""JSON encoding shared by the Flask app and the SocketIO server.
+
+``orjson`` is used when it is installed; otherwise the stdlib ``json`` module
+is used with compact separators. Both backends produce ``str`` output so the
+module can be handed to python-socketio as its ``json`` implementation.
+"""
+import json as _stdlib_json
+import zlib
+from datetime import date, datetime, timezone
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson as _orjson
+except ImportError:  # pragma: no cover - optional dependency
+    _orjson = None
+
+BACKEND = 'orjson' if _orjson is not None else 'json'
+
+
+def to_epoch_ms(value: datetime | None) -> int | None:
+    """Convert a datetime to integer milliseconds since the Unix epoch.
+
+    Naive datetimes are treated as UTC, which matches the ``datetime.utcnow``
+    defaults used by the models.
+    """
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return to_epoch_ms(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+class RawJSON:
+    """JSON text that has already been encoded.
+
+    Socket.IO packets are encoded as ``[event, *args]``; any top-level argument
+    wrapped in ``RawJSON`` is spliced into the packet verbatim instead of being
+    serialized again.
+    """
+
+    __slots__ = ('encoded', )
+
+    def __init__(self, encoded: str):
+        self.encoded = encoded
+
+    def __repr__(self) -> str:
+        return f'RawJSON({self.encoded!r})'
+
+
+if _orjson is not None:
+    _ORJSON_OPTIONS = _orjson.OPT_NON_STR_KEYS | _orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps_bytes(obj: Any, **_kwargs: Any) -> bytes:
+        return _orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def _encode(obj: Any) -> str:
+        return _orjson.dumps(obj, default=_default,
+                             option=_ORJSON_OPTIONS).decode('utf-8')
+
+    def loads(data: str | bytes, **_kwargs: Any) -> Any:
+        return _orjson.loads(data)
+
+else:
+
+    def _encode(obj: Any) -> str:
+        return _stdlib_json.dumps(obj,
+                                  default=_default,
+                                  separators=(',', ':'),
+                                  ensure_ascii=False)
+
+    def dumps_bytes(obj: Any, **_kwargs: Any) -> bytes:
+        return _encode(obj).encode('utf-8')
+
+    def loads(data: str | bytes, **_kwargs: Any) -> Any:
+        return _stdlib_json.loads(data)
+
+
+def dumps(obj: Any, **_kwargs: Any) -> str:
+    if isinstance(obj, list) and any(isinstance(item, RawJSON) for item in obj):
+        return '[' + ','.join(
+            item.encoded if isinstance(item, RawJSON) else _encode(item)
+            for item in obj) + ']'
+    return _encode(obj)
+
+
+def encode_frame(obj: Any) -> RawJSON:
+    """Encode ``obj`` once so it can be emitted and replayed without
+    re-serializing."""
+    return RawJSON(_encode(obj))
+
+
+def join_frames(frames: list[RawJSON]) -> str:
+    """Concatenate pre-encoded frames into a JSON array."""
+    return '[' + ','.join(frame.encoded for frame in frames) + ']'
+
+
+def deflate(encoded: str, level: int = 6) -> bytes:
+    """zlib-compress an encoded document. Browsers inflate it natively with
+    ``DecompressionStream('deflate')``."""
+    return zlib.compress(encoded.encode('utf-8'), level)
+
+
+class SocketJSON:
+    """Minimal ``dumps``/``loads`` namespace accepted by python-socketio."""
+
+    dumps = staticmethod(dumps)
+    loads = staticmethod(loads)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by the same encoder as the socket layer."""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs.get('indent') or kwargs.get('sort_keys'):
+            kwargs.setdefault('default', _default)
+            return _stdlib_json.dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return loads(s)
@@ -1,4 +1,46 @@
-let socket = io();
+const USER_EVENT_SEQ_STORAGE_KEY = `partychat:userEventSeq:${document.getElementById("username").textContent}`;
+// Offer to receive large documents (room history, event backlogs) as
+// zlib-deflated binary when the browser can inflate them natively.
+const SUPPORTS_DEFLATE = typeof DecompressionStream === "function";
+// Resume the per-user event stream (DMs, receipts) from the last event this
+// browser saw; read again on every reconnect.
+let socket = io({
+        auth: (callback) =>
+                callback({ since_seq: loadUserEventSeq(), deflate: SUPPORTS_DEFLATE }),
+});
+
+// Deflated documents inflate asynchronously, so every event that arrives
+// while one is pending waits behind it and handlers still run in arrival
+// order (a live message must not land before the history snapshot that
+// precedes it).
+let inboundQueue = Promise.resolve();
+let inboundQueued = 0;
+const registerSocketHandler = socket.on.bind(socket);
+socket.on = (event, handler) =>
+        registerSocketHandler(event, (...args) => receiveInOrder(handler, args));
+
+function inflateDocument(buffer) {
+        const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream("deflate"));
+        return new Response(stream).text().then((text) => JSON.parse(text));
+}
+
+function receiveInOrder(handler, args) {
+        const [payload, ...rest] = args;
+        const deflated = payload instanceof ArrayBuffer;
+        if (!deflated && inboundQueued === 0) {
+                handler(...args);
+                return;
+        }
+        inboundQueued += 1;
+        const ready = deflated ? inflateDocument(payload) : payload;
+        inboundQueue = inboundQueue
+                .then(() => ready)
+                .then((data) => handler(data, ...rest))
+                .catch((error) => console.error("Failed to handle socket event", error))
+                .finally(() => {
+                        inboundQueued -= 1;
+                });
+}
 let currentRoom = "General";
 let currentPrivateConversation = null;
 let username = document.getElementById("username").textContent;
@@ -6,6 +48,7 @@ const isAuthenticated =
         document.getElementById("username").dataset.authenticated === "true";
 let ownedRooms = new Set();
 let roomMessages = {};
+let roomHistoryCursors = {};
 let replyContext = null;
 let roomPolicies = {};
 let canSendInCurrentRoom = true;
@@ -13,6 +56,7 @@ const privateConversationTargets = {};
 const dmThreadsByConversationId = new Map();
 
 const ROOM_MESSAGES_STORAGE_KEY = `partychat:roomMessages:${username}`;
+const ROOM_CURSORS_STORAGE_KEY = `partychat:roomCursors:${username}`;
 const DEFAULT_AVATAR_PATH = "/static/icons/Guest.jpeg";
 const currentUserAvatarSrc =
         document.querySelector(".profile-avatar")?.getAttribute("src") ||
@@ -22,14 +66,31 @@ hydrateRoomMessages();
 
 const SWIPE_REPLY_THRESHOLD = 70;
 const messageElementsById = new Map();
+// Message arrays -> { size, byId } so replies resolve their parent without
+// scanning the conversation; appended messages are indexed on the next
+// lookup and replaced arrays get a fresh index.
+const messageIndexes = new WeakMap();
 
 socket.on("connect", () => {
         joinRoom("General");
         highlightActiveRoom("General");
 });
 
-socket.on("message", (data) => {
+function updateRoomCursor(roomName, seq, epoch = undefined) {
+        if (!roomName || typeof seq !== "number") {
+                return;
+        }
+
+        const cursor = roomHistoryCursors[roomName] || {};
+        roomHistoryCursors[roomName] = {
+                epoch: epoch === undefined ? cursor.epoch : epoch,
+                seq: Math.max(seq, epoch === undefined ? cursor.seq || 0 : 0),
+        };
+}
+
+function handleRoomMessage(data) {
         const conversationKey = `room:${data.room || currentRoom}`;
+        updateRoomCursor(data.room || currentRoom, data.seq);
         if (data.type === "sticker") {
                 addStickerMessage(
                         data.username,
@@ -44,13 +105,31 @@ socket.on("message", (data) => {
 
         addMessage({
                 id: data.id,
+                seq: data.seq,
                 sender: data.username,
                 message: data.msg,
                 type: data.username === username ? "own" : "other",
                 threadType: "room",
+                replyToId: data.reply_to_id || null,
                 replyTo: data.reply_to || null,
                 avatarUrl: data.avatar_url || null,
         }, true, conversationKey);
+}
+
+socket.on("message", handleRoomMessage);
+
+// Batched room messages may overlap with a room_history snapshot received
+// during the same flush window, so skip ids that are already stored.
+socket.on("message_batch", (data) => {
+        const messages = Array.isArray(data?.messages) ? data.messages : [];
+        const stored = roomMessages[`room:${data?.room || currentRoom}`] || [];
+        const knownIds = new Set(stored.map((msg) => msg.id).filter(Boolean));
+        messages.forEach((msg) => {
+                if (msg.id && knownIds.has(msg.id)) {
+                        return;
+                }
+                handleRoomMessage(msg);
+        });
 });
 
 socket.on("room_history", (data) => {
@@ -61,37 +140,50 @@ socket.on("room_history", (data) => {
 
         const history = Array.isArray(data.messages) ? data.messages : [];
         const conversationKey = `room:${roomName}`;
-        roomMessages[conversationKey] = history.map((msg) => {
-                if (msg.type === "sticker") {
-                        return {
-                                id: msg.id,
-                                sender: msg.username,
-                                message: msg.file,
-                                type: `sticker:${msg.username === username ? "own" : "other"}`,
-                                threadType: "room",
-                                avatarUrl: msg.avatar_url || null,
-                                timestamp: msg.timestamp,
-                        };
-                }
+        const received = history.map(normalizeRoomHistoryMessage);
+        // A delta only carries messages after our cursor; a snapshot replaces
+        // whatever was cached for the room.
+        roomMessages[conversationKey] =
+                data.mode === "delta"
+                        ? (roomMessages[conversationKey] || []).concat(received)
+                        : received;
+        if (typeof data.last_seq === "number") {
+                updateRoomCursor(roomName, data.last_seq, data.epoch ?? null);
+        }
+        persistRoomMessages();
+
+        if (!currentPrivateConversation && currentRoom === roomName) {
+                renderConversationMessages(conversationKey);
+        }
+});
 
+function normalizeRoomHistoryMessage(msg) {
+        if (msg.type === "sticker") {
                 return {
                         id: msg.id,
+                        seq: msg.seq,
                         sender: msg.username,
-                        message: msg.msg || "",
-                        type: msg.username === username ? "own" : "other",
+                        message: msg.file,
+                        type: `sticker:${msg.username === username ? "own" : "other"}`,
                         threadType: "room",
-                        replyTo: msg.reply_to || null,
                         avatarUrl: msg.avatar_url || null,
                         timestamp: msg.timestamp,
                 };
-        });
-        persistRoomMessages();
-
-        if (!currentPrivateConversation && currentRoom === roomName) {
-                renderConversationMessages(conversationKey);
         }
-});
 
+        return {
+                id: msg.id,
+                seq: msg.seq,
+                sender: msg.username,
+                message: msg.msg || "",
+                type: msg.username === username ? "own" : "other",
+                threadType: "room",
+                replyToId: msg.reply_to_id || null,
+                replyTo: msg.reply_to || null,
+                avatarUrl: msg.avatar_url || null,
+                timestamp: msg.timestamp,
+        };
+}
 
 function normalizeIncomingPrivateMessage(data) {
         const sender = data.from || "unknown";
@@ -103,33 +195,101 @@ function normalizeIncomingPrivateMessage(data) {
                 threadType: "private",
                 status: data.status || "sent",
                 avatarUrl: data.avatar_url || null,
+                attachment: data.attachment || null,
+                replyToId: data.reply_to_id || null,
                 delivered_at: data.delivered_at || null,
                 read_at: data.read_at || null,
         };
 }
 
-socket.on("private_message", (data) => {
+function getAttachmentPreview(attachment) {
+        return `📎 ${attachment.filename}`;
+}
+
+function loadUserEventSeq() {
+        const stored = Number(localStorage.getItem(USER_EVENT_SEQ_STORAGE_KEY));
+        return Number.isInteger(stored) && stored > 0 ? stored : null;
+}
+
+function noteUserEventSeq(seq) {
+        if (Number.isInteger(seq) && seq > (loadUserEventSeq() || 0)) {
+                localStorage.setItem(USER_EVENT_SEQ_STORAGE_KEY, String(seq));
+        }
+}
+
+// Messages in a user's event stream include the ones this user sent from
+// other tabs, so the thread partner is whichever side is not us.
+function upsertThreadForPrivateEvent(data, preview) {
         const conversationId = String(data.conversation_id);
-        const conversationKey = `private:${conversationId}`;
+        const isOwn = data.from === username;
+        const partner = isOwn ? data.to : data.from;
         privateConversationTargets[conversationId] = {
-                username: data.from,
-                display_name: data.from,
+                username: partner,
+                display_name: partner,
         };
         const previousUnreadCount =
                 dmThreadsByConversationId.get(conversationId)?.unread_count || 0;
+        const isOpen =
+                currentPrivateConversation &&
+                String(currentPrivateConversation.id) === conversationId;
         upsertDmThread({
                 conversation_id: conversationId,
-                username: data.from,
-                display_name: data.from,
-                preview: data.msg || "",
-                avatar_url: data.avatar_url || DEFAULT_AVATAR_PATH,
+                username: partner,
+                display_name: partner,
+                preview,
+                avatar_url: isOwn ? undefined : data.avatar_url || DEFAULT_AVATAR_PATH,
                 updated_at: data.timestamp || new Date().toISOString(),
-                unread_count:
-                        currentPrivateConversation &&
-                        String(currentPrivateConversation.id) === conversationId
-                                ? 0
-                                : previousUnreadCount + 1,
+                unread_count: isOpen ? 0 : previousUnreadCount + (isOwn ? 0 : 1),
         });
+}
+
+const userEventHandlers = {
+        private_message: handlePrivateMessage,
+        private_sticker: handlePrivateSticker,
+        private_messages_read: () => {},
+        mark_private_read_ack: (data) => {
+                upsertDmThread({ conversation_id: String(data.conversation_id), unread_count: 0 });
+        },
+        conversation: (data) => {
+                const partner = (data.participants || []).find((p) => p.username !== username);
+                if (partner) {
+                        privateConversationTargets[String(data.conversation_id)] = {
+                                username: partner.username,
+                                display_name: partner.username,
+                        };
+                        upsertDmThread({
+                                conversation_id: String(data.conversation_id),
+                                username: partner.username,
+                                display_name: partner.username,
+                        });
+                }
+        },
+};
+
+Object.entries(userEventHandlers).forEach(([event, handler]) => {
+        socket.on(event, (data) => {
+                handler(data);
+                noteUserEventSeq(data?.seq);
+        });
+});
+
+// Backlog sent on connect: every event after our stored sequence, in order.
+socket.on("user_events", (data) => {
+        (data?.events || []).forEach((entry) => {
+                const handler = userEventHandlers[entry.event];
+                if (handler) {
+                        handler(entry.data);
+                }
+        });
+        noteUserEventSeq(data?.last_seq);
+});
+
+function handlePrivateMessage(data) {
+        const conversationKey = `private:${String(data.conversation_id)}`;
+        upsertThreadForPrivateEvent(
+                data,
+                data.attachment ? getAttachmentPreview(data.attachment) : data.msg || "",
+        );
 
         addMessage(
                 {
@@ -139,32 +299,20 @@ socket.on("private_message", (data) => {
                 true,
                 conversationKey,
         );
-});
+}
 
-socket.on("private_sticker", (data) => {
-        const conversationId = String(data.conversation_id);
-        const conversationKey = `private:${conversationId}`;
-        privateConversationTargets[conversationId] = {
-                username: data.from,
-                display_name: data.from,
-        };
-        const previousUnreadCount =
-                dmThreadsByConversationId.get(conversationId)?.unread_count || 0;
-        upsertDmThread({
-                conversation_id: conversationId,
-                username: data.from,
-                display_name: data.from,
-                preview: "📎 Sticker",
-                avatar_url: data.avatar_url || DEFAULT_AVATAR_PATH,
-                updated_at: data.timestamp || new Date().toISOString(),
-                unread_count:
-                        currentPrivateConversation &&
-                        String(currentPrivateConversation.id) === conversationId
-                                ? 0
-                                : previousUnreadCount + 1,
-        });
-        addStickerMessage(data.from, data.file, "private", true, conversationKey, data.avatar_url || null);
-});
+function handlePrivateSticker(data) {
+        const conversationKey = `private:${String(data.conversation_id)}`;
+        upsertThreadForPrivateEvent(data, "📎 Sticker");
+        addStickerMessage(
+                data.from,
+                data.file,
+                data.from === username ? "own" : "private",
+                true,
+                conversationKey,
+                data.avatar_url || null,
+        );
+}
 
 
 socket.on("private_message_batch", (data) => {
@@ -182,7 +330,12 @@ socket.on("private_message_batch", (data) => {
                         conversation_id: conversationId,
                         username: msg.from,
                         display_name: msg.from,
-                        preview: msg.message_type === "private_sticker" ? "📎 Sticker" : msg.msg,
+                        preview:
+                                msg.message_type === "private_sticker"
+                                        ? "📎 Sticker"
+                                        : msg.attachment
+                                          ? getAttachmentPreview(msg.attachment)
+                                          : msg.msg,
                         avatar_url: msg.avatar_url || DEFAULT_AVATAR_PATH,
                         updated_at: msg.timestamp || new Date().toISOString(),
                         unread_count:
@@ -201,6 +354,16 @@ socket.on("private_message_batch", (data) => {
         });
 });
 
+// The server skipped events while this client was too slow to read them.
+socket.on("resync", () => {
+        if (currentPrivateConversation) {
+                openPrivateConversation(currentPrivateConversation.id, currentPrivateConversation);
+        } else {
+                socket.emit("join", buildJoinPayload(currentRoom));
+        }
+        hydrateDmThreadList();
+});
+
 socket.on("status", (data) => {
         addMessage({ sender: "System", message: data.msg, type: "system", threadType: "room" });
 });
@@ -284,6 +447,73 @@ socket.on("active_users", (data) => {
 });
 
 
+// Typing hints are sent at most once per refresh interval while typing and
+// stopped after a short idle period, on send, and when switching threads.
+const TYPING_REFRESH_MS = 3000;
+const TYPING_IDLE_MS = 4000;
+let typingState = null;
+let typingStopTimer = null;
+const typingByThread = {};
+
+function getTypingTarget() {
+        if (currentPrivateConversation) {
+                return { conversation_id: currentPrivateConversation.id };
+        }
+        return { room: currentRoom };
+}
+
+function notifyTyping() {
+        const target = getTypingTarget();
+        const key = JSON.stringify(target);
+        const now = Date.now();
+        if (typingState && typingState.key !== key) {
+                stopTyping();
+        }
+        if (!typingState || now - typingState.sentAt > TYPING_REFRESH_MS) {
+                socket.emit("typing", { ...target, typing: true });
+                typingState = { key, target, sentAt: now };
+        }
+        clearTimeout(typingStopTimer);
+        typingStopTimer = setTimeout(stopTyping, TYPING_IDLE_MS);
+}
+
+function stopTyping() {
+        clearTimeout(typingStopTimer);
+        if (!typingState) {
+                return;
+        }
+        socket.emit("typing", { ...typingState.target, typing: false });
+        typingState = null;
+}
+
+function renderTypingIndicator() {
+        const indicator = document.getElementById("typing-indicator");
+        if (!indicator) {
+                return;
+        }
+        const users = typingByThread[getConversationStorageKey()] || [];
+        if (!users.length) {
+                indicator.textContent = "";
+        } else if (users.length === 1) {
+                indicator.textContent = `${users[0]} is typing…`;
+        } else if (users.length <= 3) {
+                indicator.textContent = `${users.join(", ")} are typing…`;
+        } else {
+                indicator.textContent = "Several people are typing…";
+        }
+}
+
+socket.on("typing", (data) => {
+        if (!data || !Array.isArray(data.users)) {
+                return;
+        }
+        const key = data.conversation_id !== undefined
+                ? `private:${data.conversation_id}`
+                : `room:${data.room}`;
+        typingByThread[key] = data.users.filter((user) => user !== username);
+        renderTypingIndicator();
+});
+
 function getConversationStorageKey() {
         if (currentPrivateConversation) {
                 return `private:${currentPrivateConversation.id}`;
@@ -327,6 +557,10 @@ function persistRoomMessages() {
                         ROOM_MESSAGES_STORAGE_KEY,
                         JSON.stringify(roomMessages),
                 );
+                localStorage.setItem(
+                        ROOM_CURSORS_STORAGE_KEY,
+                        JSON.stringify(roomHistoryCursors),
+                );
         } catch (_error) {
                 // Ignore storage write failures (private mode, quota exceeded, etc.)
         }
@@ -345,8 +579,16 @@ function hydrateRoomMessages() {
                 if (parsed && typeof parsed === "object") {
                         roomMessages = parsed;
                 }
+
+                const cursors = JSON.parse(
+                        localStorage.getItem(ROOM_CURSORS_STORAGE_KEY) || "{}",
+                );
+                if (cursors && typeof cursors === "object") {
+                        roomHistoryCursors = cursors;
+                }
         } catch (_error) {
                 roomMessages = {};
+                roomHistoryCursors = {};
         }
 }
 
@@ -370,7 +612,7 @@ function normalizeDmThread(thread) {
                 display_name: displayName,
                 avatar_url: thread.avatar_url || thread.partner_avatar_url || DEFAULT_AVATAR_PATH,
                 preview: previewText,
-                updated_at: thread.updated_at || "",
+                updated_at: toIsoTimestamp(thread.updated_at),
                 unread_count: Number(thread.unread_count || 0),
         };
 }
@@ -497,20 +739,62 @@ function truncateText(text, maxLength = 90) {
         return `${clean.slice(0, maxLength - 1)}…`;
 }
 
-function buildReplyBlock(replyTo) {
-        if (!replyTo || !replyTo.id) {
+function findStoredMessage(conversationKey, messageId) {
+        const messages = roomMessages[conversationKey];
+        if (!messages || !messageId) {
                 return null;
         }
 
+        let index = messageIndexes.get(messages);
+        if (!index) {
+                index = { size: 0, byId: new Map() };
+                messageIndexes.set(messages, index);
+        }
+        for (; index.size < messages.length; index.size += 1) {
+                const msg = messages[index.size];
+                if (msg.id) {
+                        index.byId.set(String(msg.id), msg);
+                }
+        }
+        return index.byId.get(String(messageId)) || null;
+}
+
+function getReplyPreview(msg) {
+        if (typeof msg.type === "string" && msg.type.startsWith("sticker:")) {
+                return "📎 Sticker";
+        }
+        if (!msg.message && msg.attachment) {
+                return getAttachmentPreview(msg.attachment);
+        }
+        return msg.message;
+}
+
+function buildReplyBlock(messageData, conversationKey) {
+        // Older messages carry a copy of their parent; newer ones only its id
+        const legacy = messageData.replyTo || null;
+        const replyToId = messageData.replyToId || legacy?.id;
+        if (!replyToId) {
+                return null;
+        }
+
+        const parent = findStoredMessage(conversationKey, replyToId);
         const replyDiv = document.createElement("button");
         replyDiv.type = "button";
         replyDiv.className = "reply-reference";
         replyDiv.title = "Jump to replied message";
-        replyDiv.innerHTML = `
-                <span class="reply-reference-sender">${replyTo.sender || "Unknown"}</span>
-                <span class="reply-reference-text">${truncateText(replyTo.msg || "(message unavailable)", 70)}</span>
-        `;
-        replyDiv.onclick = () => jumpToMessage(replyTo.id);
+
+        const senderSpan = document.createElement("span");
+        senderSpan.className = "reply-reference-sender";
+        senderSpan.textContent = (parent ? parent.sender : legacy?.sender) || "Earlier message";
+        const textSpan = document.createElement("span");
+        textSpan.className = "reply-reference-text";
+        textSpan.textContent = truncateText(
+                (parent ? getReplyPreview(parent) : legacy?.msg) || "Tap to load",
+                70,
+        );
+        replyDiv.appendChild(senderSpan);
+        replyDiv.appendChild(textSpan);
+        replyDiv.onclick = () => jumpToMessage(String(replyToId), conversationKey);
         return replyDiv;
 }
 
@@ -521,6 +805,18 @@ function resolveAvatarUrl(avatarUrl) {
         return DEFAULT_AVATAR_PATH;
 }
 
+// Server payloads carry epoch-millisecond integers; thread ordering compares
+// ISO strings, so normalize both forms to ISO here.
+function toIsoTimestamp(timestampValue) {
+        if (timestampValue == null || timestampValue === "") {
+                return "";
+        }
+        if (typeof timestampValue === "number") {
+                return new Date(timestampValue).toISOString();
+        }
+        return String(timestampValue);
+}
+
 function formatTimestamp(timestampValue) {
         const date = timestampValue ? new Date(timestampValue) : new Date();
         return date.toLocaleTimeString([], { hour: "2-digit", minute: "2-digit" });
@@ -591,13 +887,15 @@ function addMessage(messageData, shouldStore = true, conversationKey = getConver
         if (messageData.threadType === "private") {
                 messageDiv.classList.add("thread-private");
         }
-        const msgId =
-                messageData.id ||
-                `local-${Date.now()}-${Math.random().toString(16).slice(2)}`;
+        if (!messageData.id) {
+                // Replaced by the stored id once the server acknowledges it
+                messageData.id = `local-${Date.now()}-${Math.random().toString(16).slice(2)}`;
+        }
+        const msgId = messageData.id;
         messageDiv.dataset.messageId = msgId;
 
         if (messageData.type !== "system") {
-                const replyBlock = buildReplyBlock(messageData.replyTo);
+                const replyBlock = buildReplyBlock(messageData, conversationKey);
                 if (replyBlock) {
                         messageDiv.appendChild(replyBlock);
                 }
@@ -618,15 +916,22 @@ function addMessage(messageData, shouldStore = true, conversationKey = getConver
         headerDiv.appendChild(timestampDiv);
         messageDiv.appendChild(headerDiv);
 
-        const textDiv = document.createElement("div");
-        textDiv.className = "message-text";
-        const prefix = messageData.threadType === "private" ? "[Private] " : "";
-        textDiv.textContent = `${prefix}${messageData.message}`;
-        messageDiv.appendChild(textDiv);
+        if (messageData.message || !messageData.attachment) {
+                const textDiv = document.createElement("div");
+                textDiv.className = "message-text";
+                const prefix = messageData.threadType === "private" ? "[Private] " : "";
+                textDiv.textContent = `${prefix}${messageData.message}`;
+                messageDiv.appendChild(textDiv);
+        }
+        if (messageData.attachment) {
+                messageDiv.appendChild(buildAttachmentBlock(messageData.attachment));
+        }
 
         if (messageData.type === "own" || messageData.type === "other" || messageData.type === "private") {
                 bindSwipeReply(messageDiv, {
-                        id: msgId,
+                        get id() {
+                                return messageDiv.dataset.messageId;
+                        },
                         sender: messageData.sender,
                         msg: messageData.message,
                 });
@@ -644,6 +949,34 @@ function addMessage(messageData, shouldStore = true, conversationKey = getConver
         chat.scrollTop = chat.scrollHeight;
 }
 
+function formatFileSize(bytes) {
+        if (bytes < 1024) {
+                return `${bytes} B`;
+        }
+        if (bytes < 1024 * 1024) {
+                return `${(bytes / 1024).toFixed(1)} KB`;
+        }
+        return `${(bytes / (1024 * 1024)).toFixed(1)} MB`;
+}
+
+function buildAttachmentBlock(attachment) {
+        const link = document.createElement("a");
+        link.className = "message-attachment";
+        link.href = attachment.url;
+        link.target = "_blank";
+        link.rel = "noopener";
+        if (attachment.thumbnail_url) {
+                const image = document.createElement("img");
+                image.src = attachment.thumbnail_url;
+                image.alt = attachment.filename;
+                image.loading = "lazy";
+                link.appendChild(image);
+        } else {
+                link.textContent = `📎 ${attachment.filename} (${formatFileSize(attachment.size)})`;
+        }
+        return link;
+}
+
 function addStickerMessage(sender, file, type = "other", shouldStore = true, conversationKey = getConversationStorageKey(), avatarUrl = null) {
         if (shouldStore) {
                 const isPrivateThread =
@@ -767,10 +1100,71 @@ function clearReply() {
         document.getElementById("reply-preview-text").textContent = "";
 }
 
-function jumpToMessage(messageId) {
-        const target =
+function findMessageElement(messageId) {
+        return (
                 messageElementsById.get(messageId) ||
-                document.querySelector(`[data-message-id="${messageId}"]`);
+                document.querySelector(`[data-message-id="${CSS.escape(messageId)}"]`)
+        );
+}
+
+// Parents older than what is loaded are fetched with the messages around
+// them and merged into the conversation in id order.
+async function loadReplyContext(conversationKey, messageId) {
+        let url;
+        let normalize;
+        if (conversationKey.startsWith("room:")) {
+                const room = conversationKey.slice("room:".length);
+                url = `/api/rooms/thread?room=${encodeURIComponent(room)}&seq=${encodeURIComponent(messageId)}`;
+                normalize = normalizeRoomHistoryMessage;
+        } else {
+                const conversationId = conversationKey.slice("private:".length);
+                if (!/^\d+$/.test(conversationId) || !/^\d+$/.test(messageId)) {
+                        return;
+                }
+                url = `/api/private-chats/${conversationId}/messages/${messageId}/thread`;
+                normalize = normalizePrivateHistoryMessage;
+        }
+
+        try {
+                const response = await fetch(url);
+                if (!response.ok) {
+                        return;
+                }
+                const payload = await response.json();
+                const existing = roomMessages[conversationKey] || [];
+                const fetched = (payload.messages || [])
+                        .map(normalize)
+                        .filter((msg) => !findStoredMessage(conversationKey, msg.id));
+                const merged = [];
+                let position = 0;
+                existing.forEach((msg) => {
+                        const id = Number(msg.id);
+                        while (
+                                position < fetched.length &&
+                                Number.isFinite(id) &&
+                                Number(fetched[position].id) < id
+                        ) {
+                                merged.push(fetched[position]);
+                                position += 1;
+                        }
+                        merged.push(msg);
+                });
+                roomMessages[conversationKey] = merged.concat(fetched.slice(position));
+                persistRoomMessages();
+                if (conversationKey === getConversationStorageKey()) {
+                        renderConversationMessages(conversationKey);
+                }
+        } catch (_error) {
+                // Leave the reply unresolved; the next click tries again
+        }
+}
+
+async function jumpToMessage(messageId, conversationKey = getConversationStorageKey()) {
+        let target = findMessageElement(messageId);
+        if (!target) {
+                await loadReplyContext(conversationKey, messageId);
+                target = findMessageElement(messageId);
+        }
         if (!target) {
                 return;
         }
@@ -780,6 +1174,22 @@ function jumpToMessage(messageId) {
         setTimeout(() => target.classList.remove("message-highlight"), 1200);
 }
 
+function assignMessageId(messageData, conversationKey, ack) {
+        if (!ack || !ack.id) {
+                return;
+        }
+
+        const element = messageElementsById.get(messageData.id);
+        if (element && conversationKey === getConversationStorageKey()) {
+                messageElementsById.delete(messageData.id);
+                element.dataset.messageId = ack.id;
+                messageElementsById.set(ack.id, element);
+        }
+        messageData.id = String(ack.id);
+        messageIndexes.delete(roomMessages[conversationKey] || []);
+        persistRoomMessages();
+}
+
 function sendMessage() {
         const input = document.getElementById("message");
         const message = input.value.trim();
@@ -794,16 +1204,19 @@ function sendMessage() {
 
         if (!message) return;
 
+        stopTyping();
         if (currentPrivateConversation) {
                 const target = currentPrivateConversation.username;
-                addMessage({
+                const conversationKey = getConversationStorageKey();
+                const pending = {
                         sender: username,
                         message,
                         type: "own",
                         threadType: "private",
-                        replyTo: replyContext,
+                        replyToId: replyContext?.id || null,
                         avatarUrl: currentUserAvatarSrc,
-                });
+                };
+                addMessage(pending, true, conversationKey);
                 upsertDmThread({
                         conversation_id: currentPrivateConversation.id,
                         username: currentPrivateConversation.username,
@@ -813,43 +1226,48 @@ function sendMessage() {
                         unread_count: 0,
                 });
 
-                socket.emit("message", {
-                        msg: message,
-                        type: "private",
-                        target,
-                        reply_to: replyContext,
-                });
+                socket.emit(
+                        "message",
+                        {
+                                msg: message,
+                                type: "private",
+                                target,
+                                reply_to_id: replyContext?.id || null,
+                        },
+                        (ack) => assignMessageId(pending, conversationKey, ack),
+                );
         } else if (message.startsWith("@")) {
                 const [target, ...msgParts] = message.substring(1).split(" ");
                 const privateMsg = msgParts.join(" ");
 
                 if (privateMsg) {
                         const conversationKey = `private:direct:${target}`;
-                        addMessage(
+                        const pending = {
+                                sender: username,
+                                message: privateMsg,
+                                type: "own",
+                                threadType: "private",
+                                replyToId: replyContext?.id || null,
+                                avatarUrl: currentUserAvatarSrc,
+                        };
+                        addMessage(pending, true, conversationKey);
+
+                        socket.emit(
+                                "message",
                                 {
-                                        sender: username,
-                                        message: privateMsg,
-                                        type: "own",
-                                        threadType: "private",
-                                        replyTo: replyContext,
-                                        avatarUrl: currentUserAvatarSrc,
+                                        msg: privateMsg,
+                                        type: "private",
+                                        target: target,
+                                        reply_to_id: replyContext?.id || null,
                                 },
-                                true,
-                                conversationKey,
+                                (ack) => assignMessageId(pending, conversationKey, ack),
                         );
-
-                        socket.emit("message", {
-                                msg: privateMsg,
-                                type: "private",
-                                target: target,
-                                reply_to: replyContext,
-                        });
                 }
         } else {
                 socket.emit("message", {
                         msg: message,
                         room: currentRoom,
-                        reply_to: replyContext,
+                        reply_to_id: replyContext?.id || null,
                 });
         }
 
@@ -910,6 +1328,123 @@ function sendSticker(file) {
         });
 }
 
+const ATTACHMENT_RETRY_LIMIT = 5;
+
+async function fetchUploadOffset(uploadId) {
+        const response = await fetch(`/api/attachments/uploads/${uploadId}`);
+        const payload = await response.json();
+        if (!response.ok) {
+                throw new Error(payload.error || "Upload not found.");
+        }
+        return payload.received;
+}
+
+// Sends the file in chunks. After a dropped request it asks the server how
+// much arrived and carries on from there instead of starting over.
+async function uploadAttachment(file) {
+        const beginResponse = await fetch("/api/attachments/uploads", {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({
+                        filename: file.name,
+                        content_type: file.type,
+                        size: file.size,
+                }),
+        });
+        const upload = await beginResponse.json();
+        if (!beginResponse.ok) {
+                throw new Error(upload.error || "Unable to start the upload.");
+        }
+
+        let received = upload.received;
+        let failures = 0;
+        while (received < file.size) {
+                const end = Math.min(received + upload.chunk_size, file.size);
+                let response;
+                try {
+                        response = await fetch(`/api/attachments/uploads/${upload.upload_id}`, {
+                                method: "PUT",
+                                headers: { "Content-Range": `bytes ${received}-${end - 1}/${file.size}` },
+                                body: file.slice(received, end),
+                        });
+                } catch (error) {
+                        failures += 1;
+                        if (failures > ATTACHMENT_RETRY_LIMIT) {
+                                throw error;
+                        }
+                        await new Promise((resolve) => setTimeout(resolve, 1000 * failures));
+                        received = await fetchUploadOffset(upload.upload_id).catch(() => received);
+                        continue;
+                }
+                const payload = await response.json();
+                // 409 means the server has a different offset; resume from it
+                if (!response.ok && response.status !== 409) {
+                        throw new Error(payload.error || "Upload failed.");
+                }
+                failures = 0;
+                received = payload.received;
+                showRoomFeedback(`Uploading ${file.name}... ${Math.floor((received / file.size) * 100)}%`);
+        }
+
+        const completeResponse = await fetch(
+                `/api/attachments/uploads/${upload.upload_id}/complete`,
+                { method: "POST" },
+        );
+        const result = await completeResponse.json();
+        if (!completeResponse.ok) {
+                throw new Error(result.error || "Unable to finish the upload.");
+        }
+        return result.attachment;
+}
+
+async function sendAttachment(file) {
+        if (!file || !currentPrivateConversation) {
+                return;
+        }
+
+        const conversation = currentPrivateConversation;
+        const input = document.getElementById("message");
+        const caption = input.value.trim();
+        showRoomFeedback(`Uploading ${file.name}...`);
+        try {
+                const attachment = await uploadAttachment(file);
+                const conversationKey = `private:${conversation.id}`;
+                const pending = {
+                        sender: username,
+                        message: caption,
+                        type: "own",
+                        threadType: "private",
+                        attachment,
+                        avatarUrl: currentUserAvatarSrc,
+                };
+                addMessage(pending, true, conversationKey);
+                upsertDmThread({
+                        conversation_id: conversation.id,
+                        username: conversation.username,
+                        display_name: conversation.display_name,
+                        preview: getAttachmentPreview(attachment),
+                        updated_at: new Date().toISOString(),
+                        unread_count: 0,
+                });
+                socket.emit(
+                        "message",
+                        {
+                                type: "private_attachment",
+                                target: conversation.username,
+                                attachment_id: attachment.id,
+                                msg: caption,
+                        },
+                        (ack) => assignMessageId(pending, conversationKey, ack),
+                );
+                if (caption && input.value.trim() === caption) {
+                        input.value = "";
+                }
+                showRoomFeedback("");
+        } catch (error) {
+                showRoomFeedback(error.message || "Upload failed.", true);
+        }
+}
+
 function showRoomFeedback(message, isError = false) {
         const feedback = document.getElementById("room-access-feedback");
         if (!feedback) {
@@ -1038,46 +1573,56 @@ async function loadPrivateConversationHistory(conversationId) {
                 preview: latestMessage
                         ? latestMessage.message_type === "private_sticker"
                                 ? "📎 Sticker"
-                                : latestMessage.body || ""
+                                : latestMessage.attachment
+                                  ? getAttachmentPreview(latestMessage.attachment)
+                                  : latestMessage.body || ""
                         : "",
                 updated_at: latestMessage?.created_at || new Date().toISOString(),
                 unread_count: 0,
         });
-        roomMessages[key] = payload.messages.map((msg) => {
-                if (msg.message_type === "private_sticker") {
-                        return {
-                                id: String(msg.id),
-                                sender: msg.sender_username,
-                                message: msg.sticker_file,
-                                type: `sticker:${msg.sender_username === username ? "own" : "private"}`,
-                                threadType: "private",
-                                status: msg.status || "sent",
-                                delivered_at: msg.delivered_at,
-                                read_at: msg.read_at,
-                        };
-                }
+        roomMessages[key] = payload.messages.map(normalizePrivateHistoryMessage);
+        persistRoomMessages();
+}
 
+function normalizePrivateHistoryMessage(msg) {
+        if (msg.message_type === "private_sticker") {
                 return {
                         id: String(msg.id),
                         sender: msg.sender_username,
-                        message: msg.body || "",
-                        type: msg.sender_username === username ? "own" : "private",
+                        message: msg.sticker_file,
+                        type: `sticker:${msg.sender_username === username ? "own" : "private"}`,
                         threadType: "private",
                         status: msg.status || "sent",
                         delivered_at: msg.delivered_at,
                         read_at: msg.read_at,
                 };
-        });
-        persistRoomMessages();
+        }
+
+        return {
+                id: String(msg.id),
+                sender: msg.sender_username,
+                message: msg.body || "",
+                type: msg.sender_username === username ? "own" : "private",
+                threadType: "private",
+                attachment: msg.attachment || null,
+                replyToId: msg.reply_to_id ? String(msg.reply_to_id) : null,
+                status: msg.status || "sent",
+                delivered_at: msg.delivered_at,
+                read_at: msg.read_at,
+        };
 }
 
 
 async function markConversationRead(conversationId) {
         try {
-                await fetch(`/api/private-chats/${conversationId}/read`, {
-                        method: "POST",
-                });
-                socket.emit("mark_private_read", { conversation_id: conversationId });
+                // The server coalesces read marks, so one path is enough
+                if (socket.connected) {
+                        socket.emit("mark_private_read", { conversation_id: conversationId });
+                } else {
+                        await fetch(`/api/private-chats/${conversationId}/read`, {
+                                method: "POST",
+                        });
+                }
                 upsertDmThread({
                         conversation_id: conversationId,
                         unread_count: 0,
@@ -1088,6 +1633,7 @@ async function markConversationRead(conversationId) {
 }
 
 async function openPrivateConversation(conversationId, target) {
+        stopTyping();
         currentPrivateConversation = {
                 id: conversationId,
                 username: target.username,
@@ -1109,6 +1655,7 @@ async function openPrivateConversation(conversationId, target) {
                 await loadPrivateConversationHistory(conversationId);
                 renderConversationMessages(getConversationStorageKey());
                 updateChatHeaderTitle();
+                renderTypingIndicator();
                 await markConversationRead(conversationId);
                 showRoomFeedback(`Private chat with ${getPrivateConversationLabel()}`);
         } catch (error) {
@@ -1260,33 +1807,47 @@ function renderConversationMessages(conversationKey) {
         });
 }
 
+function buildJoinPayload(room) {
+        const cursor = roomHistoryCursors[room];
+        if (!cursor || typeof cursor.seq !== "number" || !roomMessages[`room:${room}`]) {
+                return { room };
+        }
+
+        return { room, since_seq: cursor.seq, epoch: cursor.epoch };
+}
+
 function joinRoom(room) {
         if (currentPrivateConversation) {
                 currentPrivateConversation = null;
         }
         setChatScope();
 
+        stopTyping();
         socket.emit("leave", { room: currentRoom });
         currentRoom = room;
         canSendInCurrentRoom = true;
         updateComposerAccess();
-        socket.emit("join", { room });
+        socket.emit("join", buildJoinPayload(room));
 
         highlightActiveRoom(room);
         renderDmChatList();
         clearReply();
         renderConversationMessages(getConversationStorageKey());
         updateChatHeaderTitle();
+        renderTypingIndicator();
 }
 
 function updateComposerAccess() {
         const messageInput = document.getElementById("message");
         const sendButton = document.getElementById("send-button");
         const stickerButton = document.getElementById("sticker-toggle");
+        const attachButton = document.getElementById("attach-button");
 
         if (!messageInput || !sendButton || !stickerButton) {
                 return;
         }
+        // Attachments are only sent in DMs between signed-in users
+        attachButton?.classList.toggle("hidden", !currentPrivateConversation || !isAuthenticated);
 
         const canSend = currentPrivateConversation ? true : canSendInCurrentRoom;
         messageInput.disabled = !canSend;
@@ -1332,6 +1893,16 @@ document.addEventListener("DOMContentLoaded", () => {
         if (roomCodeInput) {
                 roomCodeInput.addEventListener("keypress", handleRoomCodeEnter);
         }
+        const messageInput = document.getElementById("message");
+        if (messageInput) {
+                messageInput.addEventListener("input", () => {
+                        if (messageInput.value.trim()) {
+                                notifyTyping();
+                        } else {
+                                stopTyping();
+                        }
+                });
+        }
 
         hydrateDmThreadList();
 
@@ -0,0 +1,17 @@
+import pytest
+from flask import Flask
+
+from models import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A bare app with the models on a throwaway SQLite database."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "chat.db"}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
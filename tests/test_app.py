@@ -0,0 +1,232 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+import main
+from migrations import upgrade
+from models import Conversation, Message, User, db
+
+
+def build_app(tmp_path, name, **config):
+    root = tmp_path / name
+    app = main.create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{root / "chat.db"}',
+        'ROOM_STORE_DIR': str(root / 'rooms'),
+        'ROOM_ARCHIVE_DIR': str(root / 'room_archive'),
+        'ATTACHMENT_DIR': str(root / 'attachments'),
+        'COMPACTION_INTERVAL_HOURS': 0,
+        'LOG_LEVEL': 'WARNING',
+        **config
+    })
+    with app.app_context():
+        upgrade(db.engine)
+    return app
+
+
+@pytest.fixture
+def apps(tmp_path):
+    (tmp_path / 'one').mkdir()
+    (tmp_path / 'two').mkdir()
+    return build_app(tmp_path, 'one'), build_app(tmp_path, 'two')
+
+
+def test_apps_in_one_process_keep_their_own_state(apps):
+    one, two = apps
+    assert one.extensions['chat'] is not two.extensions['chat']
+    assert one.extensions['chat'].socketio is not two.extensions['chat'].socketio
+
+    http = one.test_client()
+    http.get('/')
+    response = http.post('/api/rooms', data={'room_name': 'Only One', 'visibility': 'public'})
+    assert response.status_code == 200
+    client = one.extensions['chat'].socketio.test_client(one, flask_test_client=http)
+    client.emit('join', {'room': 'Only One'})
+    client.emit('message', {'room': 'Only One', 'msg': 'hello'})
+
+    state_one, state_two = one.extensions['chat'], two.extensions['chat']
+    assert len(state_one.active_users) == 1 and not state_two.active_users
+    assert 'Only One' in state_one.room_directory
+    assert 'Only One' not in state_two.room_directory
+    assert [entry['msg'] for entry in state_one.room_message_history['Only One']] == ['hello']
+    assert 'Only One' not in state_two.room_message_history
+
+    client.disconnect()
+    assert not state_one.active_users
+
+
+def test_join_restores_only_public_archived_rooms(apps):
+    app, _ = apps
+    state = app.extensions['chat']
+    owner = app.test_client()
+    owner.get('/')
+    code = owner.post('/api/rooms', data={'room_name': 'Secret', 'visibility': 'private'}).json['code']
+    owner.post('/api/rooms', data={'room_name': 'Lobby', 'visibility': 'public'})
+    with app.app_context():
+        main.archive_room('Secret')
+        main.archive_room('Lobby')
+
+    stranger = app.test_client()
+    stranger.get('/')
+    client = state.socketio.test_client(app, flask_test_client=stranger)
+    client.emit('join', {'room': 'Secret'})
+    client.emit('join', {'room': 'Lobby'})
+    assert 'Secret' not in state.room_directory
+    assert 'Lobby' in state.room_directory
+
+    assert stranger.post('/api/rooms/join', data={'room_code': code}).status_code == 200
+    assert 'Secret' in state.room_directory
+    client.disconnect()
+
+
+def test_login_rehashes_passwords_stored_with_an_old_method(tmp_path):
+    app = build_app(tmp_path, 'auth', PASSWORD_HASH_METHOD='pbkdf2:sha256:1000')
+    with app.app_context():
+        db.session.add(User(username='alice', email='alice@example.com',
+                            password_hash=generate_password_hash('secret', 'pbkdf2:sha256:2000')))
+        db.session.commit()
+
+    response = app.test_client().post('/login', data={'username': 'alice', 'password': 'secret'})
+
+    assert response.status_code == 302
+    with app.app_context():
+        assert User.query.filter_by(username='alice').one().password_hash.startswith(
+            'pbkdf2:sha256:1000$')
+
+
+def test_login_attempts_are_limited_per_username_across_clients(tmp_path):
+    app = build_app(tmp_path, 'auth', AUTH_RATE_LIMITS={'login': (0.01, 10),
+                                                         'login_user': (0.01, 2)})
+    http = app.test_client()
+
+    statuses = [
+        http.post('/login', data={'username': 'alice', 'password': 'guess'},
+                  environ_base={'REMOTE_ADDR': f'10.0.0.{client}'}).status_code
+        for client in range(3)
+    ]
+
+    assert statuses == [200, 200, 429]
+
+
+def test_messages_to_a_private_room_need_access(apps):
+    app, _ = apps
+    state = app.extensions['chat']
+    owner = app.test_client()
+    owner.get('/')
+    owner.post('/api/rooms', data={'room_name': 'Secret', 'visibility': 'private'})
+
+    stranger = app.test_client()
+    stranger.get('/')
+    client = state.socketio.test_client(app, flask_test_client=stranger)
+    client.get_received()
+    client.emit('message', {'room': 'Secret', 'msg': 'hello'})
+    client.emit('message', {'room': 'Secret', 'type': 'sticker', 'file': 'cat.png'})
+
+    assert not state.room_message_history.get('Secret')
+    errors = [packet for packet in client.get_received() if packet['name'] == 'message_error']
+    assert len(errors) == 2
+    client.disconnect()
+
+
+def test_sending_a_direct_message_clears_the_senders_typing_state(tmp_path):
+    app = build_app(tmp_path, 'dm', PASSWORD_HASH_METHOD='pbkdf2:sha256:1000')
+    state = app.extensions['chat']
+    for name in ('alice', 'bob'):
+        app.test_client().post('/register', data={'username': name,
+                                                  'email': f'{name}@example.com',
+                                                  'password': 'secret',
+                                                  'confirm_password': 'secret'})
+    http = app.test_client()
+    http.post('/login', data={'username': 'alice', 'password': 'secret'})
+    client = state.socketio.test_client(app, flask_test_client=http)
+    client.emit('message', {'type': 'private', 'target': 'bob', 'msg': 'hi'})
+    with app.app_context():
+        conversation_id = Conversation.query.one().id
+
+    for message in ({'type': 'private', 'target': 'bob', 'msg': 'again'},
+                    {'type': 'private_sticker', 'target': 'bob', 'file': 'cat.png'}):
+        client.emit('typing', {'conversation_id': conversation_id})
+        assert state.typing_tracker._typing
+        client.emit('message', message)
+        assert not state.typing_tracker._typing
+    client.disconnect()
+
+
+@pytest.fixture
+def chat(tmp_path):
+    app = build_app(tmp_path, 'chat', PASSWORD_HASH_METHOD='pbkdf2:sha256:1000',
+                    SOCKET_RATE_LIMITS={}, REPLY_CHAIN_MAX_DEPTH=2)
+    clients = {}
+    for name in ('alice', 'bob', 'carol'):
+        http = app.test_client()
+        http.post('/register', data={'username': name, 'email': f'{name}@example.com',
+                                     'password': 'secret', 'confirm_password': 'secret'})
+        clients[name] = http
+    socket = app.extensions['chat'].socketio.test_client(app, flask_test_client=clients['alice'])
+    yield app, clients['alice'], socket
+    socket.disconnect()
+
+
+def send_private(socket, target, msg, **extra):
+    return int(socket.emit('message', {'type': 'private', 'target': target, 'msg': msg, **extra},
+                           callback=True)['id'])
+
+
+def stored_reply_to(app, message_id):
+    with app.app_context():
+        return db.session.get(Message, message_id).reply_to_id
+
+
+def test_private_replies_stay_inside_their_conversation(chat):
+    app, _, socket = chat
+    first = send_private(socket, 'bob', 'first')
+    elsewhere = send_private(socket, 'carol', 'elsewhere')
+
+    dropped = send_private(socket, 'bob', 'reply', reply_to_id=elsewhere)
+    legacy = send_private(socket, 'bob', 'reply', reply_to={'id': first, 'msg': 'first'})
+
+    assert stored_reply_to(app, dropped) is None
+    assert stored_reply_to(app, legacy) == first
+
+
+def test_private_thread_context_and_chain(chat):
+    app, http, socket = chat
+    ids = [send_private(socket, 'bob', 'first')]
+    for number in range(4):
+        ids.append(send_private(socket, 'bob', f'reply {number}', reply_to_id=ids[-1]))
+    elsewhere = send_private(socket, 'carol', 'elsewhere')
+    with app.app_context():
+        conversation_id = db.session.get(Message, ids[0]).conversation_id
+    url = f'/api/private-chats/{conversation_id}/messages/{{}}/thread'
+
+    context = http.get(url.format(ids[2]), query_string={'before': 1, 'after': 1}).json
+    assert [int(message['id']) for message in context['messages']] == ids[1:4]
+
+    # REPLY_CHAIN_MAX_DEPTH=2: the message and two ancestors
+    chain = http.get(url.format(ids[4]), query_string={'mode': 'chain'}).json
+    assert [int(message['id']) for message in chain['messages']] == ids[2:5]
+
+    for mode in ('context', 'chain'):
+        response = http.get(url.format(elsewhere), query_string={'mode': mode})
+        assert response.status_code == 404
+
+
+def test_room_thread_context_and_chain(chat):
+    app, http, socket = chat
+    guest = app.test_client()
+    guest.get('/')
+    guest.post('/api/rooms', data={'room_name': 'Lobby', 'visibility': 'public'})
+    socket.emit('join', {'room': 'Lobby'})
+    socket.emit('message', {'room': 'Lobby', 'msg': 'first'})
+    for seq in range(1, 5):
+        socket.emit('message', {'room': 'Lobby', 'msg': f'reply {seq}', 'reply_to_id': seq})
+
+    context = http.get('/api/rooms/thread', query_string={'room': 'Lobby', 'seq': 3,
+                                                          'before': 1, 'after': 1}).json
+    assert [message['seq'] for message in context['messages']] == [2, 3, 4]
+
+    chain = http.get('/api/rooms/thread', query_string={'room': 'Lobby', 'seq': 5,
+                                                        'mode': 'chain'}).json
+    assert [message['seq'] for message in chain['messages']] == [3, 4, 5]
+
+    response = http.get('/api/rooms/thread', query_string={'room': 'Lobby', 'seq': 99})
+    assert response.status_code == 404
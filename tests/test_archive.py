@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from archive import ARCHIVED, RESTORED, RoomArchive
+from serialization import dumps, loads
+
+META = {'code': 'ABC123', 'is_public': False, 'created_by': 'ada'}
+
+
+def messages(first, last):
+    return [(seq, dumps({'seq': seq, 'msg': f'message {seq}'})) for seq in range(first, last + 1)]
+
+
+def seqs(frames):
+    return [loads(frame.encoded)['seq'] for frame in frames]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return RoomArchive(str(tmp_path / 'archive'), segment_size=2)
+
+
+def test_archive_writes_segments_and_reads_newest_first(archive):
+    assert archive.archive('Lobby', META, messages(1, 5), 5, 'inactive') == 5
+
+    entry = archive.get('Lobby')
+    assert entry['state'] == ARCHIVED
+    assert [(s['first_seq'], s['last_seq']) for s in entry['segments']] == [(1, 2), (3, 4),
+                                                                              (5, 5)]
+    assert seqs(archive.read('Lobby', limit=3)) == [3, 4, 5]
+    assert seqs(archive.read('Lobby', before_seq=4, limit=10)) == [1, 2, 3]
+    assert archive.read('Nowhere') == []
+
+
+def test_index_survives_reload(archive):
+    archive.archive('Lobby', META, messages(1, 3), 3, 'expired')
+
+    reopened = RoomArchive(archive.root, segment_size=2)
+    assert reopened.is_archived('Lobby')
+    assert reopened.room_for_code('ABC123') == 'Lobby'
+    assert seqs(reopened.read('Lobby')) == [1, 2, 3]
+
+
+def test_restore_then_archive_appends_only_new_messages(archive):
+    archive.archive('Lobby', META, messages(1, 3), 3, 'inactive')
+
+    meta, frames, last_seq = archive.restore('Lobby', limit=2)
+    assert meta == META and seqs(frames) == [2, 3] and last_seq == 3
+    assert archive.get('Lobby')['state'] == RESTORED
+    assert archive.room_for_code('ABC123') is None
+    assert archive.restore('Lobby', limit=2) is None
+
+    assert archive.archive('Lobby', META, messages(2, 6), 6, 'inactive') == 3
+    assert len(archive.get('Lobby')['segments']) == 4
+    assert seqs(archive.read('Lobby', limit=10)) == [1, 2, 3, 4, 5, 6]
+
+
+def test_delete_removes_segments(archive):
+    archive.archive('Lobby', META, messages(1, 3), 3, 'expired')
+    room_dir = archive._room_dir('Lobby')
+    assert os.listdir(room_dir)
+
+    archive.delete('Lobby')
+    assert archive.get('Lobby') is None
+    assert not os.path.exists(room_dir)
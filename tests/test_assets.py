@@ -0,0 +1,42 @@
+import io
+import os
+
+import pytest
+
+import assets
+from assets import SOCKETIO_CLIENT_PATH, integrity_digest, verify_socketio_client
+
+CLIENT = b'/* socket.io client */'
+
+
+def test_verify_checks_the_vendored_client(tmp_path):
+    static_dir = str(tmp_path)
+    assert verify_socketio_client(static_dir, integrity_digest(CLIENT)) is False
+
+    path = tmp_path / SOCKETIO_CLIENT_PATH
+    path.parent.mkdir()
+    path.write_bytes(CLIENT)
+    assert verify_socketio_client(static_dir, integrity_digest(CLIENT)) is True
+    with pytest.raises(ValueError):
+        verify_socketio_client(static_dir, integrity_digest(b'tampered'))
+
+
+def test_vendor_refuses_a_download_that_does_not_match(tmp_path, monkeypatch):
+    monkeypatch.setattr(assets.urllib.request, 'urlopen',
+                        lambda url, timeout: io.BytesIO(CLIENT))
+
+    with pytest.raises(ValueError):
+        assets.vendor_socketio_client(str(tmp_path), integrity=integrity_digest(b'other'))
+    assert not os.path.exists(tmp_path / SOCKETIO_CLIENT_PATH)
+
+    path = assets.vendor_socketio_client(str(tmp_path), integrity=integrity_digest(CLIENT))
+    with open(path, 'rb') as handle:
+        assert handle.read() == CLIENT
+
+
+def test_build_fails_without_the_vendored_client(tmp_path):
+    (tmp_path / 'chat.js').write_bytes(b'console.log(1);')
+
+    with pytest.raises(FileNotFoundError):
+        assets.build_assets(str(tmp_path))
+    assert not os.path.exists(tmp_path / assets.DIST_DIRNAME)
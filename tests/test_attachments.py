@@ -0,0 +1,140 @@
+import hashlib
+import io
+import os
+from datetime import timedelta
+
+import pytest
+
+from attachments import AttachmentStore, UploadLimitExceeded, UploadOffsetMismatch
+from models import Attachment, AttachmentUpload, Message, db
+
+CONTENT = bytes(range(256)) * 2
+
+
+@pytest.fixture
+def store(app, tmp_path):
+    return AttachmentStore(str(tmp_path / 'attachments'), max_size=1024, max_chunk=200)
+
+
+def upload_all(store, upload, content=CONTENT):
+    for start in range(0, len(content), store.max_chunk):
+        chunk = content[start:start + store.max_chunk]
+        store.write_chunk(upload, start, len(chunk), io.BytesIO(chunk))
+
+
+def test_begin_validates_and_sanitizes(store):
+    upload = store.begin(1, '..\\..\\notes.txt', 'not a type', 10)
+    assert upload.filename == 'notes.txt'
+    assert upload.content_type == 'text/plain'
+    assert store.received(upload) == 0
+
+    with pytest.raises(ValueError):
+        store.begin(1, 'big.bin', None, 1025)
+    with pytest.raises(ValueError):
+        store.begin(1, '   ', None, 10)
+
+
+def test_begin_limits_open_uploads_per_user(app, tmp_path):
+    store = AttachmentStore(str(tmp_path), max_size=1024, max_chunk=200,
+                            max_open_uploads=2, max_pending_bytes=1500)
+    store.begin(1, 'a.bin', None, 1000)
+    with pytest.raises(UploadLimitExceeded):
+        store.begin(1, 'b.bin', None, 600)
+    store.begin(1, 'b.bin', None, 500)
+    with pytest.raises(UploadLimitExceeded):
+        store.begin(1, 'c.bin', None, 1)
+    # Other users have their own allowance
+    store.begin(2, 'c.bin', None, 1000)
+
+
+def test_complete_is_exclusive_and_runs_once(store):
+    upload = store.begin(1, 'data.bin', None, len(CONTENT))
+    upload_all(store, upload)
+
+    store._writing.add(upload.id)
+    with pytest.raises(UploadOffsetMismatch):
+        store.complete(upload)
+    store._writing.discard(upload.id)
+
+    assert store.complete(upload) is not None
+    # A second request holding the same upload finds it already completed
+    assert store.complete(upload) is None
+    assert Attachment.query.count() == 1
+
+
+def test_chunks_must_continue_from_the_received_offset(store):
+    upload = store.begin(1, 'data.bin', None, len(CONTENT))
+    assert store.write_chunk(upload, 0, 200, io.BytesIO(CONTENT[:200])) == 200
+
+    with pytest.raises(UploadOffsetMismatch) as mismatch:
+        store.write_chunk(upload, 0, 200, io.BytesIO(CONTENT[:200]))
+    assert mismatch.value.received == 200
+    with pytest.raises(ValueError):
+        store.write_chunk(upload, 200, 201, io.BytesIO(CONTENT[200:401]))
+    with pytest.raises(ValueError):
+        store.write_chunk(upload, 400, 200, io.BytesIO(CONTENT[400:600]))
+
+
+def test_interrupted_chunk_resumes_from_what_arrived(store):
+    upload = store.begin(1, 'data.bin', None, len(CONTENT))
+    # The client went away after 120 of the 200 bytes it announced
+    assert store.write_chunk(upload, 0, 200, io.BytesIO(CONTENT[:120])) == 120
+    with pytest.raises(UploadOffsetMismatch):
+        store.complete(upload)
+
+    received = store.received(upload)
+    for start in (received, received + 200):
+        chunk = CONTENT[start:start + 200]
+        store.write_chunk(upload, start, len(chunk), io.BytesIO(chunk))
+    attachment = store.complete(upload)
+    with open(store.blob_path(attachment), 'rb') as handle:
+        assert handle.read() == CONTENT
+
+
+def test_identical_uploads_share_one_blob(store):
+    first = store.begin(1, 'a.bin', None, len(CONTENT))
+    upload_all(store, first)
+    one = store.complete(first)
+    second = store.begin(2, 'b.bin', None, len(CONTENT))
+    upload_all(store, second)
+    two = store.complete(second)
+
+    assert one.sha256 == two.sha256 == hashlib.sha256(CONTENT).hexdigest()
+    assert one.id != two.id and two.filename == 'b.bin'
+    blobs = [name for _, _, names in os.walk(os.path.join(store.root, 'blobs')) for name in names]
+    assert blobs == [one.sha256]
+    assert os.listdir(os.path.join(store.root, 'partial')) == []
+    assert AttachmentUpload.query.count() == 0
+
+
+def test_prune_drops_stale_uploads(store):
+    upload = store.begin(1, 'data.bin', None, len(CONTENT))
+    store.write_chunk(upload, 0, 100, io.BytesIO(CONTENT[:100]))
+
+    assert store.prune_uploads(timedelta(hours=1)) == 0
+    assert store.prune_uploads(timedelta(0)) == 1
+    assert AttachmentUpload.query.count() == 0
+    assert os.listdir(os.path.join(store.root, 'partial')) == []
+
+
+def test_prune_attachments_keeps_referenced_and_shared_blobs(store):
+    kept, orphan, shared = [], [], []
+    for name, bucket, content in (('kept.bin', kept, CONTENT), ('orphan.bin', orphan, b'x' * 10),
+                                  ('copy.bin', shared, CONTENT)):
+        upload = store.begin(1, name, None, len(content))
+        upload_all(store, upload, content)
+        bucket.append(store.complete(upload))
+    db.session.add(Message(conversation_id=1, sender_id=1, recipient_id=2,
+                           body='', message_type='private_attachment',
+                           attachment_id=kept[0].id))
+    db.session.commit()
+    orphan_blob = store.blob_path(orphan[0])
+    os.utime(orphan_blob, (0, 0))
+
+    assert store.prune_attachments(timedelta(hours=1)) == 0
+    assert store.prune_attachments(timedelta(0)) == 2
+
+    assert [attachment.id for attachment in Attachment.query] == [kept[0].id]
+    assert not os.path.exists(orphan_blob)
+    # The referenced attachment still needs the blob its copy shared
+    assert os.path.exists(store.blob_path(kept[0]))
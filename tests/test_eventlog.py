@@ -0,0 +1,68 @@
+import pytest
+
+from eventlog import UserEventLog, user_room
+from models import UserEvent, db
+from serialization import loads
+
+
+class FakeSocketIO:
+
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, payload, to=None, skip_sid=None):
+        self.emitted.append((event, loads(payload.encoded), to, skip_sid))
+
+
+@pytest.fixture
+def socketio():
+    return FakeSocketIO()
+
+
+@pytest.fixture
+def log(app, socketio):
+    return UserEventLog(socketio, max_backlog=5)
+
+
+def test_append_numbers_events_per_user(log, socketio):
+    log.append('private_message', {'id': '1'}, [1, 2], skip_sid='sender-tab')
+    log.append('private_messages_read', {'receipts': []}, [1])
+
+    assert log.last_seq(1) == 2 and log.last_seq(2) == 1
+    assert socketio.emitted[0] == ('private_message', {'id': '1', 'seq': 1}, user_room(1),
+                                   'sender-tab')
+    assert socketio.emitted[-1][1]['seq'] == 2
+    assert UserEvent.query.count() == 3
+
+
+def test_backlog_replays_events_after_the_cursor(log):
+    for index in range(4):
+        log.append('private_message', {'id': str(index)}, [1])
+
+    encoded, last_seq = log.backlog(1, 1)
+    events = loads(encoded)
+    assert last_seq == 4
+    assert [event['seq'] for event in events] == [2, 3, 4]
+    assert events[0] == {'seq': 2, 'event': 'private_message', 'data': {'id': '1', 'seq': 2}}
+    assert log.backlog(1, 4) == ('[]', 4)
+
+
+def test_backlog_asks_for_resync_when_it_cannot_replay(log):
+    for index in range(7):
+        log.append('private_message', {'id': str(index)}, [1])
+
+    assert log.backlog(1, 8) is None  # cursor from another log
+    assert log.backlog(1, 1) is None  # more than max_backlog behind
+    UserEvent.query.filter(UserEvent.seq == 4).delete()
+    db.session.commit()
+    assert log.backlog(1, 3) is None  # pruned
+    assert log.backlog(1, 4) is not None
+
+
+def test_sequence_resumes_from_the_table(log, socketio):
+    log.append('private_message', {'id': '1'}, [1])
+    log.append('private_message', {'id': '2'}, [1])
+
+    restarted = UserEventLog(socketio)
+    restarted.append('private_message', {'id': '3'}, [1])
+    assert restarted.last_seq(1) == 3
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from memberships import RoomMembershipStore
+from models import RoomMember, db
+
+
+@pytest.fixture
+def store(app):
+    return RoomMembershipStore(cache_size=10)
+
+
+def test_merge_then_remove_moves_guest_rooms_to_the_user(store):
+    store.add_many('guest:token', ['alpha', 'beta'])
+    store.add('user:1', 'beta')
+
+    store.merge('guest:token', 'user:1')
+    store.remove_member('guest:token')
+
+    assert store.rooms_for('user:1') == {'alpha', 'beta'}
+    assert store.rooms_for('guest:token') == set()
+    assert RoomMember.query.filter_by(member_key='guest:token').count() == 0
+
+
+def test_prune_guests_drops_only_expired_guest_rows(store):
+    store.add('guest:old', 'alpha')
+    store.add('guest:new', 'alpha')
+    store.add('user:1', 'alpha')
+    RoomMember.query.filter(RoomMember.member_key.in_(['guest:old', 'user:1'])).update(
+        {'joined_at': datetime.utcnow() - timedelta(days=30)}, synchronize_session=False)
+    db.session.commit()
+
+    assert store.prune_guests(timedelta(days=7)) == 1
+
+    assert not store.is_member('guest:old', 'alpha')
+    assert store.is_member('guest:new', 'alpha')
+    assert store.is_member('user:1', 'alpha')
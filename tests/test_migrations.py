@@ -0,0 +1,91 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from migrations import LATEST_VERSION, MIGRATIONS, current_version, upgrade
+from models import db
+
+# Tables as db.create_all() made them before migrations existed, from before
+# the onboarding profile columns were added
+BASELINE_SCHEMA = [
+    'CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, '
+    'email VARCHAR(120) NOT NULL UNIQUE, password_hash VARCHAR(256) NOT NULL, '
+    'created_at DATETIME)',
+    'CREATE TABLE conversation (id INTEGER PRIMARY KEY, created_at DATETIME NOT NULL, '
+    'metadata JSON)',
+    'CREATE TABLE conversation_participant (id INTEGER PRIMARY KEY, '
+    'conversation_id INTEGER NOT NULL REFERENCES conversation (id), '
+    'user_id INTEGER NOT NULL REFERENCES user (id), joined_at DATETIME NOT NULL, '
+    'CONSTRAINT uq_conversation_user UNIQUE (conversation_id, user_id))',
+    'CREATE TABLE message (id INTEGER PRIMARY KEY, '
+    'conversation_id INTEGER NOT NULL REFERENCES conversation (id), '
+    'sender_id INTEGER NOT NULL REFERENCES user (id), recipient_id INTEGER REFERENCES user (id), '
+    'body TEXT, message_type VARCHAR(32) NOT NULL, sticker_file VARCHAR(255), '
+    'created_at DATETIME NOT NULL, delivered_at DATETIME, read_at DATETIME)',
+    "INSERT INTO user (id, username, email, password_hash) VALUES (1, 'ada', 'ada@x.io', 'x')",
+    "INSERT INTO conversation (id, created_at) VALUES (1, '2025-01-01 00:00:00')",
+    "INSERT INTO message (id, conversation_id, sender_id, body, message_type, created_at) "
+    "VALUES (1, 1, 1, 'hello', 'private', '2025-01-01 00:00:00')",
+]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "chat.db"}')
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_empty_database(engine):
+    assert current_version(engine) == 0
+    assert upgrade(engine) == list(range(1, LATEST_VERSION + 1))
+    assert current_version(engine) == LATEST_VERSION
+    assert upgrade(engine) == []
+    with engine.connect() as conn:
+        # INCREMENTAL, chosen before the first table was created
+        assert conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2
+
+
+def test_first_migration_creates_only_the_baseline(engine):
+    with engine.begin() as conn:
+        MIGRATIONS[0][2](conn)
+
+    inspector = inspect(engine)
+    assert set(inspector.get_table_names()) == {
+        'user', 'conversation', 'conversation_participant', 'message'}
+    assert 'display_name' not in {column['name'] for column in inspector.get_columns('user')}
+    assert 'attachment_id' not in {column['name'] for column in inspector.get_columns('message')}
+
+
+def test_migrations_build_the_model_schema(engine):
+    upgrade(engine)
+
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        assert {column['name'] for column in inspector.get_columns(table.name)} == {
+            column.name for column in table.columns}, table.name
+        assert {index.name for index in table.indexes} <= {
+            index['name'] for index in inspector.get_indexes(table.name)}, table.name
+
+
+def test_upgrade_baseline_database(engine):
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+
+    upgrade(engine)
+
+    inspector = inspect(engine)
+    user_columns = {column['name'] for column in inspector.get_columns('user')}
+    assert {'display_name', 'bio', 'avatar_url', 'is_profile_complete'} <= user_columns
+    message_indexes = {index['name'] for index in inspector.get_indexes('message')}
+    assert {'ix_message_recipient_delivered', 'ix_message_conversation_id'} <= message_indexes
+    assert {'ix_message_attachment_id', 'ix_message_reply_to_id'} <= message_indexes
+    assert inspector.has_table('room_member')
+    assert inspector.has_table('user_event')
+    assert inspector.has_table('attachment') and inspector.has_table('attachment_upload')
+    message_columns = {column['name'] for column in inspector.get_columns('message')}
+    assert {'attachment_id', 'reply_to_id'} <= message_columns
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT body FROM message')).scalar() == 'hello'
+        assert conn.execute(text('SELECT is_profile_complete FROM user')).scalar() == 0
+    assert current_version(engine) == LATEST_VERSION
@@ -0,0 +1,36 @@
+import threading
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from passwords import PasswordHasher, PasswordHasherBusy
+
+FAST_METHOD = 'pbkdf2:sha256:1000'
+
+
+def test_saturated_pool_raises_busy():
+    hasher = PasswordHasher(FAST_METHOD, max_workers=1, max_queue=0)
+    release = threading.Event()
+    worker = threading.Thread(target=hasher._submit, args=(release.wait,))
+    worker.start()
+    deadline = time.monotonic() + 5
+    while hasher.in_flight < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    try:
+        with pytest.raises(PasswordHasherBusy):
+            hasher.hash('secret')
+    finally:
+        release.set()
+        worker.join()
+
+    assert hasher.in_flight == 0
+    assert hasher.verify(hasher.hash('secret'), 'secret')
+
+
+def test_needs_rehash_compares_the_method_prefix():
+    hasher = PasswordHasher(FAST_METHOD)
+
+    assert not hasher.needs_rehash(hasher.hash('secret'))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:2000'))
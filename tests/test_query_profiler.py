@@ -0,0 +1,51 @@
+import pytest
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db
+from query_profiler import QueryProfiler
+
+
+@pytest.fixture
+def profiler(app):
+    profiler = QueryProfiler(enabled=True, n_plus_one_threshold=2)
+    profiler.install()
+    yield profiler
+    # The listeners are process-wide; switch them off for later tests
+    profiler.enabled = False
+
+
+def test_counts_statements_per_unit_of_work(profiler):
+    profiler.begin('test')
+    for _ in range(2):
+        db.session.execute(text('SELECT 1'))
+    stats = profiler.finish()
+
+    assert stats.count == 2
+    assert stats.statements == {'SELECT 1': 2}
+    assert 'query_stats' not in g
+
+
+def test_failed_statement_leaves_no_state_on_the_connection(profiler):
+    profiler.begin('test')
+    with pytest.raises(OperationalError):
+        db.session.execute(text('SELECT * FROM missing_table'))
+    db.session.rollback()
+    db.session.execute(text('SELECT 1'))
+    stats = profiler.finish()
+
+    assert 'SELECT 1' in stats.statements
+    assert 'SELECT * FROM missing_table' not in stats.statements
+    connection = db.session.connection().connection
+    assert 'query_started_at' not in connection.info
+
+
+def test_disabled_profiler_does_not_record_another_profilers_queries(profiler):
+    other = QueryProfiler(enabled=False)
+    other.install()
+    profiler.begin('test')
+    db.session.execute(text('SELECT 1'))
+    stats = profiler.finish()
+
+    assert stats.count == 1
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import pytest
+
+import ratelimit
+from ratelimit import EventRateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(ratelimit, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_burst_then_refill(clock):
+    limiter = EventRateLimiter({'message': (2, 3)})
+    assert [limiter.allow('message', 'sid') for _ in range(4)] == [True, True, True, False]
+
+    clock.now += 0.5
+    assert limiter.allow('message', 'sid')
+    assert not limiter.allow('message', 'sid')
+
+
+def test_unlisted_events_are_not_limited(clock):
+    limiter = EventRateLimiter({'message': (1, 1)})
+    assert all(limiter.allow('join', 'sid') for _ in range(100))
+
+
+def test_user_bucket_is_shared_across_sockets(clock):
+    limiter = EventRateLimiter({'message': (1, 3)})
+    for _ in range(3):
+        assert limiter.allow('message', 'tab-1', 'user:1')
+    assert not limiter.allow('message', 'tab-2', 'user:1')
+
+    # The rejected event was refunded to the second tab's own bucket
+    assert [limiter.allow('message', 'tab-2') for _ in range(4)] == [True, True, True, False]
+
+
+def test_evict_keeps_user_buckets_until_refilled(clock):
+    limiter = EventRateLimiter({'message': (1, 2)})
+    limiter.allow('message', 'sid', 'user:1')
+    limiter.evict('sid', 'user:1')
+    assert limiter._sid_buckets == {}
+    assert ('message', 'user:1') in limiter._user_buckets
+
+    clock.now += 1
+    limiter.evict('other-tab', 'user:1')
+    assert ('message', 'user:1') not in limiter._user_buckets
+
+
+def test_prune_threshold_sweeps_refilled_buckets(clock):
+    limiter = EventRateLimiter({'login': (1, 2)}, prune_threshold=3)
+    for address in ('10.0.0.1', '10.0.0.2'):
+        limiter.allow('login', address, 'ada')
+    assert len(limiter._sid_buckets) + len(limiter._user_buckets) == 3
+
+    clock.now += 2
+    limiter.allow('login', '10.0.0.3')
+    # Four buckets are over the threshold; the refilled ones are swept
+    limiter.allow('login', '10.0.0.4')
+    assert set(limiter._sid_buckets) == {('login', '10.0.0.3'), ('login', '10.0.0.4')}
+    assert limiter._user_buckets == {}
+
+
+def test_buckets_left_behind_by_disconnected_users_are_swept(clock):
+    limiter = EventRateLimiter({'message': (1, 5)}, prune_threshold=3)
+    for user in range(4):
+        limiter.allow('message', f'sid-{user}', f'user:{user}')
+        limiter.evict(f'sid-{user}', f'user:{user}')
+    # Still refilling when their sockets went away
+    assert len(limiter._user_buckets) == 4
+
+    clock.now += 1
+    limiter.allow('message', 'sid-new', 'user:new')
+    assert list(limiter._user_buckets) == [('message', 'user:new')]
+
+
+def test_sweeps_back_off_while_buckets_are_busy(clock):
+    limiter = EventRateLimiter({'message': (1, 5)}, prune_threshold=3)
+    sweeps = []
+    prune = limiter.prune
+    limiter.prune = lambda now=None: (sweeps.append(now), prune(now))
+
+    for sid in range(10):
+        limiter.allow('message', f'sid-{sid}')
+    # Swept past 4 buckets, none of which had refilled, and then not again
+    # until the table had doubled
+    assert len(sweeps) == 2
@@ -0,0 +1,70 @@
+from receipts import ReadReceiptAggregator
+
+
+class FakeSocketIO:
+
+    def __init__(self):
+        self.tasks = []
+
+    def start_background_task(self, target, *args):
+        self.tasks.append((target, args))
+
+    def sleep(self, seconds):
+        pass
+
+    def run_tasks(self):
+        while self.tasks:
+            target, args = self.tasks.pop(0)
+            target(*args)
+
+
+def make_aggregator():
+    socketio = FakeSocketIO()
+    flushed = []
+    return socketio, flushed, ReadReceiptAggregator(socketio, flushed.append, 250)
+
+
+def test_marks_coalesce_to_one_high_water_mark():
+    socketio, flushed, aggregator = make_aggregator()
+    aggregator.mark(1, 10, 5)
+    aggregator.mark(1, 10, 7)
+    aggregator.mark(1, 10, 3)
+    aggregator.mark(2, 10, 4)
+    assert aggregator.pending == 2
+    assert len(socketio.tasks) == 1
+
+    socketio.run_tasks()
+    assert flushed == [{(1, 10): 7, (2, 10): 4}]
+    assert aggregator.pending == 0
+
+
+def test_mark_without_id_covers_everything():
+    socketio, flushed, aggregator = make_aggregator()
+    aggregator.mark(1, 10, 5)
+    aggregator.mark(1, 10)
+    aggregator.mark(1, 10, 9)
+    socketio.run_tasks()
+    assert flushed == [{(1, 10): None}]
+
+
+def test_next_mark_after_a_flush_schedules_again():
+    socketio, flushed, aggregator = make_aggregator()
+    aggregator.mark(1, 10, 5)
+    socketio.run_tasks()
+    aggregator.mark(1, 10, 6)
+    assert len(socketio.tasks) == 1
+    socketio.run_tasks()
+    assert flushed == [{(1, 10): 5}, {(1, 10): 6}]
+
+
+def test_failed_flush_is_logged_not_raised(caplog):
+    socketio = FakeSocketIO()
+
+    def fail(marks):
+        raise RuntimeError('database is locked')
+
+    aggregator = ReadReceiptAggregator(socketio, fail)
+    aggregator.mark(1, 10, 5)
+    socketio.run_tasks()
+    assert 'Failed to apply 1 read marks' in caplog.text
+    assert aggregator.pending == 0
@@ -0,0 +1,34 @@
+import gzip
+import os
+from datetime import datetime, timedelta
+
+from models import Message, db
+from retention import MessageCompactor
+from serialization import loads
+
+
+def add_message(days_old, **columns):
+    message = Message(conversation_id=1, sender_id=1, recipient_id=2, body='hi',
+                      created_at=datetime.utcnow() - timedelta(days=days_old), **columns)
+    db.session.add(message)
+    db.session.commit()
+    return message
+
+
+def test_expired_parents_are_archived_and_replies_detached(app, tmp_path):
+    parent = add_message(40, attachment_id=7)
+    old_reply = add_message(35, reply_to_id=parent.id)
+    reply = add_message(1, reply_to_id=old_reply.id)
+    parent_id, old_reply_id = parent.id, old_reply.id
+    archive_dir = str(tmp_path / 'archive')
+    compactor = MessageCompactor({'private': 30}, archive_dir=archive_dir,
+                                 sleep=lambda seconds: None)
+
+    assert compactor.run()['messages_deleted'] == 2
+
+    assert db.session.get(Message, reply.id).reply_to_id is None
+    [name] = os.listdir(archive_dir)
+    with gzip.open(os.path.join(archive_dir, name), 'rt', encoding='utf-8') as handle:
+        archived = [loads(line) for line in handle]
+    assert [(row['id'], row['attachment_id'], row['reply_to_id']) for row in archived] == [
+        (parent_id, 7, None), (old_reply_id, None, parent_id)]
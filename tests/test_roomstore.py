@@ -0,0 +1,71 @@
+import pytest
+
+from roomstore import RoomStore
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path / 'rooms')
+
+
+def room(code):
+    return {'code': code, 'is_public': True, 'last_activity_at': '2025-01-01T00:00:00'}
+
+
+def test_load_replays_the_log(root):
+    rooms = {}
+    store = RoomStore(root, rooms)
+    for name, code in (('Lobby', 'AAA111'), ('Games', 'BBB222'), ('Music', 'CCC333')):
+        rooms[name] = room(code)
+        store.record_create(name)
+    rooms['Lobby']['is_public'] = False
+    store.record_update('Lobby', is_public=False)
+    del rooms['Music']
+    store.record_delete('Music')
+
+    recovered = {}
+    assert RoomStore(root, recovered).load() == 5
+    assert recovered == rooms
+
+
+def test_snapshot_truncates_the_log(root):
+    rooms = {}
+    store = RoomStore(root, rooms, snapshot_every=3)
+    for index in range(4):
+        rooms[f'room-{index}'] = room(f'CODE{index:02d}')
+        store.record_create(f'room-{index}')
+
+    recovered = {}
+    # Three operations went into the snapshot; one is left to replay
+    assert RoomStore(root, recovered).load() == 1
+    assert recovered == rooms
+
+
+def test_torn_final_line_is_dropped(root):
+    rooms = {'Lobby': room('AAA111')}
+    store = RoomStore(root, rooms)
+    store.record_create('Lobby')
+    with open(store.log_path, 'ab') as handle:
+        handle.write(b'{"op":"delete","ro')
+
+    recovered = {}
+    reloaded = RoomStore(root, recovered)
+    assert reloaded.load() == 1
+    assert recovered == rooms
+
+    recovered['Games'] = room('BBB222')
+    reloaded.record_create('Games')
+    assert RoomStore(root, {}).load() == 2
+
+
+def test_activity_updates_are_throttled(root):
+    rooms = {'Lobby': room('AAA111')}
+    store = RoomStore(root, rooms)
+    store.record_create('Lobby')
+    for minute in range(3):
+        rooms['Lobby']['last_activity_at'] = f'2025-01-01T00:0{minute}:00'
+        store.record_activity('Lobby')
+
+    recovered = {}
+    assert RoomStore(root, recovered).load() == 2
+    assert recovered['Lobby']['last_activity_at'] == '2025-01-01T00:00:00'
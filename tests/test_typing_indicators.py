@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+import typing_indicators
+from typing_indicators import TypingTracker
+
+
+class FakeSocketIO:
+    """Runs background tasks on demand; ``sleep`` advances the fake clock."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.tasks = []
+
+    def start_background_task(self, target, *args):
+        self.tasks.append((target, args))
+
+    def sleep(self, seconds):
+        self.clock.now += seconds
+
+    def run(self, name):
+        for task in list(self.tasks):
+            if task[0].__name__ == name:
+                self.tasks.remove(task)
+                task[0](*task[1])
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(typing_indicators, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    socketio = FakeSocketIO(clock)
+    published = []
+    tracker = TypingTracker(socketio, lambda channel, users: published.append((channel, users)),
+                            ttl=5.0, coalesce_ms=150)
+    return SimpleNamespace(tracker=tracker, socketio=socketio, published=published)
+
+
+def test_changes_within_the_window_are_coalesced(tracker):
+    channel = ('room', 'Lobby')
+    tracker.tracker.update(channel, 'bob', True)
+    tracker.tracker.update(channel, 'ada', True)
+    tracker.tracker.update(channel, 'ada', True)
+    assert [task[0].__name__ for task in tracker.socketio.tasks].count('_publish_later') == 1
+
+    tracker.socketio.run('_publish_later')
+    assert tracker.published == [(channel, ['ada', 'bob'])]
+
+
+def test_refresh_does_not_publish(tracker):
+    channel = ('room', 'Lobby')
+    tracker.tracker.update(channel, 'ada', True)
+    tracker.socketio.run('_publish_later')
+    tracker.tracker.update(channel, 'ada', True)
+    tracker.tracker.update(channel, 'bob', False)
+    assert not [task for task in tracker.socketio.tasks if task[0].__name__ == '_publish_later']
+
+
+def test_stop_and_clear_user(tracker):
+    room, dm = ('room', 'Lobby'), ('dm', 7)
+    tracker.tracker.update(room, 'ada', True)
+    tracker.tracker.update(dm, 'ada', True)
+    tracker.socketio.run('_publish_later')
+
+    tracker.tracker.update(room, 'ada', False)
+    tracker.tracker.clear_user('ada')
+    tracker.socketio.run('_publish_later')
+    assert sorted(tracker.published[2:]) == [(dm, []), (room, [])]
+
+
+def test_silent_typists_expire(tracker):
+    channel = ('dm', 7)
+    tracker.tracker.update(channel, 'ada', True)
+    tracker.socketio.run('_publish_later')
+
+    # The sweep sleeps one second per pass until nobody is typing
+    tracker.socketio.run('_sweep')
+    assert tracker.socketio.clock.now >= 105
+    tracker.socketio.run('_publish_later')
+    assert tracker.published[-1] == (channel, [])
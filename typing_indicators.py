@@ -0,0 +1,91 @@
+"""Ephemeral "who is typing" state for rooms and DM threads.
+
+Typing hints never touch message history or the database. Each channel
+(``('room', name)`` or ``('dm', conversation_id)``) keeps the users typing in
+it with an expiry time. Changes are coalesced per channel: the first change
+schedules one publish after ``coalesce_ms`` carrying the whole set, and any
+further changes in that window ride along. Entries expire after ``ttl``
+seconds without a refresh, so a client that vanishes mid-sentence stops
+showing as typing without sending anything.
+"""
+import threading
+import time
+from typing import Callable, Dict, Hashable, List
+
+Channel = Hashable
+
+
+class TypingTracker:
+
+    def __init__(self, socketio, publish: Callable[[Channel, List[str]], None],
+                 ttl: float = 5.0, coalesce_ms: int = 150):
+        self.socketio = socketio
+        self.publish = publish
+        self.ttl = ttl
+        self.coalesce = max(coalesce_ms, 0) / 1000
+        self._typing: Dict[Channel, Dict[str, float]] = {}
+        self._scheduled: set = set()
+        self._sweeping = False
+        self._lock = threading.Lock()
+
+    def update(self, channel: Channel, user: str, is_typing: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            typists = self._typing.get(channel, {})
+            was_typing = user in typists
+            if is_typing:
+                typists[user] = now + self.ttl
+                self._typing[channel] = typists
+            elif was_typing:
+                del typists[user]
+                if not typists:
+                    del self._typing[channel]
+            # Refreshing an existing entry only extends its expiry
+            if was_typing == is_typing:
+                return
+            self._schedule(channel)
+
+    def clear_user(self, user: str) -> None:
+        """Remove ``user`` from every channel, e.g. when their socket leaves."""
+        with self._lock:
+            for channel in [channel for channel, typists in self._typing.items()
+                            if user in typists]:
+                del self._typing[channel][user]
+                if not self._typing[channel]:
+                    del self._typing[channel]
+                self._schedule(channel)
+
+    def _schedule(self, channel: Channel) -> None:
+        # Caller holds the lock
+        if channel not in self._scheduled:
+            self._scheduled.add(channel)
+            self.socketio.start_background_task(self._publish_later, channel)
+        if self._typing and not self._sweeping:
+            self._sweeping = True
+            self.socketio.start_background_task(self._sweep)
+
+    def _publish_later(self, channel: Channel) -> None:
+        self.socketio.sleep(self.coalesce)
+        with self._lock:
+            self._scheduled.discard(channel)
+            users = sorted(self._typing.get(channel, ()))
+        self.publish(channel, users)
+
+    def _sweep(self) -> None:
+        # Runs only while someone is typing somewhere
+        while True:
+            self.socketio.sleep(1)
+            now = time.monotonic()
+            with self._lock:
+                for channel, typists in list(self._typing.items()):
+                    expired = [user for user, expires_at in typists.items()
+                               if expires_at <= now]
+                    for user in expired:
+                        del typists[user]
+                    if not typists:
+                        del self._typing[channel]
+                    if expired:
+                        self._schedule(channel)
+                if not self._typing:
+                    self._sweeping = False
+                    return